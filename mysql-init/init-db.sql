@@ -41,6 +41,32 @@ CREATE TABLE IF NOT EXISTS nguoidung (
     FOREIGN KEY (fk_taikhoan) REFERENCES taikhoan(mataikhoan) ON DELETE CASCADE
 );
 
+-- Tạo bảng giucho_sodu: số dư được giữ cho đơn hàng thanh toán bằng ví (mỗi đơn một dòng)
+CREATE TABLE IF NOT EXISTS giucho_sodu (
+    magiucho INT AUTO_INCREMENT PRIMARY KEY,
+    madonhang INT NOT NULL UNIQUE,
+    fk_taikhoan INT NOT NULL,
+    sotien DECIMAL(15, 2) NOT NULL,
+    trangthai ENUM('reserved', 'confirmed', 'released', 'failed') NOT NULL,
+    lydo VARCHAR(255) NOT NULL DEFAULT '',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX giucho_sodu_taikhoan_idx (fk_taikhoan)
+);
+
+-- Tạo bảng sodu_giaodich: sổ cái ví chỉ ghi thêm (mỗi lần số dư thay đổi một dòng, không sửa/xóa)
+CREATE TABLE IF NOT EXISTS sodu_giaodich (
+    magiaodich BIGINT AUTO_INCREMENT PRIMARY KEY,
+    fk_nguoidung INT NOT NULL,
+    loai ENUM('debit', 'credit', 'reserve', 'release') NOT NULL,
+    sotien DECIMAL(15, 2) NOT NULL,
+    sodu_sau DECIMAL(15, 2) NOT NULL,
+    madonhang INT NULL,
+    ghichu VARCHAR(255) NOT NULL DEFAULT '',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX sodu_giaodich_nguoidung_idx (fk_nguoidung, magiaodich)
+);
+
 -- Tạo tài khoản admin mẫu
 INSERT INTO taikhoan (tendangnhap, matkhau, loaiquyen, is_active, is_staff, is_superuser)
 VALUES (
@@ -0,0 +1,120 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from accounts.models import GiaoDichSoDu, NguoiDung, TaiKhoan
+from accounts.wallet import InsufficientBalanceError, change_balance
+
+
+class Command(BaseCommand):
+    help = ('Bắn đồng thời nhiều lệnh trừ tiền vào một ví và kiểm tra không bị âm số dư, '
+            'không mất cập nhật và sổ cái khớp số dư')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Tổng số lệnh trừ tiền (mặc định 5000)')
+        parser.add_argument('--threads', type=int, default=50, help='Số luồng gửi song song (mặc định 50)')
+        parser.add_argument('--amount', default='1000', help='Số tiền mỗi lệnh (mặc định 1000)')
+        parser.add_argument('--balance', default=None,
+                            help='Số dư ban đầu (mặc định đủ cho một nửa số lệnh, để có cả lệnh bị từ chối)')
+        parser.add_argument('--naive', action='store_true',
+                            help='Dùng cách cũ (đọc số dư, so sánh trong Python rồi save) để so sánh')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        threads = options['threads']
+        amount = Decimal(options['amount'])
+        if total <= 0 or threads <= 0 or amount <= 0:
+            raise CommandError("--requests, --threads và --amount phải lớn hơn 0")
+        balance = Decimal(options['balance']) if options['balance'] is not None else amount * (total // 2)
+
+        # Tài khoản tạm cho lần chạy; sổ cái chỉ ghi thêm nên các dòng của nó được giữ lại (ghichu=benchmark)
+        name = f"benchmark-{uuid.uuid4().hex[:12]}"
+        with transaction.atomic():
+            taikhoan = TaiKhoan.objects.create(tendangnhap=name, matkhau='!')
+            nguoidung = NguoiDung.objects.create(
+                tennguoidung=name, email=f"{name}@benchmark.local", sodienthoai=name, sodu=balance, fk_taikhoan=taikhoan
+            )
+        ledger_start = GiaoDichSoDu.objects.order_by('-magiaodich').values_list('magiaodich', flat=True).first() or 0
+
+        lock = threading.Lock()
+        counters = {'next': 0, 'ok': 0, 'rejected': 0, 'errors': 0}
+        latencies = []
+        debit = self._naive_debit if options['naive'] else self._debit
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if counters['next'] >= total:
+                            return
+                        counters['next'] += 1
+                    started = time.perf_counter()
+                    try:
+                        outcome = 'ok' if debit(nguoidung.manguoidung, amount) else 'rejected'
+                    except Exception as e:
+                        self.stderr.write(f"Lỗi: {str(e)}")
+                        outcome = 'errors'
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        counters[outcome] += 1
+                        latencies.append(elapsed * 1000)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        final = NguoiDung.objects.get(pk=nguoidung.pk).sodu
+        ledger = GiaoDichSoDu.objects.filter(fk_nguoidung=nguoidung.pk, magiaodich__gt=ledger_start)
+        ledger_count = ledger.count()
+        expected_ok = min(total, int(balance // amount))
+        latencies.sort()
+
+        self.stdout.write(
+            f"{total} lệnh, {threads} luồng, {elapsed:.2f}s ({total / elapsed:.0f} lệnh/s), "
+            f"p50 {latencies[len(latencies) // 2]:.2f} ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms"
+        )
+        self.stdout.write(
+            f"thành công {counters['ok']}, bị từ chối {counters['rejected']}, lỗi {counters['errors']}; "
+            f"số dư {balance} -> {final}, dòng sổ cái {ledger_count}"
+        )
+
+        problems = []
+        if final < 0:
+            problems.append(f"số dư âm ({final})")
+        if final != balance - amount * counters['ok']:
+            problems.append(f"mất cập nhật: kỳ vọng {balance - amount * counters['ok']}, thực tế {final}")
+        if not options['naive']:
+            if counters['ok'] != expected_ok:
+                problems.append(f"kỳ vọng {expected_ok} lệnh thành công, thực tế {counters['ok']}")
+            if ledger_count != counters['ok']:
+                problems.append(f"sổ cái có {ledger_count} dòng, kỳ vọng {counters['ok']}")
+
+        NguoiDung.objects.filter(pk=nguoidung.pk).delete()
+        TaiKhoan.objects.filter(pk=taikhoan.pk).delete()
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Không âm số dư, không mất cập nhật, sổ cái khớp"))
+
+    def _debit(self, manguoidung, amount):
+        try:
+            change_balance(-amount, GiaoDichSoDu.DEBIT, ghichu='benchmark', manguoidung=manguoidung)
+        except InsufficientBalanceError:
+            return False
+        return True
+
+    def _naive_debit(self, manguoidung, amount):
+        # Cách cũ của BalanceReductionView, chỉ để so sánh
+        nguoidung = NguoiDung.objects.get(pk=manguoidung)
+        if nguoidung.sodu < amount:
+            return False
+        nguoidung.sodu -= amount
+        nguoidung.save()
+        return True
@@ -76,3 +76,71 @@ class NguoiDung(models.Model):
     class Meta:
         db_table = 'nguoidung'
         managed = False
+
+
+class GiuChoSoDu(models.Model):
+    """
+    Số dư ví được giữ cho một đơn hàng (reserve/confirm qua RabbitMQ).
+    madonhang là duy nhất nên lệnh giữ tiền gửi lại không trừ tiền hai lần.
+    """
+    RESERVED = 'reserved'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    FAILED = 'failed'
+    TRANGTHAI_CHOICES = (
+        (RESERVED, 'Đang giữ'),
+        (CONFIRMED, 'Đã xác nhận'),
+        (RELEASED, 'Đã hoàn lại'),
+        (FAILED, 'Thất bại'),
+    )
+
+    magiucho = models.AutoField(primary_key=True)
+    madonhang = models.IntegerField(unique=True)
+    fk_taikhoan = models.IntegerField()
+    sotien = models.DecimalField(max_digits=15, decimal_places=2)
+    trangthai = models.CharField(max_length=20, choices=TRANGTHAI_CHOICES)
+    lydo = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'giucho_sodu'
+        managed = False
+
+
+class GiaoDichSoDu(models.Model):
+    """
+    Sổ cái ví: mỗi lần số dư thay đổi ghi thêm một dòng (sotien âm là trừ, dương là cộng).
+    Chỉ ghi thêm; không sửa hoặc xóa dòng đã ghi.
+    """
+    DEBIT = 'debit'
+    CREDIT = 'credit'
+    RESERVE = 'reserve'
+    RELEASE = 'release'
+    LOAI_CHOICES = (
+        (DEBIT, 'Trừ tiền'),
+        (CREDIT, 'Nạp tiền'),
+        (RESERVE, 'Giữ tiền cho đơn hàng'),
+        (RELEASE, 'Hoàn tiền giữ cho đơn hàng'),
+    )
+
+    magiaodich = models.BigAutoField(primary_key=True)
+    fk_nguoidung = models.IntegerField()
+    loai = models.CharField(max_length=20, choices=LOAI_CHOICES)
+    sotien = models.DecimalField(max_digits=15, decimal_places=2)
+    sodu_sau = models.DecimalField(max_digits=15, decimal_places=2)
+    madonhang = models.IntegerField(null=True, blank=True)
+    ghichu = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'sodu_giaodich'
+        managed = False
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Sổ cái ví chỉ ghi thêm, không sửa dòng đã ghi")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Sổ cái ví chỉ ghi thêm, không xóa dòng đã ghi")
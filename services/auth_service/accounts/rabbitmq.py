@@ -0,0 +1,77 @@
+import json
+import logging
+import pika
+from .consumers import EVENT_EXCHANGE, QueueSpec
+from .models import GiuChoSoDu
+from .wallet import WalletError, confirm_reservation, release_reservation, reserve_balance
+
+logger = logging.getLogger(__name__)
+
+WALLET_QUEUE = 'auth_service_wallet_queue'
+
+
+def publish_reply(ch, routing_key, data):
+    """
+    Gửi sự kiện trả lời trên chính channel đang consume, trước khi ack lệnh.
+    Nếu mất kết nối giữa hai bước, lệnh được giao lại và xử lý idempotent nên trả lời lại đúng kết quả cũ.
+    """
+    ch.basic_publish(
+        exchange=EVENT_EXCHANGE,
+        routing_key=routing_key,
+        body=json.dumps(data),
+        properties=pika.BasicProperties(delivery_mode=2, content_type='application/json')
+    )
+
+
+def handle_wallet_command(ch, method, properties, body):
+    """
+    Xử lý lệnh ví từ order_service:
+    wallet.reserve (giữ tiền, trả lời wallet.reserved / wallet.reservation_failed),
+    wallet.confirm (xác nhận), wallet.release (hoàn lại khoản đang giữ).
+    Lỗi DB được raise để ConsumerWorker nack và đưa lệnh lại vào queue.
+    """
+    try:
+        data = json.loads(body)
+        order_id = int(data['order_id'])
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error(f"Lệnh ví không hợp lệ: {body!r} ({str(e)})")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+
+    routing_key = method.routing_key
+    if routing_key == 'wallet.reserve':
+        try:
+            giu_cho = reserve_balance(order_id, int(data['user_id']), data.get('amount'))
+        except (WalletError, ValueError, TypeError, KeyError) as e:
+            logger.error(f"Lệnh giữ tiền cho đơn hàng #{order_id} không hợp lệ: {str(e)}")
+            publish_reply(ch, 'wallet.reservation_failed', {
+                'order_id': order_id,
+                'user_id': data.get('user_id'),
+                'reason': str(e),
+            })
+        else:
+            reserved = giu_cho.trangthai != GiuChoSoDu.FAILED
+            publish_reply(ch, 'wallet.reserved' if reserved else 'wallet.reservation_failed', {
+                'order_id': order_id,
+                'user_id': giu_cho.fk_taikhoan,
+                'amount': float(giu_cho.sotien),
+                'reason': giu_cho.lydo,
+            })
+            logger.info(f"Giữ tiền cho đơn hàng #{order_id}: {giu_cho.trangthai}")
+    elif routing_key == 'wallet.confirm':
+        confirm_reservation(order_id)
+    elif routing_key == 'wallet.release':
+        if release_reservation(order_id):
+            logger.info(f"Đã hoàn lại số dư giữ cho đơn hàng #{order_id}")
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+# Các queue được chạy bởi `manage.py run_consumers`
+CONSUMER_QUEUES = [
+    QueueSpec(
+        WALLET_QUEUE,
+        routing_keys=['wallet.reserve', 'wallet.confirm', 'wallet.release'],
+        on_message=handle_wallet_command,
+        prefetch_count=10
+    ),
+]
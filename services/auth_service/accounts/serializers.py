@@ -2,13 +2,26 @@ from rest_framework import serializers
 from django.core.validators import EmailValidator
 from .models import TaiKhoan, NguoiDung
 
-class NguoiDungSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Cho phép chỉ định các field cần trả về: Serializer(instance, fields=[...]).
+    fields=None giữ nguyên toàn bộ field.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class NguoiDungSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = NguoiDung
         fields = ['manguoidung', 'tennguoidung', 'diachi', 'email', 'sodienthoai', 'sodu']
 
 
-class TaiKhoanSerializer(serializers.ModelSerializer):
+class TaiKhoanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     nguoidung = NguoiDungSerializer(many=False, required=True, write_only=True)
     nguoidung_data = serializers.SerializerMethodField(read_only=True)
     password = serializers.CharField(write_only=True, required=False)
@@ -27,10 +40,14 @@ class TaiKhoanSerializer(serializers.ModelSerializer):
         # }
 
     def get_nguoidung_data(self, obj):
-        nguoidung = obj.nguoidung.first()
-        if nguoidung:
-            return NguoiDungSerializer(nguoidung).data
-        return None
+        # Đọc qua .all() để dùng cache của prefetch_related (không truy vấn thêm cho mỗi tài khoản)
+        nguoidung_list = obj.nguoidung.all()
+        if not nguoidung_list:
+            return None
+        if not hasattr(self, '_nguoidung_serializer'):
+            # Dùng lại một serializer cho mọi dòng; context['nguoidung_fields'] chọn field lồng bên trong
+            self._nguoidung_serializer = NguoiDungSerializer(fields=self.context.get('nguoidung_fields'))
+        return self._nguoidung_serializer.to_representation(nguoidung_list[0])
 
     def validate_tendangnhap(self, value):
         if not value:
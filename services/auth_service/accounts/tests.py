@@ -1,3 +1,178 @@
-from django.test import TestCase
+import importlib.util
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .models import GiaoDichSoDu, GiuChoSoDu, NguoiDung, TaiKhoan
+from .views import UserListView
+from .wallet import (
+    InsufficientBalanceError, UserNotFoundError, change_balance, release_reservation, reserve_balance
+)
 
-# Create your tests here.
+
+class UnmanagedTablesTestCase(TestCase):
+    """
+    Các bảng của auth_service là managed = False (schema do mysql-init tạo),
+    nên test tự tạo bảng trước khi mở transaction của lớp test và xóa sau khi xong
+    """
+    unmanaged_models = (TaiKhoan, NguoiDung, GiuChoSoDu, GiaoDichSoDu)
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged_models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.unmanaged_models):
+                editor.delete_model(model)
+
+    @staticmethod
+    def create_user(tendangnhap, sodu=0, profiles=1):
+        taikhoan = TaiKhoan.objects.create(tendangnhap=tendangnhap, matkhau='x')
+        for index in range(profiles):
+            NguoiDung.objects.create(
+                tennguoidung=tendangnhap, email=f'{tendangnhap}{index}@example.com',
+                sodienthoai=f'{tendangnhap}{index}', sodu=sodu, fk_taikhoan=taikhoan
+            )
+        return taikhoan
+
+
+class WalletTest(UnmanagedTablesTestCase):
+    """
+    Thay đổi số dư bằng UPDATE có điều kiện, sổ cái và giữ/hoàn tiền idempotent theo đơn hàng
+    """
+    def setUp(self):
+        self.taikhoan = self.create_user('a', sodu=100)
+        self.nguoidung = self.taikhoan.nguoidung.get()
+
+    def _sodu(self):
+        self.nguoidung.refresh_from_db()
+        return self.nguoidung.sodu
+
+    def test_change_balance_writes_ledger(self):
+        sodu = change_balance(Decimal('-30'), GiaoDichSoDu.DEBIT, fk_taikhoan_id=self.taikhoan.pk)
+        self.assertEqual(sodu, Decimal('70'))
+        sodu = change_balance(Decimal('5'), GiaoDichSoDu.CREDIT, manguoidung=self.nguoidung.pk)
+        self.assertEqual(sodu, Decimal('75'))
+        self.assertEqual(
+            list(GiaoDichSoDu.objects.order_by('magiaodich').values_list('fk_nguoidung', 'loai', 'sotien', 'sodu_sau')),
+            [(self.nguoidung.pk, GiaoDichSoDu.DEBIT, Decimal('-30'), Decimal('70')),
+             (self.nguoidung.pk, GiaoDichSoDu.CREDIT, Decimal('5'), Decimal('75'))]
+        )
+
+    def test_insufficient_balance_and_unknown_user(self):
+        with self.assertRaises(InsufficientBalanceError):
+            change_balance(Decimal('-101'), GiaoDichSoDu.DEBIT, fk_taikhoan_id=self.taikhoan.pk)
+        with self.assertRaises(UserNotFoundError):
+            change_balance(Decimal('-1'), GiaoDichSoDu.DEBIT, fk_taikhoan_id=self.taikhoan.pk + 1)
+        self.assertEqual(self._sodu(), Decimal('100'))
+        self.assertFalse(GiaoDichSoDu.objects.exists())
+
+    def test_only_first_profile_of_account_changes(self):
+        taikhoan = self.create_user('b', sodu=50, profiles=2)
+        first, second = taikhoan.nguoidung.order_by('manguoidung')
+        change_balance(Decimal('-20'), GiaoDichSoDu.DEBIT, fk_taikhoan_id=taikhoan.pk)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.sodu, second.sodu), (Decimal('30'), Decimal('50')))
+        self.assertEqual(GiaoDichSoDu.objects.get().fk_nguoidung, first.pk)
+
+    def test_reserve_is_idempotent_per_order(self):
+        for _ in range(2):
+            giu_cho = reserve_balance(1, self.taikhoan.pk, '60')
+            self.assertEqual(giu_cho.trangthai, GiuChoSoDu.RESERVED)
+        self.assertEqual(self._sodu(), Decimal('40'))
+        self.assertEqual(GiaoDichSoDu.objects.filter(madonhang=1).count(), 1)
+
+        giu_cho = reserve_balance(2, self.taikhoan.pk, '60')
+        self.assertEqual(giu_cho.trangthai, GiuChoSoDu.FAILED)
+        self.assertTrue(giu_cho.lydo)
+        self.assertEqual(reserve_balance(2, self.taikhoan.pk, '10').trangthai, GiuChoSoDu.FAILED)
+        self.assertEqual(self._sodu(), Decimal('40'))
+
+    def test_release_twice_refunds_once(self):
+        reserve_balance(1, self.taikhoan.pk, '60')
+        self.assertTrue(release_reservation(1))
+        self.assertFalse(release_reservation(1))
+        self.assertEqual(self._sodu(), Decimal('100'))
+        self.assertEqual(GiuChoSoDu.objects.get(madonhang=1).trangthai, GiuChoSoDu.RELEASED)
+        self.assertEqual(
+            list(GiaoDichSoDu.objects.order_by('magiaodich').values_list('loai', flat=True)),
+            [GiaoDichSoDu.RESERVE, GiaoDichSoDu.RELEASE]
+        )
+
+
+class UserListViewTest(UnmanagedTablesTestCase):
+    """
+    Danh sách người dùng: chỉ lấy các field được yêu cầu, số truy vấn cố định và phân trang cursor
+    """
+    def setUp(self):
+        self.users = [self.create_user(f'u{index}', sodu=index) for index in range(5)]
+
+    def _get(self, params=None):
+        request = APIRequestFactory().get('/api/auth/users/', params or {}, HTTP_HOST='localhost')
+        force_authenticate(request, user=self.users[0])
+        with CaptureQueriesContext(connection) as ctx:
+            response = UserListView.as_view()(request)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count(self):
+        response, queries = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 2)
+        self.assertEqual(response.data['users'][0]['nguoidung_data']['email'], 'u00@example.com')
+
+        response, queries = self._get({'fields': 'tendangnhap,nguoidung_data.email'})
+        self.assertEqual(queries, 2)
+        self.assertEqual(response.data['users'][1]['nguoidung_data'], {'email': 'u10@example.com'})
+
+        response, queries = self._get({'fields': 'mataikhoan,tendangnhap'})
+        self.assertEqual(queries, 1)
+        self.assertEqual(set(response.data['users'][0]), {'mataikhoan', 'tendangnhap'})
+
+    def test_unknown_field(self):
+        for fields in ('matkhau', 'nguoidung_data.khong_co'):
+            response, _ = self._get({'fields': fields})
+            self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pages_and_legacy_full_list(self):
+        ids = []
+        params = {'page_size': 2, 'fields': 'mataikhoan'}
+        while True:
+            response, _ = self._get(params)
+            ids.extend(user['mataikhoan'] for user in response.data['users'])
+            if not response.data['next']:
+                break
+            params = {key: values[0] for key, values in parse_qs(urlsplit(response.data['next']).query).items()}
+        self.assertEqual(ids, [user.pk for user in self.users])
+
+        response, _ = self._get({'all': 'true'})
+        self.assertEqual(len(response.data['users']), 5)
+        self.assertNotIn('next', response.data)
+
+
+class SharedModuleCopyTest(SimpleTestCase):
+    """
+    Các module dùng chung trong service này khớp bản gốc ở services/common/ (services/common/sync_copies.py)
+    """
+    def test_matches_common(self):
+        script = Path(__file__).resolve().parents[2] / 'common' / 'sync_copies.py'
+        if not script.exists():
+            self.skipTest('Không có services/common (chạy trong container của service)')
+        spec = importlib.util.spec_from_file_location('sync_copies', script)
+        sync_copies = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sync_copies)
+        service = Path(__file__).resolve().parents[1]
+        stale = [
+            str(copy.relative_to(sync_copies.SERVICES_DIR))
+            for _, copy in sync_copies.stale_copies() if service in copy.parents
+        ]
+        self.assertEqual(stale, [], 'Bản sao lệch với bản gốc, chạy python services/common/sync_copies.py')
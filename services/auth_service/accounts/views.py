@@ -5,8 +5,11 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from .models import TaiKhoan, NguoiDung
-from .serializers import TaiKhoanSerializer
+from django.db.models import Prefetch
+from .models import TaiKhoan, NguoiDung, GiaoDichSoDu
+from .serializers import NguoiDungSerializer, TaiKhoanSerializer
+from .pagination import KeysetPagination
+from .wallet import InsufficientBalanceError, UserNotFoundError, change_balance
 import random
 import string
 from django.core.mail import send_mail
@@ -16,6 +19,40 @@ from decimal import Decimal, InvalidOperation
 import logging
 
 logger = logging.getLogger(__name__)
+# Các field đọc được của danh sách người dùng (?fields=)
+USER_LIST_MODEL_FIELDS = {'mataikhoan', 'tendangnhap', 'loaiquyen'}
+USER_LIST_FIELDS = USER_LIST_MODEL_FIELDS | {'nguoidung_data'}
+
+
+def parse_user_fields(value):
+    """
+    Phân tích ?fields=tendangnhap,loaiquyen,nguoidung_data.email
+    Trả về (fields, nguoidung_fields); None nghĩa là lấy tất cả. Raise ValueError nếu có field lạ.
+    """
+    if not value:
+        return None, None
+    fields = set()
+    nguoidung_fields = set()
+    all_nguoidung = False
+    for name in (part.strip() for part in value.split(',')):
+        if not name:
+            continue
+        if name.startswith('nguoidung_data.'):
+            nested = name[len('nguoidung_data.'):]
+            if nested not in NguoiDungSerializer.Meta.fields:
+                raise ValueError(f"Field không hợp lệ: {name}")
+            fields.add('nguoidung_data')
+            nguoidung_fields.add(nested)
+        elif name in USER_LIST_FIELDS:
+            fields.add(name)
+            all_nguoidung = all_nguoidung or name == 'nguoidung_data'
+        else:
+            raise ValueError(f"Field không hợp lệ: {name}")
+    if not fields:
+        return None, None
+    return fields, (None if all_nguoidung or not nguoidung_fields else nguoidung_fields)
+
+
 class UserListView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -25,9 +62,32 @@ class UserListView(APIView):
         #         {"status": "error", "message": "Chỉ admin mới được xem danh sách người dùng"},
         #         status=status.HTTP_403_FORBIDDEN
         #     )
-        users = TaiKhoan.objects.all()
-        serializer = TaiKhoanSerializer(users, many=True)
-        return Response({"status": "ok", "users": serializer.data})
+        try:
+            fields, nguoidung_fields = parse_user_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = TaiKhoan.objects.order_by('mataikhoan')
+        if fields is not None:
+            # Chỉ SELECT các cột được yêu cầu (mataikhoan luôn cần cho phân trang và prefetch)
+            users = users.only('mataikhoan', *(set(fields) & USER_LIST_MODEL_FIELDS))
+        if fields is None or 'nguoidung_data' in fields:
+            # Một truy vấn lấy nguoidung của cả trang thay vì một truy vấn cho mỗi tài khoản
+            nguoidung_queryset = NguoiDung.objects.order_by('manguoidung')
+            if nguoidung_fields is not None:
+                nguoidung_queryset = nguoidung_queryset.only('manguoidung', 'fk_taikhoan', *nguoidung_fields)
+            users = users.prefetch_related(Prefetch('nguoidung', queryset=nguoidung_queryset))
+
+        context = {'request': request, 'nguoidung_fields': nguoidung_fields}
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        if page is None:
+            # Chế độ cũ (?all=true): trả về toàn bộ người dùng
+            serializer = TaiKhoanSerializer(users, many=True, fields=fields, context=context)
+            return Response({"status": "ok", "users": serializer.data})
+
+        serializer = TaiKhoanSerializer(page, many=True, fields=fields, context=context)
+        return Response({"status": "ok", "users": serializer.data, "next": paginator.get_next_link()})
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
@@ -355,38 +415,24 @@ class BalanceReductionView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get the current user's account
-        taikhoan = request.user
-        
-        # Get the associated NguoiDung (user details)
+        # Trừ tiền bằng một câu UPDATE có điều kiện (sodu >= tongtien) và ghi sổ cái
         try:
-            nguoidung = taikhoan.nguoidung.first()
-            if not nguoidung:
-                return Response(
-                    {"status": "error", "message": "Không tìm thấy thông tin người dùng"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        except Exception as e:
+            sodu_moi = change_balance(-tongtien, GiaoDichSoDu.DEBIT, fk_taikhoan_id=request.user.pk)
+        except UserNotFoundError as e:
             return Response(
-                {"status": "error", "message": f"Lỗi truy xuất thông tin người dùng: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"status": "error", "message": str(e)},
+                status=status.HTTP_404_NOT_FOUND
             )
-        
-        # Check if the user has sufficient balance
-        if not nguoidung.sodu or nguoidung.sodu < tongtien:
+        except InsufficientBalanceError as e:
             return Response(
-                {"status": "error", "message": "Số dư không đủ để thực hiện giao dịch"},
+                {"status": "error", "message": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Reduce the balance
-        nguoidung.sodu -= tongtien
-        nguoidung.save()
-        
         return Response({
             "status": "ok", 
             "message": "Trừ tiền thành công", 
-            "sodu_moi": str(nguoidung.sodu)  # Convert to string for JSON serialization
+            "sodu_moi": str(sodu_moi)  # Convert to string for JSON serialization
         }, status=status.HTTP_200_OK)
     
 
@@ -424,26 +470,22 @@ class BalanceAdditionView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Tìm người dùng theo manguoidung
+        # Cộng tiền bằng một câu UPDATE sodu = sodu + sotien và ghi sổ cái
         try:
-            nguoidung = NguoiDung.objects.get(pk=manguoidung)
-        except NguoiDung.DoesNotExist:
+            sodu_moi = change_balance(sotien, GiaoDichSoDu.CREDIT, manguoidung=manguoidung)
+        except UserNotFoundError:
             return Response(
                 {"status": "error", "message": "Không tìm thấy người dùng"},
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
+        except (ValueError, TypeError):
             return Response(
-                {"status": "error", "message": f"Lỗi truy xuất người dùng: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"status": "error", "message": "Mã người dùng không hợp lệ"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Cộng tiền
-        nguoidung.sodu = (nguoidung.sodu or Decimal('0')) + sotien
-        nguoidung.save()
-
         return Response({
             "status": "ok",
             "message": "Nạp tiền thành công",
-            "sodu_moi": str(nguoidung.sodu)
+            "sodu_moi": str(sodu_moi)
         }, status=status.HTTP_200_OK)
\ No newline at end of file
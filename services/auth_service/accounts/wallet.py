@@ -0,0 +1,137 @@
+import logging
+from decimal import Decimal, InvalidOperation
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import GiaoDichSoDu, GiuChoSoDu, NguoiDung
+
+logger = logging.getLogger(__name__)
+
+
+class WalletError(Exception):
+    """
+    Lệnh ví không hợp lệ (thiếu mã đơn hàng, số tiền sai...)
+    """
+
+
+class UserNotFoundError(WalletError):
+    """
+    Không tìm thấy thông tin người dùng (nguoidung) để thay đổi số dư
+    """
+
+
+class InsufficientBalanceError(WalletError):
+    """
+    Số dư không đủ để trừ
+    """
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise WalletError(f"Số tiền không hợp lệ: {value}")
+    if amount <= 0:
+        raise WalletError(f"Số tiền phải là số dương: {value}")
+    return amount
+
+
+def change_balance(amount, loai, madonhang=None, ghichu='', **lookup):
+    """
+    Cộng (amount > 0) hoặc trừ (amount < 0) số dư của người dùng tìm theo lookup
+    (manguoidung=... hoặc fk_taikhoan_id=...) và ghi một dòng sổ cái, trong cùng một transaction.
+
+    Một tài khoản có thể có nhiều dòng nguoidung (fk_taikhoan không unique): chỉ dòng có
+    manguoidung nhỏ nhất bị thay đổi, giống taikhoan.nguoidung.first() trước đây.
+    Số dư chỉ thay đổi bằng một câu UPDATE có điều kiện trên khóa chính
+    (UPDATE nguoidung SET sodu = sodu - x WHERE manguoidung = ... AND sodu >= x), không đọc-sửa-ghi trong Python,
+    nên các request đồng thời không làm mất cập nhật và không bao giờ để số dư âm.
+    Trả về số dư mới; raise UserNotFoundError / InsufficientBalanceError.
+    """
+    manguoidung = NguoiDung.objects.filter(**lookup).order_by('manguoidung').values_list(
+        'manguoidung', flat=True
+    ).first()
+    if manguoidung is None:
+        raise UserNotFoundError('Không tìm thấy thông tin người dùng')
+    row = NguoiDung.objects.filter(manguoidung=manguoidung)
+    with transaction.atomic():
+        if amount < 0:
+            updated = row.filter(sodu__gte=-amount).update(sodu=F('sodu') + amount)
+        else:
+            updated = row.update(sodu=F('sodu') + amount)
+        if updated != 1:
+            # Chỉ truy vấn thêm khi thất bại, để phân biệt hai lỗi
+            if not row.exists():
+                raise UserNotFoundError('Không tìm thấy thông tin người dùng')
+            raise InsufficientBalanceError('Số dư không đủ để thực hiện giao dịch')
+        # Dòng vừa UPDATE đang bị khóa đến hết transaction nên số dư đọc lại đúng là số dư sau thay đổi
+        sodu_sau = row.values_list('sodu', flat=True).get()
+        GiaoDichSoDu.objects.create(
+            fk_nguoidung=manguoidung,
+            loai=loai,
+            sotien=amount,
+            sodu_sau=sodu_sau,
+            madonhang=madonhang,
+            ghichu=ghichu
+        )
+    return sodu_sau
+
+
+def reserve_balance(order_id, user_id, amount):
+    """
+    Giữ (trừ) số dư của tài khoản user_id cho đơn hàng order_id.
+
+    Idempotent theo order_id: lệnh gửi lại trả về đúng kết quả đã ghi, không trừ tiền lần nữa.
+    Trả về GiuChoSoDu với trangthai RESERVED hoặc FAILED.
+    """
+    amount = parse_amount(amount)
+    with transaction.atomic():
+        try:
+            # Ghi dòng giữ chỗ trước: unique(madonhang) chặn hai lệnh trùng chạy song song
+            with transaction.atomic():
+                giu_cho = GiuChoSoDu.objects.create(
+                    madonhang=order_id,
+                    fk_taikhoan=user_id,
+                    sotien=amount,
+                    trangthai=GiuChoSoDu.FAILED
+                )
+        except IntegrityError:
+            giu_cho = GiuChoSoDu.objects.get(madonhang=order_id)
+            logger.info(f"Lệnh giữ tiền cho đơn hàng #{order_id} đã được xử lý: {giu_cho.trangthai}")
+            return giu_cho
+
+        try:
+            change_balance(-amount, GiaoDichSoDu.RESERVE, madonhang=order_id, fk_taikhoan_id=user_id)
+            giu_cho.trangthai = GiuChoSoDu.RESERVED
+        except WalletError as e:
+            giu_cho.lydo = str(e)
+        giu_cho.save(update_fields=['trangthai', 'lydo', 'updated_at'])
+    return giu_cho
+
+
+def confirm_reservation(order_id):
+    """
+    Xác nhận khoản đã giữ khi đơn hàng đã chuyển sang Đã thanh toán
+    """
+    return GiuChoSoDu.objects.filter(madonhang=order_id, trangthai=GiuChoSoDu.RESERVED).update(
+        trangthai=GiuChoSoDu.CONFIRMED
+    )
+
+
+def release_reservation(order_id):
+    """
+    Hoàn lại khoản đang giữ (đơn hàng không còn chờ thanh toán). Gọi lại nhiều lần không hoàn tiền hai lần.
+    """
+    with transaction.atomic():
+        giu_cho = GiuChoSoDu.objects.select_for_update().filter(
+            madonhang=order_id, trangthai=GiuChoSoDu.RESERVED
+        ).first()
+        if giu_cho is None:
+            return False
+        try:
+            change_balance(giu_cho.sotien, GiaoDichSoDu.RELEASE, madonhang=order_id, fk_taikhoan_id=giu_cho.fk_taikhoan)
+        except UserNotFoundError:
+            logger.error(f"Không hoàn được tiền giữ cho đơn hàng #{order_id}: tài khoản {giu_cho.fk_taikhoan} không còn")
+            return False
+        giu_cho.trangthai = GiuChoSoDu.RELEASED
+        giu_cho.save(update_fields=['trangthai', 'updated_at'])
+    return True
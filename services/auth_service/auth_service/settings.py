@@ -116,6 +116,9 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Bộ khóa sắp xếp của phân trang keyset (TaiKhoan); trường cuối là khóa duy nhất
+KEYSET_PAGINATION_ORDERING = ('mataikhoan',)
+
 
 # Simple JWT Configuration
 SIMPLE_JWT = {
@@ -139,6 +142,26 @@ CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
 
 
+# RabbitMQ Settings
+RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'rabbitmq')
+RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', 5672))
+RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'guest')
+RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'guest')
+
+# Consumer lệnh ví (wallet.reserve/confirm/release) chạy bằng `manage.py run_consumers`
+CONSUMER_PROCESSES = int(os.getenv('CONSUMER_PROCESSES', 1))
+CONSUMER_CHANNELS = int(os.getenv('CONSUMER_CHANNELS', 1))
+# Số channel mỗi process theo queue, ví dụ "auth_service_wallet_queue=4"
+CONSUMER_QUEUE_CONCURRENCY = {
+    name.strip(): int(count)
+    for name, count in (
+        part.split('=', 1) for part in os.getenv('CONSUMER_QUEUE_CONCURRENCY', '').split(',') if '=' in part
+    )
+}
+CONSUMER_HEALTH_DIR = os.getenv('CONSUMER_HEALTH_DIR', '/tmp/consumer_health')
+CONSUMER_HEALTH_INTERVAL = float(os.getenv('CONSUMER_HEALTH_INTERVAL', 5))
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.getenv('CONSUMER_SHUTDOWN_TIMEOUT', 30))
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
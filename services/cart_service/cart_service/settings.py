@@ -77,6 +77,47 @@ SESSION_CACHE_ALIAS = "default"
 # Thiết lập thời gian sống cho giỏ hàng (1 tuần)
 CART_EXPIRY = 60 * 60 * 24 * 7  # 7 ngày tính bằng giây
 
+# Bản chụp sản phẩm (tên, giá, ảnh, tồn kho) dùng để hiển thị giỏ hàng, lưu trong Redis.
+# Bị xóa/cập nhật khi nhận product.updated / product.deleted; TTL giới hạn độ cũ của tồn kho.
+PRODUCT_SNAPSHOT_TTL = int(os.environ.get('PRODUCT_SNAPSHOT_TTL', 300))
+
+# Service URLs
+PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://product_service:8000')
+# Các service nội bộ được gọi thẳng (không vòng qua api_gateway) bằng carts.http_client
+INTERNAL_SERVICE_URLS = {
+    'product_service': PRODUCT_SERVICE_URL,
+}
+INTERNAL_HTTP_TIMEOUT = (
+    float(os.environ.get('INTERNAL_HTTP_CONNECT_TIMEOUT', 1)),
+    float(os.environ.get('INTERNAL_HTTP_READ_TIMEOUT', 5)),
+)  # (connect, read) giây
+INTERNAL_HTTP_POOL_SIZE = int(os.environ.get('INTERNAL_HTTP_POOL_SIZE', 10))  # kết nối keep-alive mỗi upstream
+INTERNAL_HTTP_RETRIES = int(os.environ.get('INTERNAL_HTTP_RETRIES', 2))  # chỉ áp dụng cho request idempotent
+INTERNAL_HTTP_BACKOFF = float(os.environ.get('INTERNAL_HTTP_BACKOFF', 0.1))
+INTERNAL_HTTP_BACKOFF_MAX = float(os.environ.get('INTERNAL_HTTP_BACKOFF_MAX', 1))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_BREAKER_RESET_TIMEOUT', 30))
+
+# RabbitMQ Settings
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
+RABBITMQ_PORT = int(os.environ.get('RABBITMQ_PORT', 5672))
+RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
+RABBITMQ_PASS = os.environ.get('RABBITMQ_PASS', 'guest')
+
+# RabbitMQ consumer chạy bằng `manage.py run_consumers` (process riêng)
+CONSUMER_PROCESSES = int(os.environ.get('CONSUMER_PROCESSES', 1))
+CONSUMER_CHANNELS = int(os.environ.get('CONSUMER_CHANNELS', 1))
+# Số channel theo queue, vd. "cart_service_product_queue=2"
+CONSUMER_QUEUE_CONCURRENCY = {
+    name.strip(): int(value)
+    for name, value in (
+        part.split('=', 1) for part in os.environ.get('CONSUMER_QUEUE_CONCURRENCY', '').split(',') if '=' in part
+    )
+}
+CONSUMER_HEALTH_DIR = os.environ.get('CONSUMER_HEALTH_DIR', '/tmp/consumer_health')
+CONSUMER_HEALTH_INTERVAL = float(os.environ.get('CONSUMER_HEALTH_INTERVAL', 5))
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.environ.get('CONSUMER_SHUTDOWN_TIMEOUT', 30))
+
 # Database
 DATABASES = {
     'default': {
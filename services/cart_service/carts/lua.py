@@ -0,0 +1,125 @@
+# Các script Lua thao tác giỏ hàng lưu dạng Redis hash.
+#
+# Mỗi dòng sản phẩm (line) của giỏ hàng dùng 4 field:
+#   q:<line>  số lượng (HINCRBY)      p:<line>  đơn giá
+#   d:<line>  thông tin sản phẩm JSON o:<line>  thứ tự thêm vào giỏ
+# và các field chung: total (tổng tiền), n (số dòng), seq (bộ đếm thứ tự).
+#
+# Mỗi script chạy nguyên tử trên Redis, đặt lại thời hạn của giỏ hàng và trả về HGETALL
+# để thao tác và đọc lại giỏ hàng chỉ tốn một round trip.
+
+# KEYS[1] = giỏ hàng; ARGV = line, số lượng thêm, JSON sản phẩm, đơn giá, thời hạn (giây)
+ADD_ITEM = """
+local key, line = KEYS[1], ARGV[1]
+local delta = tonumber(ARGV[2])
+local qty = redis.call('HINCRBY', key, 'q:' .. line, delta)
+local price
+if qty == delta then
+    price = ARGV[4]
+    redis.call('HSET', key, 'p:' .. line, price, 'd:' .. line, ARGV[3],
+        'o:' .. line, redis.call('HINCRBY', key, 'seq', 1))
+    redis.call('HINCRBY', key, 'n', 1)
+else
+    price = redis.call('HGET', key, 'p:' .. line)
+end
+redis.call('HINCRBYFLOAT', key, 'total', tonumber(price) * delta)
+redis.call('EXPIRE', key, ARGV[5])
+return redis.call('HGETALL', key)
+"""
+
+# KEYS[1] = giỏ hàng; ARGV = line, số lượng mới, thời hạn (giây)
+UPDATE_QUANTITY = """
+local key, line = KEYS[1], ARGV[1]
+local old = redis.call('HGET', key, 'q:' .. line)
+if old then
+    local delta = tonumber(ARGV[2]) - tonumber(old)
+    if delta ~= 0 then
+        redis.call('HINCRBY', key, 'q:' .. line, delta)
+        redis.call('HINCRBYFLOAT', key, 'total', tonumber(redis.call('HGET', key, 'p:' .. line)) * delta)
+    end
+    redis.call('EXPIRE', key, ARGV[3])
+end
+return redis.call('HGETALL', key)
+"""
+
+# KEYS[1] = giỏ hàng; ARGV = line, thời hạn (giây)
+REMOVE_ITEM = """
+local key, line = KEYS[1], ARGV[1]
+local qty = redis.call('HGET', key, 'q:' .. line)
+if qty then
+    local price = redis.call('HGET', key, 'p:' .. line)
+    redis.call('HDEL', key, 'q:' .. line, 'p:' .. line, 'd:' .. line, 'o:' .. line)
+    if redis.call('HINCRBY', key, 'n', -1) <= 0 then
+        redis.call('DEL', key)
+        return {}
+    end
+    redis.call('HINCRBYFLOAT', key, 'total', -tonumber(price) * tonumber(qty))
+    redis.call('EXPIRE', key, ARGV[2])
+end
+return redis.call('HGETALL', key)
+"""
+
+# KEYS[1] = giỏ hàng; ARGV = tiền tố line của sản phẩm ("<product_id>|"), thời hạn (giây)
+# Xóa mọi dòng (mọi màu/kích cỡ) của một sản phẩm; trả về {số dòng đã xóa, HGETALL}.
+REMOVE_PRODUCT = """
+local key, prefix = KEYS[1], 'q:' .. ARGV[1]
+local fields = redis.call('HGETALL', key)
+local removed, amount = 0, 0
+for i = 1, #fields, 2 do
+    if string.sub(fields[i], 1, #prefix) == prefix then
+        local line = string.sub(fields[i], 3)
+        amount = amount + tonumber(redis.call('HGET', key, 'p:' .. line)) * tonumber(fields[i + 1])
+        redis.call('HDEL', key, 'q:' .. line, 'p:' .. line, 'd:' .. line, 'o:' .. line)
+        removed = removed + 1
+    end
+end
+if removed > 0 then
+    if redis.call('HINCRBY', key, 'n', -removed) <= 0 then
+        redis.call('DEL', key)
+        return {removed, {}}
+    end
+    redis.call('HINCRBYFLOAT', key, 'total', -amount)
+    redis.call('EXPIRE', key, ARGV[2])
+end
+return {removed, redis.call('HGETALL', key)}
+"""
+
+# KEYS[1] = giỏ hàng người dùng, KEYS[2] = giỏ hàng session; ARGV = thời hạn (giây)
+# Cộng các dòng của giỏ session vào giỏ người dùng theo thứ tự thêm rồi xóa giỏ session.
+# Gọi lại khi giỏ session đã trống/đã xóa chỉ đọc giỏ người dùng (idempotent).
+MERGE_CARTS = """
+local user, guest = KEYS[1], KEYS[2]
+if redis.call('EXISTS', guest) == 0 then
+    return redis.call('HGETALL', user)
+end
+local fields = redis.call('HGETALL', guest)
+local data, lines = {}, {}
+for i = 1, #fields, 2 do
+    data[fields[i]] = fields[i + 1]
+    if string.sub(fields[i], 1, 2) == 'q:' then
+        lines[#lines + 1] = string.sub(fields[i], 3)
+    end
+end
+table.sort(lines, function(a, b)
+    return tonumber(data['o:' .. a] or 0) < tonumber(data['o:' .. b] or 0)
+end)
+for _, line in ipairs(lines) do
+    local delta = tonumber(data['q:' .. line])
+    local qty = redis.call('HINCRBY', user, 'q:' .. line, delta)
+    local price
+    if qty == delta then
+        price = data['p:' .. line]
+        redis.call('HSET', user, 'p:' .. line, price, 'd:' .. line, data['d:' .. line],
+            'o:' .. line, redis.call('HINCRBY', user, 'seq', 1))
+        redis.call('HINCRBY', user, 'n', 1)
+    else
+        price = redis.call('HGET', user, 'p:' .. line)
+    end
+    redis.call('HINCRBYFLOAT', user, 'total', tonumber(price) * delta)
+end
+redis.call('DEL', guest)
+if #lines > 0 then
+    redis.call('EXPIRE', user, ARGV[1])
+end
+return redis.call('HGETALL', user)
+"""
@@ -0,0 +1,29 @@
+import json
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from carts.utils import _get_redis, write_cart
+
+
+class Command(BaseCommand):
+    help = 'Chuyển các giỏ hàng cũ (chuỗi JSON trong cache) sang dạng Redis hash'
+
+    def handle(self, *args, **options):
+        client = _get_redis()
+        migrated = skipped = 0
+        for cart_id in cache.iter_keys("cart:*"):
+            cart_data = cache.get(cart_id)
+            if cart_data is None:
+                continue
+            try:
+                cart = json.loads(cart_data)
+                items = [item for item in cart.get("items", []) if int(item.get("quantity", 0)) > 0]
+            except (TypeError, ValueError, AttributeError) as e:
+                self.stderr.write(f"Bỏ qua giỏ hàng {cart_id} không hợp lệ: {str(e)}")
+                skipped += 1
+                continue
+            # Giỏ hàng đã có dạng hash (đã được thao tác sau khi triển khai) được giữ nguyên
+            if items and not client.exists(cart_id):
+                write_cart(cart_id, {"items": items})
+                migrated += 1
+            cache.delete(cart_id)
+        self.stdout.write(self.style.SUCCESS(f"Đã chuyển {migrated} giỏ hàng, bỏ qua {skipped}"))
@@ -0,0 +1,159 @@
+import logging
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from .http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+# Số mã sản phẩm tối đa trong một request tới product_service
+FETCH_BATCH_SIZE = 100
+
+
+def _product_key(product_id):
+    return str(product_id).strip()
+
+
+def snapshot_from_product(data):
+    """
+    Bản chụp các thông tin giỏ hàng cần từ dữ liệu SanPhamSerializer của product_service
+    """
+    return {
+        "product_id": data.get("id"),
+        "name": data.get("TenSanPham") or "",
+        "price": float(data.get("GiaBan") or 0),
+        "image_url": data.get("HinhAnh_URL") or "",
+        "category": data.get("TenDanhMuc") or "",
+        "stock": int(data.get("SoLuongTon") or 0),
+    }
+
+
+class ProductSnapshotCache:
+    """
+    Cache bản chụp sản phẩm trong Redis, điền bằng một request lấy nhiều sản phẩm tới product_service.
+
+    Đọc n sản phẩm là một MGET; chỉ các mã chưa có trong cache mới được lấy từ product_service
+    (theo lô, một request cho tối đa FETCH_BATCH_SIZE mã). Sản phẩm không tồn tại được ghi nhớ
+    bằng một bản chụp rỗng để không hỏi lại liên tục. Sự kiện product.* cập nhật hoặc xóa bản chụp.
+    """
+    key_prefix = "product:snapshot:"
+    missing = {"missing": True}
+
+    def __init__(self, timeout=None):
+        self._timeout = timeout
+
+    @property
+    def timeout(self):
+        return self._timeout or getattr(settings, "PRODUCT_SNAPSHOT_TTL", 300)
+
+    def _key(self, product_id):
+        return self.key_prefix + _product_key(product_id)
+
+    def get_many(self, product_ids):
+        """
+        Trả về {mã sản phẩm (chuỗi): bản chụp, hoặc None nếu sản phẩm không tồn tại}.
+        Mã không có trong kết quả là không tra được (product_service lỗi).
+        """
+        keys = {self._key(product_id): _product_key(product_id) for product_id in product_ids}
+        if not keys:
+            return {}
+        cached = cache.get_many(list(keys))
+
+        snapshots = {}
+        misses = []
+        for key, product_id in keys.items():
+            if key in cached:
+                snapshots[product_id] = None if cached[key].get("missing") else cached[key]
+            else:
+                misses.append(product_id)
+
+        if misses:
+            fetched = self._fetch(misses)
+            if fetched:
+                cache.set_many({
+                    self._key(product_id): snapshot or self.missing for product_id, snapshot in fetched.items()
+                }, timeout=self.timeout)
+                snapshots.update(fetched)
+        return snapshots
+
+    def get(self, product_id):
+        """
+        Bản chụp của một sản phẩm; None nếu không tồn tại. Raise LookupError nếu không tra được.
+        """
+        snapshots = self.get_many([product_id])
+        if _product_key(product_id) not in snapshots:
+            raise LookupError(f"Không lấy được thông tin sản phẩm {product_id}")
+        return snapshots[_product_key(product_id)]
+
+    def _fetch(self, product_ids):
+        """
+        Lấy các sản phẩm từ product_service theo lô; mã không có trong kết quả được đánh dấu None
+        """
+        # product_service chỉ nhận mã dạng số; mã khác chắc chắn không tồn tại
+        fetched = {product_id: None for product_id in product_ids if not product_id.isdigit()}
+        product_ids = [product_id for product_id in product_ids if product_id.isdigit()]
+        client = get_client("product_service")
+        for start in range(0, len(product_ids), FETCH_BATCH_SIZE):
+            batch = product_ids[start:start + FETCH_BATCH_SIZE]
+            try:
+                response = client.get("/api/products/batch/", params={"ids": ",".join(batch)})
+                response.raise_for_status()
+                products = response.json()["products"]
+            except (requests.RequestException, ValueError, KeyError) as e:
+                logger.warning(f"Không lấy được {len(batch)} sản phẩm từ product_service: {str(e)}")
+                continue
+            for product_id in batch:
+                product = products.get(product_id)
+                fetched[product_id] = snapshot_from_product(product) if product else None
+        return fetched
+
+    def apply_event(self, routing_key, data):
+        """
+        Cập nhật cache theo sự kiện product.created/updated (ghi bản chụp mới),
+        product.deleted (đánh dấu không tồn tại) và product.stock_changed (xóa để lấy lại).
+        Sự kiện product.created/updated/deleted có dạng {"event_type": ..., "product": {...}}.
+        """
+        product = data.get("product", data)
+        if routing_key in ("product.created", "product.updated") and product.get("id") is not None:
+            cache.set(self._key(product["id"]), snapshot_from_product(product), timeout=self.timeout)
+        elif routing_key == "product.deleted" and product.get("id") is not None:
+            cache.set(self._key(product["id"]), self.missing, timeout=self.timeout)
+        elif routing_key == "product.stock_changed" and data.get("product_id") is not None:
+            cache.delete(self._key(data["product_id"]))
+
+
+product_snapshots = ProductSnapshotCache()
+
+
+def hydrate_cart(cart):
+    """
+    Điền tên, giá, ảnh, danh mục và tồn kho hiện tại của product_service vào các dòng giỏ hàng
+    (một lần tra cache cho cả giỏ) và tính lại tổng tiền theo giá hiện tại.
+
+    Mỗi dòng có thêm stock và available (False khi sản phẩm đã bị xóa hoặc không đủ hàng);
+    dòng của sản phẩm đã bị xóa không được tính vào tổng tiền. Nếu không tra được sản phẩm,
+    dòng giữ nguyên thông tin đã lưu trong giỏ.
+    """
+    if not cart["items"]:
+        return cart
+    snapshots = product_snapshots.get_many([item["product_id"] for item in cart["items"]])
+    total = 0
+    for item in cart["items"]:
+        product_id = _product_key(item["product_id"])
+        if product_id in snapshots:
+            snapshot = snapshots[product_id]
+            if snapshot is None:
+                item["stock"] = 0
+                item["available"] = False
+                continue
+            item.update(
+                name=snapshot["name"],
+                price=snapshot["price"],
+                image_url=snapshot["image_url"],
+                category=snapshot["category"],
+                stock=snapshot["stock"],
+                available=snapshot["stock"] >= item["quantity"],
+            )
+        total += item["price"] * item["quantity"]
+    cart["total"] = total
+    return cart
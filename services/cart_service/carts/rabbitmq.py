@@ -0,0 +1,34 @@
+import json
+import logging
+from .consumers import QueueSpec
+from .products import product_snapshots
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_QUEUE = 'cart_service_product_queue'
+
+
+def product_event_callback(ch, method, properties, body):
+    """
+    Cập nhật cache bản chụp sản phẩm theo sự kiện của product_service.
+    Lỗi Redis được raise để ConsumerWorker nack và đưa message lại vào queue.
+    """
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in message: {body}, error: {str(e)}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+    product_snapshots.apply_event(method.routing_key, data)
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+# Các queue được chạy bởi `manage.py run_consumers`
+CONSUMER_QUEUES = [
+    QueueSpec(
+        PRODUCT_QUEUE,
+        routing_keys=['product.created', 'product.updated', 'product.deleted', 'product.stock_changed'],
+        on_message=product_event_callback,
+        prefetch_count=50
+    ),
+]
@@ -1,3 +1,373 @@
-from django.test import TestCase
+import importlib.util
+import json
+import threading
+from pathlib import Path
+from unittest import mock
+import requests
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from django_redis import get_redis_connection
+from . import utils
+from .products import hydrate_cart, product_snapshots
+from .rabbitmq import product_event_callback
+from .http_client import CircuitBreaker, CircuitOpenError, ServiceClient
 
-# Create your tests here.
+
+class ServiceClientTest(TestCase):
+    """
+    Retry có jitter chỉ cho request idempotent, circuit breaker theo upstream
+    """
+    def setUp(self):
+        self.client = ServiceClient('product_service', 'http://product_service:8000/', retries=2, backoff=0,
+                                    breaker=CircuitBreaker(failure_threshold=3, reset_timeout=30))
+        self.session_request = mock.patch.object(self.client.session, 'request').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_retries_idempotent_only(self):
+        ok = mock.Mock(status_code=200)
+        self.session_request.side_effect = [requests.ConnectionError(), mock.Mock(status_code=503), ok]
+        self.assertIs(self.client.get('/api/products/batch/'), ok)
+        self.assertEqual(self.session_request.call_count, 3)
+        self.assertEqual(self.session_request.call_args[0], ('GET', 'http://product_service:8000/api/products/batch/'))
+        self.assertEqual(self.session_request.call_args[1]['timeout'], settings.INTERNAL_HTTP_TIMEOUT)
+
+        self.session_request.reset_mock()
+        self.session_request.side_effect = requests.Timeout()
+        with self.assertRaises(requests.Timeout):
+            self.client.post('/api/products/san-pham/', json={})
+        self.assertEqual(self.session_request.call_count, 1)
+
+    def test_circuit_breaker(self):
+        self.session_request.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError):
+            self.client.get('/api/products/batch/')
+        # Mạch mở sau 3 lỗi liên tiếp: request sau bị từ chối ngay
+        self.session_request.reset_mock()
+        with self.assertRaises(CircuitOpenError):
+            self.client.get('/api/products/batch/')
+        self.session_request.assert_not_called()
+
+        # Hết reset_timeout: cho một request thử, thành công thì đóng mạch
+        self.client.breaker.opened_at -= 30
+        self.session_request.side_effect = None
+        self.session_request.return_value = mock.Mock(status_code=404)
+        self.assertEqual(self.client.get('/api/products/batch/').status_code, 404)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+
+def product(product_id, price, **extra):
+    return dict({"product_id": product_id, "name": f"SP {product_id}", "price": price}, **extra)
+
+
+class CartScriptTest(TestCase):
+    """
+    Các script Lua của giỏ hàng: số lượng, tổng tiền, số dòng và thứ tự trong hash
+    """
+    def setUp(self):
+        self.redis = get_redis_connection("default")
+        self.redis.flushdb()
+        self.cart_id = utils.get_cart_id(user_id=1)
+
+    def fields(self):
+        return {name.decode(): value.decode() for name, value in self.redis.hgetall(self.cart_id).items()}
+
+    def test_add_item_bookkeeping(self):
+        utils.add_to_cart(user_id=1, product_data=product(5, 100), quantity=2)
+        utils.add_to_cart(user_id=1, product_data=product(7, 30.5))
+        cart = utils.add_to_cart(user_id=1, product_data=product(5, 999), quantity=3)
+
+        # Thêm lại dòng đã có chỉ cộng số lượng, giữ đơn giá và thứ tự cũ
+        line = utils.get_line_key(5)
+        fields = self.fields()
+        self.assertEqual(fields["q:" + line], "5")
+        self.assertEqual(float(fields["p:" + line]), 100)
+        self.assertEqual(fields["o:" + line], "1")
+        self.assertEqual(fields["o:" + utils.get_line_key(7)], "2")
+        self.assertEqual((fields["n"], fields["seq"]), ("2", "2"))
+        self.assertAlmostEqual(float(fields["total"]), 530.5)
+        self.assertGreater(self.redis.ttl(self.cart_id), 0)
+
+        self.assertEqual([(item["product_id"], item["quantity"]) for item in cart["items"]], [(5, 5), (7, 1)])
+        self.assertAlmostEqual(cart["total"], 530.5)
+
+    def test_update_quantity(self):
+        utils.add_to_cart(user_id=1, product_data=product(5, 100), quantity=2)
+        cart = utils.update_cart_quantity(user_id=1, product_id=5, quantity=4)
+        self.assertEqual(cart["items"][0]["quantity"], 4)
+        self.assertAlmostEqual(cart["total"], 400)
+
+        # Dòng không có trong giỏ: không tạo dòng mới, không đổi tổng tiền
+        cart = utils.update_cart_quantity(user_id=1, product_id=9, quantity=3)
+        self.assertEqual(len(cart["items"]), 1)
+        self.assertAlmostEqual(cart["total"], 400)
+        self.assertNotIn("q:" + utils.get_line_key(9), self.fields())
+
+    def test_update_quantity_missing_cart(self):
+        cart = utils.update_cart_quantity(user_id=1, product_id=5, quantity=3)
+        self.assertEqual(cart, {"items": [], "total": 0.0})
+        self.assertFalse(self.redis.exists(self.cart_id))
+
+    def test_remove_item(self):
+        utils.add_to_cart(user_id=1, product_data=product(5, 100), quantity=2)
+        utils.add_to_cart(user_id=1, product_data=product(7, 30))
+
+        cart = utils.remove_from_cart(user_id=1, product_id=5, selected_color="default")
+        self.assertEqual([item["product_id"] for item in cart["items"]], [7])
+        self.assertAlmostEqual(cart["total"], 30)
+        self.assertEqual(self.fields()["n"], "1")
+
+        # Xóa dòng cuối cùng thì xóa luôn hash (không để lại total/n/seq)
+        cart = utils.remove_from_cart(user_id=1, line_key=utils.get_line_key(7))
+        self.assertEqual(cart, {"items": [], "total": 0.0})
+        self.assertFalse(self.redis.exists(self.cart_id))
+
+    def test_parse_cart_orders_by_sequence(self):
+        fields = {"total": "60.0", "n": "3", "seq": "3"}
+        for product_id, order in ((1, 3), (2, 1), (3, 2)):
+            line = utils.get_line_key(product_id)
+            fields.update({
+                "q:" + line: "1", "p:" + line: "20.0", "o:" + line: str(order),
+                "d:" + line: json.dumps({"product_id": product_id}),
+            })
+        # Dạng danh sách phẳng (kết quả HGETALL của script) và dạng bytes
+        flat = [part.encode() for pair in fields.items() for part in pair]
+        for raw in (fields, flat):
+            cart = utils._parse_cart(raw)
+            self.assertEqual([item["product_id"] for item in cart["items"]], [2, 3, 1])
+            self.assertEqual(cart["items"][0]["line_key"], utils.get_line_key(2))
+            self.assertEqual(cart["total"], 60.0)
+
+    def test_variants_are_separate_lines(self):
+        utils.add_to_cart(user_id=1, product_data=product(5, 100, selected_color="Red"))
+        utils.add_to_cart(user_id=1, product_data=product(5, 100, selected_color="Blue", size="XL"), quantity=2)
+        utils.add_to_cart(user_id=1, product_data=product(50, 10))
+        cart = utils.add_to_cart(user_id=1, product_data=product(5, 100, selected_color=" red "))
+        self.assertEqual(
+            [(item["selected_color"], item["size"], item["quantity"]) for item in cart["items"]],
+            [("Red", "Standard", 2), ("Blue", "XL", 2), ("default", "Standard", 1)],
+        )
+
+        # Xóa một biến thể chỉ xóa dòng đó
+        cart = utils.remove_from_cart(user_id=1, product_id=5, selected_color="blue", size="xl")
+        self.assertEqual(
+            [item["line_key"] for item in cart["items"]], [utils.get_line_key(5, "red"), utils.get_line_key(50)]
+        )
+
+        # Chỉ có product_id: xóa mọi biến thể của sản phẩm, không đụng tới sản phẩm 50
+        utils.add_to_cart(user_id=1, product_data=product(5, 100, size="M"))
+        cart = utils.remove_from_cart(user_id=1, product_id=5)
+        self.assertEqual([item["product_id"] for item in cart["items"]], [50])
+        self.assertAlmostEqual(cart["total"], 10)
+        self.assertEqual(self.fields()["n"], "1")
+
+        self.assertIsNone(utils.remove_from_cart(user_id=1, product_id=5))
+        cart = utils.remove_from_cart(user_id=1, product_id=50)
+        self.assertEqual(cart, {"items": [], "total": 0.0})
+        self.assertFalse(self.redis.exists(self.cart_id))
+
+    @mock.patch("carts.views.hydrate_cart", side_effect=lambda cart: cart)
+    def test_remove_view_not_in_cart(self, hydrate_cart):
+        utils.add_to_cart(session_id="s1", product_data=product(5, 100, selected_color="Red"))
+        url = "/api/cart/remove/{}/"
+        body = json.dumps({"session_id": "s1"})
+        response = self.client.delete(url.format(9), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.delete(url.format(5), data=body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"items": [], "total": 0.0})
+
+
+class MergeCartsTest(TestCase):
+    """
+    MERGE_CARTS: cộng giỏ session vào giỏ người dùng, idempotent, an toàn khi có thao tác đồng thời
+    """
+    def setUp(self):
+        self.redis = get_redis_connection("default")
+        self.redis.flushdb()
+
+    def summary(self, cart):
+        return [(item["product_id"], item["quantity"]) for item in cart["items"]]
+
+    def test_merge_overlapping_lines(self):
+        utils.add_to_cart(user_id=1, product_data=product(5, 100))
+        utils.add_to_cart(user_id=1, product_data=product(6, 20))
+        utils.add_to_cart(session_id="s1", product_data=product(7, 5), quantity=4)
+        utils.add_to_cart(session_id="s1", product_data=product(5, 100), quantity=2)
+
+        cart = utils.merge_carts(1, "s1")
+        # Dòng trùng cộng số lượng, dòng mới thêm vào cuối theo thứ tự trong giỏ session
+        self.assertEqual(self.summary(cart), [(5, 3), (6, 1), (7, 4)])
+        self.assertAlmostEqual(cart["total"], 340)
+        fields = self.redis.hgetall(utils.get_cart_id(user_id=1))
+        self.assertEqual((fields[b"n"], fields[b"seq"]), (b"3", b"3"))
+        self.assertFalse(self.redis.exists(utils.get_cart_id(session_id="s1")))
+
+    def test_merge_twice(self):
+        utils.add_to_cart(user_id=1, product_data=product(5, 100))
+        utils.add_to_cart(session_id="s1", product_data=product(5, 100), quantity=2)
+        first = utils.merge_carts(1, "s1")
+        second = utils.merge_carts(1, "s1")
+        self.assertEqual(first, second)
+        self.assertEqual(self.summary(second), [(5, 3)])
+        self.assertAlmostEqual(second["total"], 300)
+
+    def test_merge_missing_session_cart(self):
+        self.assertEqual(utils.merge_carts(1, "s1"), {"items": [], "total": 0.0})
+        self.assertFalse(self.redis.exists(utils.get_cart_id(user_id=1)))
+
+        utils.add_to_cart(user_id=1, product_data=product(5, 100))
+        self.redis.persist(utils.get_cart_id(user_id=1))
+        cart = utils.merge_carts(1, "s1")
+        self.assertEqual(self.summary(cart), [(5, 1)])
+        # Không có gì để gộp thì không đặt lại thời hạn giỏ hàng người dùng
+        self.assertEqual(self.redis.ttl(utils.get_cart_id(user_id=1)), -1)
+
+    def test_concurrent_add_during_merge(self):
+        utils.add_to_cart(session_id="s1", product_data=product(5, 10), quantity=3)
+        adds = 50
+
+        def add_items():
+            for _ in range(adds):
+                utils.add_to_cart(session_id="s1", product_data=product(5, 10))
+
+        def merge():
+            for _ in range(adds):
+                utils.merge_carts(1, "s1")
+
+        threads = [threading.Thread(target=add_items), threading.Thread(target=merge)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Mỗi lần thêm nằm ở giỏ người dùng (đã gộp) hoặc còn lại trong giỏ session, không bị mất
+        user = utils.get_cart(user_id=1)
+        guest = utils.get_cart(session_id="s1")
+        quantities = [item["quantity"] for cart in (user, guest) for item in cart["items"]]
+        self.assertEqual(sum(quantities), adds + 3)
+        self.assertAlmostEqual(user["total"] + guest["total"], (adds + 3) * 10)
+        for cart in (user, guest):
+            self.assertAlmostEqual(cart["total"], sum(item["price"] * item["quantity"] for item in cart["items"]))
+
+
+class HydrateCartTest(TestCase):
+    """
+    hydrate_cart: thông tin và tồn kho hiện tại từ product_service, tổng tiền theo giá hiện tại
+    """
+    def setUp(self):
+        get_redis_connection("default").flushdb()
+        self.client_get = mock.patch("carts.products.get_client").start().return_value.get
+        self.addCleanup(mock.patch.stopall)
+        utils.add_to_cart(user_id=1, product_data=product(5, 100, image_url="5.png"), quantity=2)
+        utils.add_to_cart(user_id=1, product_data=product(7, 30))
+
+    def respond(self, products):
+        self.client_get.return_value = mock.Mock(
+            status_code=200, json=mock.Mock(return_value={"products": products})
+        )
+
+    def test_deleted_product_excluded_from_total(self):
+        # Sản phẩm 7 không còn trong product_service
+        self.respond({"5": {"id": 5, "TenSanPham": "SP 5 mới", "GiaBan": "120.00", "SoLuongTon": 1}})
+        cart = hydrate_cart(utils.get_cart(user_id=1))
+        first, second = cart["items"]
+        self.assertEqual((first["name"], first["price"], first["stock"]), ("SP 5 mới", 120.0, 1))
+        self.assertFalse(first["available"])
+        self.assertEqual((second["stock"], second["available"]), (0, False))
+        self.assertAlmostEqual(cart["total"], 240)
+        self.client_get.assert_called_once()
+        self.assertEqual(self.client_get.call_args[1]["params"], {"ids": "5,7"})
+
+    def test_product_service_down_keeps_stored_data(self):
+        self.client_get.side_effect = requests.ConnectionError()
+        cart = hydrate_cart(utils.get_cart(user_id=1))
+        self.assertEqual(
+            [(item["name"], item["price"], item["image_url"]) for item in cart["items"]],
+            [("SP 5", 100.0, "5.png"), ("SP 7", 30.0, "")],
+        )
+        self.assertNotIn("available", cart["items"][0])
+        self.assertAlmostEqual(cart["total"], 230)
+
+        # Không tra được thì không ghi nhớ gì: lần sau hỏi lại product_service
+        self.client_get.side_effect = None
+        self.respond({"5": {"id": 5, "GiaBan": "100", "SoLuongTon": 9}, "7": {"id": 7, "GiaBan": "30", "SoLuongTon": 9}})
+        cart = hydrate_cart(utils.get_cart(user_id=1))
+        self.assertTrue(all(item["available"] for item in cart["items"]))
+
+    def test_stock_changed_refreshes_snapshot(self):
+        self.respond({"5": {"id": 5, "GiaBan": "100", "SoLuongTon": 0}, "7": {"id": 7, "GiaBan": "30", "SoLuongTon": 5}})
+        self.assertFalse(hydrate_cart(utils.get_cart(user_id=1))["items"][0]["available"])
+
+        self.respond({"5": {"id": 5, "GiaBan": "100", "SoLuongTon": 4}})
+        product_snapshots.apply_event("product.stock_changed", {"product_id": 5, "old_stock": 0, "new_stock": 4})
+        cart = hydrate_cart(utils.get_cart(user_id=1))
+        self.assertEqual([item["available"] for item in cart["items"]], [True, True])
+        self.assertEqual(self.client_get.call_args[1]["params"], {"ids": "5"})
+
+    def test_product_events_update_snapshot(self):
+        self.respond({"5": {"id": 5, "TenSanPham": "SP 5", "GiaBan": "100", "SoLuongTon": 3},
+                      "7": {"id": 7, "TenSanPham": "SP 7", "GiaBan": "30", "SoLuongTon": 3}})
+        hydrate_cart(utils.get_cart(user_id=1))
+        self.client_get.reset_mock()
+
+        # Đúng dạng message publish_product_event của product_service ghi vào outbox
+        def deliver(event_type, product_data):
+            body = json.dumps({"event_type": event_type, "product": product_data})
+            channel = mock.Mock()
+            product_event_callback(channel, mock.Mock(routing_key=f"product.{event_type}", delivery_tag=1), None, body)
+            channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+        deliver("updated", {
+            "id": 5, "TenSanPham": "SP 5 mới", "GiaBan": "150.00", "HinhAnh_URL": "http://x/5.png",
+            "TenDanhMuc": "Điện thoại", "SoLuongTon": 3, "ChiTietThongSo": [],
+        })
+        deliver("deleted", {"id": 7, "TenSanPham": "SP 7", "GiaBan": "30.00", "SoLuongTon": 3})
+
+        cart = hydrate_cart(utils.get_cart(user_id=1))
+        first, second = cart["items"]
+        self.assertEqual((first["name"], first["price"], first["category"]), ("SP 5 mới", 150.0, "Điện thoại"))
+        self.assertFalse(second["available"])
+        self.assertAlmostEqual(cart["total"], 300)
+        self.client_get.assert_not_called()
+
+    @mock.patch("carts.views.hydrate_cart", side_effect=lambda cart: cart)
+    def test_add_uses_product_service_price_only(self, hydrate):
+        url = "/api/cart/add/"
+        body = {"session_id": "s1", "product_id": 5, "price": 1, "name": "Giá client", "quantity": 2}
+
+        # product_service lỗi: từ chối, không lưu giá client gửi lên
+        self.client_get.side_effect = requests.ConnectionError()
+        response = self.client.post(url, data=json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(utils.get_cart(session_id="s1")["items"], [])
+
+        self.client_get.side_effect = None
+        self.respond({"5": {"id": 5, "TenSanPham": "SP 5", "GiaBan": "100", "SoLuongTon": 3}})
+        response = self.client.post(url, data=json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item["name"], item["price"]) for item in response.json()["items"]], [("SP 5", 100.0)])
+
+        self.respond({})
+        body["product_id"] = 9
+        response = self.client.post(url, data=json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+
+class SharedModuleCopyTest(SimpleTestCase):
+    """
+    Các module dùng chung trong service này khớp bản gốc ở services/common/ (services/common/sync_copies.py)
+    """
+    def test_matches_common(self):
+        script = Path(__file__).resolve().parents[2] / 'common' / 'sync_copies.py'
+        if not script.exists():
+            self.skipTest('Không có services/common (chạy trong container của service)')
+        spec = importlib.util.spec_from_file_location('sync_copies', script)
+        sync_copies = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sync_copies)
+        service = Path(__file__).resolve().parents[1]
+        stale = [
+            str(copy.relative_to(sync_copies.SERVICES_DIR))
+            for _, copy in sync_copies.stale_copies() if service in copy.parents
+        ]
+        self.assertEqual(stale, [], 'Bản sao lệch với bản gốc, chạy python services/common/sync_copies.py')
@@ -1,8 +1,10 @@
 import json
 import jwt
+from urllib.parse import quote
 from django.conf import settings
-from django.core.cache import cache
+from django_redis import get_redis_connection
 from rest_framework.exceptions import AuthenticationFailed
+from . import lua
 
 def get_cart_id(user_id=None, session_id=None):
     """
@@ -14,108 +16,174 @@ def get_cart_id(user_id=None, session_id=None):
         return f"cart:session:{session_id}"
     raise ValueError("Either user_id or session_id must be provided")
 
-def get_cart(user_id=None, session_id=None):
+DEFAULT_COLOR = "default"
+DEFAULT_SIZE = "Standard"
+
+def get_line_key(product_id, selected_color=None, size=None):
     """
-    Lấy giỏ hàng từ Redis dựa trên user_id hoặc session_id
+    Khóa chuẩn của một dòng trong giỏ hàng: product_id|màu|kích cỡ.
+
+    Cùng sản phẩm nhưng khác màu/kích cỡ là các dòng khác nhau. product_id được so sánh
+    dạng chuỗi (5 và "5" là một), màu và kích cỡ không phân biệt hoa thường/khoảng trắng thừa.
     """
-    cart_id = get_cart_id(user_id, session_id)
-    cart_data = cache.get(cart_id)
-    if cart_data:
-        return json.loads(cart_data)
-    return {"items": [], "total": 0}
+    parts = (
+        str(product_id).strip(),
+        str(selected_color or DEFAULT_COLOR).strip().casefold(),
+        str(size or DEFAULT_SIZE).strip().casefold(),
+    )
+    return "|".join(quote(part, safe="") for part in parts)
 
-def save_cart(user_id=None, session_id=None, cart_data=None):
+def get_product_line_prefix(product_id):
     """
-    Lưu giỏ hàng vào Redis với thời gian hết hạn
+    Tiền tố chung của mọi dòng (mọi màu/kích cỡ) của một sản phẩm
     """
-    cart_id = get_cart_id(user_id, session_id)
-    cache.set(cart_id, json.dumps(cart_data), timeout=settings.CART_EXPIRY)
+    return quote(str(product_id).strip(), safe="") + "|"
 
-def merge_carts(user_id, session_id):
+def get_item_line_key(item):
+    return get_line_key(item.get("product_id"), item.get("selected_color"), item.get("size"))
+
+_scripts = {}
+
+def _get_redis():
+    return get_redis_connection("default")
+
+def _run_script(name, keys, *args):
     """
-    Hợp nhất giỏ hàng tạm thời (session) với giỏ hàng của người dùng
+    Chạy script Lua trong carts/lua.py bằng EVALSHA (tự nạp lại script nếu Redis chưa có)
     """
-    session_cart = get_cart(session_id=session_id)
-    user_cart = get_cart(user_id=user_id)
+    client = _get_redis()
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = client.register_script(getattr(lua, name))
+    return script(keys=keys, args=list(args), client=client)
 
-    # Hợp nhất các mục
-    for session_item in session_cart["items"]:
-        existing_item = next(
-            (item for item in user_cart["items"] if item["product_id"] == session_item["product_id"]), None
-        )
-        if existing_item:
-            existing_item["quantity"] += session_item["quantity"]
-        else:
-            user_cart["items"].append(session_item)
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
 
-    # Cập nhật tổng tiền
-    user_cart["total"] = sum(item["price"] * item["quantity"] for item in user_cart["items"])
+def _parse_cart(fields):
+    """
+    Dựng giỏ hàng {"items": [...], "total": ...} từ các field của hash (dict hoặc danh sách phẳng từ HGETALL)
+    """
+    if isinstance(fields, (list, tuple)):
+        fields = dict(zip(fields[::2], fields[1::2]))
+    fields = {_decode(name): _decode(value) for name, value in fields.items()}
+
+    items = []
+    for name, quantity in fields.items():
+        if not name.startswith("q:"):
+            continue
+        line = name[2:]
+        item = json.loads(fields["d:" + line])
+        item["quantity"] = int(quantity)
+        item["line_key"] = line
+        items.append((int(fields.get("o:" + line, 0)), item))
+    items.sort(key=lambda entry: entry[0])
+    return {"items": [item for _, item in items], "total": float(fields.get("total", 0))}
 
-    # Lưu giỏ hàng người dùng
-    save_cart(user_id=user_id, cart_data=user_cart)
+def _item_fields(line, item, order):
+    price = float(item.get("price", 0))
+    return {
+        "q:" + line: int(item["quantity"]),
+        "p:" + line: repr(price),
+        "d:" + line: json.dumps({
+            "product_id": item.get("product_id"),
+            "name": item.get("name", ""),
+            "price": price,
+            "image_url": item.get("image_url", ""),
+            "category": item.get("category", ""),
+            "selected_color": item.get("selected_color") or DEFAULT_COLOR,
+            "size": item.get("size") or DEFAULT_SIZE,
+        }),
+        "o:" + line: order,
+    }
 
-    # Xóa giỏ hàng tạm thời
-    cache.delete(get_cart_id(session_id=session_id))
+def get_cart(user_id=None, session_id=None):
+    """
+    Lấy giỏ hàng từ Redis dựa trên user_id hoặc session_id
+    """
+    cart_id = get_cart_id(user_id, session_id)
+    return _parse_cart(_get_redis().hgetall(cart_id))
 
-    return user_cart
+def save_cart(user_id=None, session_id=None, cart_data=None):
+    """
+    Lưu giỏ hàng vào Redis với thời gian hết hạn
+    """
+    write_cart(get_cart_id(user_id, session_id), cart_data)
 
-def add_to_cart(user_id=None, session_id=None, product_data=None, quantity=1):
+def write_cart(cart_id, cart_data):
     """
-    Thêm sản phẩm vào giỏ hàng
+    Ghi đè toàn bộ hash giỏ hàng cart_id trong một MULTI/EXEC
     """
-    cart = get_cart(user_id, session_id)
-    product_id = product_data.get("product_id")
-    existing_item = next((item for item in cart["items"] if item["product_id"] == product_id), None)
+    fields = {}
+    total = 0
+    for order, item in enumerate(cart_data["items"], start=1):
+        fields.update(_item_fields(get_item_line_key(item), item, order))
+        total += float(item.get("price", 0)) * int(item["quantity"])
+    pipe = _get_redis().pipeline(transaction=True)
+    pipe.delete(cart_id)
+    if fields:
+        fields.update({"total": repr(total), "n": len(cart_data["items"]), "seq": len(cart_data["items"])})
+        pipe.hset(cart_id, mapping=fields)
+        pipe.expire(cart_id, settings.CART_EXPIRY)
+    pipe.execute()
 
-    if existing_item:
-        existing_item["quantity"] += quantity
-    else:
-        cart["items"].append({
-            "product_id": product_id,
-            "name": product_data.get("name", ""),
-            "price": float(product_data.get("price", 0)),
-            "image_url": product_data.get("image_url", ""),
-            "quantity": quantity,
-            "category": product_data.get("category", ""),
-            "selected_color": product_data.get("selected_color", "default"),
-            "size": product_data.get("size", "Standard"),
-        })
+def merge_carts(user_id, session_id):
+    """
+    Hợp nhất giỏ hàng tạm thời (session) vào giỏ hàng của người dùng rồi xóa giỏ session.
 
-    cart["total"] = sum(item["price"] * item["quantity"] for item in cart["items"])
-    save_cart(user_id, session_id, cart)
-    return cart
+    Chạy trong một script Lua (một round trip, nguyên tử): sản phẩm thêm vào giỏ session cùng lúc
+    không bị mất, và gọi lại khi giỏ session đã trống chỉ trả về giỏ hàng người dùng.
+    """
+    return _parse_cart(_run_script(
+        "MERGE_CARTS",
+        [get_cart_id(user_id=user_id), get_cart_id(session_id=session_id)],
+        settings.CART_EXPIRY
+    ))
 
-def update_cart_quantity(user_id=None, session_id=None, product_id=None, quantity=None):
+def add_to_cart(user_id=None, session_id=None, product_data=None, quantity=1):
     """
-    Cập nhật số lượng sản phẩm trong giỏ hàng
+    Thêm sản phẩm vào giỏ hàng (HINCRBY số lượng và cộng tổng tiền trong một script Lua)
     """
-    cart = get_cart(user_id, session_id)
-    for item in cart["items"]:
-        if item["product_id"] == product_id:
-            item["quantity"] = max(1, quantity)
-            break
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1")
+    cart_id = get_cart_id(user_id, session_id)
+    line = get_item_line_key(product_data)
+    fields = _item_fields(line, dict(product_data, quantity=quantity), 0)
+    return _parse_cart(_run_script(
+        "ADD_ITEM", [cart_id], line, quantity, fields["d:" + line], fields["p:" + line], settings.CART_EXPIRY
+    ))
 
-    cart["total"] = sum(item["price"] * item["quantity"] for item in cart["items"])
-    save_cart(user_id, session_id, cart)
-    return cart
+def update_cart_quantity(user_id=None, session_id=None, product_id=None, quantity=None,
+                         selected_color=None, size=None, line_key=None):
+    """
+    Cập nhật số lượng của một dòng trong giỏ hàng (theo line_key, hoặc product_id + màu + kích cỡ)
+    """
+    cart_id = get_cart_id(user_id, session_id)
+    line = line_key or get_line_key(product_id, selected_color, size)
+    return _parse_cart(_run_script("UPDATE_QUANTITY", [cart_id], line, max(1, quantity), settings.CART_EXPIRY))
 
-def remove_from_cart(user_id=None, session_id=None, product_id=None):
+def remove_from_cart(user_id=None, session_id=None, product_id=None, selected_color=None, size=None, line_key=None):
     """
-    Xóa sản phẩm khỏi giỏ hàng
+    Xóa một dòng khỏi giỏ hàng (theo line_key, hoặc product_id + màu + kích cỡ).
+
+    Chỉ có product_id (không có màu, kích cỡ, line_key): xóa mọi dòng của sản phẩm đó;
+    trả về None nếu giỏ hàng không có dòng nào của sản phẩm.
     """
-    cart = get_cart(user_id, session_id)
-    product_id_str = str(product_id)
-    cart["items"] = [item for item in cart["items"] if str(item["product_id"]) != product_id_str]
-    cart["total"] = sum(item["price"] * item["quantity"] for item in cart["items"])
-    save_cart(user_id, session_id, cart)
-    return cart
+    cart_id = get_cart_id(user_id, session_id)
+    if not (line_key or selected_color or size):
+        removed, fields = _run_script(
+            "REMOVE_PRODUCT", [cart_id], get_product_line_prefix(product_id), settings.CART_EXPIRY
+        )
+        return _parse_cart(fields) if removed else None
+    line = line_key or get_line_key(product_id, selected_color, size)
+    return _parse_cart(_run_script("REMOVE_ITEM", [cart_id], line, settings.CART_EXPIRY))
 
 def clear_cart(user_id=None, session_id=None):
     """
     Xóa toàn bộ giỏ hàng
     """
     cart_id = get_cart_id(user_id, session_id)
-    cache.delete(cart_id)
+    _get_redis().delete(cart_id)
     return {"items": [], "total": 0}
 
 def get_user_id_from_token(token):
@@ -5,6 +5,10 @@ from .utils import (
     get_cart, add_to_cart, update_cart_quantity, 
     remove_from_cart, clear_cart, get_user_id_from_token, merge_carts
 )
+from .products import hydrate_cart, product_snapshots
+import logging
+
+logger = logging.getLogger(__name__)
 
 @api_view(["GET"])
 def get_cart_view(request):
@@ -21,7 +25,7 @@ def get_cart_view(request):
             cart = merge_carts(user_id, session_id)
         else:
             cart = get_cart(user_id=user_id, session_id=session_id)
-        return Response(cart)
+        return Response(hydrate_cart(cart))
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -40,19 +44,28 @@ def add_to_cart_view(request):
         if not product_id:
             return Response({"error": "Product ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Tên, giá, ảnh và danh mục chỉ lấy từ product_service, không tin dữ liệu client gửi lên;
+        # không tra được sản phẩm thì từ chối thay vì lưu giá của client
+        try:
+            snapshot = product_snapshots.get(product_id)
+        except LookupError as e:
+            logger.warning(str(e))
+            return Response({"error": "Product service unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if snapshot is None:
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
         product_data = {
             "product_id": product_id,
-            "name": data.get("name", ""),
-            "price": data.get("price", 0),
-            "image_url": data.get("image_url", ""),
-            "category": data.get("category", ""),
+            "name": snapshot["name"],
+            "price": snapshot["price"],
+            "image_url": snapshot["image_url"],
+            "category": snapshot["category"],
             "selected_color": data.get("selected_color", "default"),
             "size": data.get("size", "Standard"),
         }
         quantity = int(data.get("quantity", 1))
 
         cart = add_to_cart(user_id=user_id, session_id=session_id, product_data=product_data, quantity=quantity)
-        return Response(cart)
+        return Response(hydrate_cart(cart))
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -70,11 +83,14 @@ def update_cart_view(request):
         product_id = data.get("product_id")
         quantity = int(data.get("quantity", 1))
 
-        if not product_id:
+        if not product_id and not data.get("line_key"):
             return Response({"error": "Product ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart = update_cart_quantity(user_id=user_id, session_id=session_id, product_id=product_id, quantity=quantity)
-        return Response(cart)
+        cart = update_cart_quantity(
+            user_id=user_id, session_id=session_id, product_id=product_id, quantity=quantity,
+            selected_color=data.get("selected_color"), size=data.get("size"), line_key=data.get("line_key")
+        )
+        return Response(hydrate_cart(cart))
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -88,8 +104,17 @@ def remove_from_cart_view(request, product_id):
 
     try:
         user_id = get_user_id_from_token(auth_header)
-        cart = remove_from_cart(user_id=user_id, session_id=session_id, product_id=product_id)
-        return Response(cart)
+        # Biến thể (màu, kích cỡ) hoặc line_key có thể gửi trong body hoặc query string
+        params = request.query_params
+        cart = remove_from_cart(
+            user_id=user_id, session_id=session_id, product_id=product_id,
+            selected_color=request.data.get("selected_color") or params.get("selected_color"),
+            size=request.data.get("size") or params.get("size"),
+            line_key=request.data.get("line_key") or params.get("line_key")
+        )
+        if cart is None:
+            return Response({"error": "Product not in cart"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(hydrate_cart(cart))
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
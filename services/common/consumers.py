@@ -0,0 +1,302 @@
+# Bản sao của services/common/consumers.py: sửa bản gốc rồi chạy python services/common/sync_copies.py
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+import pika
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+EVENT_EXCHANGE = 'microservice_events'
+
+
+class QueueSpec:
+    """
+    Mô tả một queue cần consume.
+
+    on_message(ch, method, properties, body) xử lý từng message (tự ack/nack);
+    hoặc run(channel, queue, stop_event, stats) nếu consumer tự quản lý vòng lặp (ví dụ gom lô).
+    """
+    def __init__(self, name, routing_keys, on_message=None, run=None, prefetch_count=1):
+        if (on_message is None) == (run is None):
+            raise ValueError("Cần đúng một trong on_message hoặc run")
+        self.name = name
+        self.routing_keys = list(routing_keys)
+        self.on_message = on_message
+        self.run = run
+        self.prefetch_count = prefetch_count
+
+
+class ConsumerStats:
+    """
+    Số liệu của một channel, được ghi vào file health
+    """
+    def __init__(self, queue, number):
+        self._lock = threading.Lock()
+        self.queue = queue
+        self.number = number
+        self.connected = False
+        self.processed = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.last_message_at = None
+
+    def record(self, processed=1, failed=0):
+        with self._lock:
+            self.processed += processed
+            self.failed += failed
+            self.last_message_at = time.time()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'queue': self.queue,
+                'channel': self.number,
+                'connected': self.connected,
+                'processed': self.processed,
+                'failed': self.failed,
+                'reconnects': self.reconnects,
+                'last_message_at': self.last_message_at,
+            }
+
+
+class ConsumerWorker(threading.Thread):
+    """
+    Một channel consume một queue, trên kết nối riêng (BlockingConnection không dùng chung được giữa các thread).
+    Tự kết nối lại khi lỗi; dừng sau message đang xử lý khi stop_event được set.
+    """
+    def __init__(self, spec, number, stop_event):
+        super().__init__(name=f"consumer-{spec.name}-{number}", daemon=True)
+        self.spec = spec
+        self.stop_event = stop_event
+        self.stats = ConsumerStats(spec.name, number)
+        self.reconnect_delay = float(getattr(settings, 'CONSUMER_RECONNECT_DELAY', 5))
+
+    def _connect(self):
+        credentials = pika.PlainCredentials(
+            settings.RABBITMQ_USER,
+            getattr(settings, 'RABBITMQ_PASS', None) or getattr(settings, 'RABBITMQ_PASSWORD', 'guest')
+        )
+        parameters = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=int(settings.RABBITMQ_PORT),
+            credentials=credentials,
+            heartbeat=600,
+            blocked_connection_timeout=300
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.exchange_declare(exchange=EVENT_EXCHANGE, exchange_type='topic', durable=True)
+        channel.queue_declare(queue=self.spec.name, durable=True)
+        for routing_key in self.spec.routing_keys:
+            channel.queue_bind(exchange=EVENT_EXCHANGE, queue=self.spec.name, routing_key=routing_key)
+        channel.basic_qos(prefetch_count=self.spec.prefetch_count)
+        return connection, channel
+
+    def _on_message(self, ch, method, properties, body):
+        close_old_connections()
+        try:
+            self.spec.on_message(ch, method, properties, body)
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý message từ {self.spec.name}: {str(e)}", exc_info=True)
+            self.stats.record(failed=1)
+            if ch.is_open:
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        self.stats.record()
+
+    def _consume(self, connection, channel):
+        if self.spec.run is not None:
+            self.spec.run(channel, self.spec.name, self.stop_event, self.stats)
+            return
+        consumer_tag = channel.basic_consume(queue=self.spec.name, on_message_callback=self._on_message)
+        while not self.stop_event.is_set():
+            connection.process_data_events(time_limit=1)
+        # Ngừng nhận message mới; message đã prefetch chưa ack sẽ được broker trả lại queue
+        channel.basic_cancel(consumer_tag)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            connection = None
+            try:
+                connection, channel = self._connect()
+                self.stats.connected = True
+                logger.info(f"{self.name} đã kết nối, prefetch={self.spec.prefetch_count}")
+                self._consume(connection, channel)
+            except Exception as e:
+                logger.error(f"{self.name} lỗi: {str(e)}", exc_info=True)
+                self.stats.reconnects += 1
+            finally:
+                self.stats.connected = False
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                connections.close_all()
+            self.stop_event.wait(self.reconnect_delay)
+        logger.info(f"{self.name} đã dừng")
+
+
+def queue_concurrency(spec, default_channels):
+    """
+    Số channel cho một queue trong mỗi process: CONSUMER_QUEUE_CONCURRENCY[queue] hoặc mặc định
+    """
+    overrides = getattr(settings, 'CONSUMER_QUEUE_CONCURRENCY', {}) or {}
+    return max(1, int(overrides.get(spec.name, default_channels)))
+
+
+def health_path(health_dir, index):
+    return os.path.join(health_dir, f"consumer-{index}.json")
+
+
+def write_health(path, index, workers):
+    report = {
+        'pid': os.getpid(),
+        'process': index,
+        'updated_at': time.time(),
+        'workers': [worker.stats.as_dict() for worker in workers],
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as health_file:
+        json.dump(report, health_file)
+    os.replace(tmp_path, path)
+
+
+def run_worker_process(index, specs, default_channels, health_dir, health_interval, shutdown_timeout):
+    """
+    Thân của một process consumer: M channel cho mỗi queue, ghi health định kỳ
+    """
+    # Không dùng lại kết nối DB kế thừa từ process cha
+    connections.close_all()
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = []
+    for spec in specs:
+        for number in range(queue_concurrency(spec, default_channels)):
+            worker = ConsumerWorker(spec, number, stop_event)
+            worker.start()
+            workers.append(worker)
+    logger.info(f"Consumer process {index} (pid {os.getpid()}) chạy {len(workers)} channel")
+
+    path = health_path(health_dir, index)
+    while not stop_event.is_set():
+        try:
+            write_health(path, index, workers)
+        except OSError as e:
+            logger.warning(f"Không ghi được health file {path}: {str(e)}")
+        stop_event.wait(health_interval)
+
+    deadline = time.monotonic() + shutdown_timeout
+    for worker in workers:
+        worker.join(max(0, deadline - time.monotonic()))
+    alive = [worker.name for worker in workers if worker.is_alive()]
+    if alive:
+        logger.warning(f"Consumer process {index} dừng khi vẫn còn channel đang xử lý: {alive}")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class ConsumerSupervisor:
+    """
+    Chạy N process consumer, khởi động lại process bị chết và dừng êm khi nhận SIGTERM/SIGINT
+    """
+    def __init__(self, specs, processes, channels, health_dir=None, health_interval=None, shutdown_timeout=None):
+        self.specs = specs
+        self.processes = processes
+        self.channels = channels
+        self.health_dir = health_dir or default_health_dir()
+        self.health_interval = health_interval or float(getattr(settings, 'CONSUMER_HEALTH_INTERVAL', 5))
+        self.shutdown_timeout = shutdown_timeout or float(getattr(settings, 'CONSUMER_SHUTDOWN_TIMEOUT', 30))
+        self._children = {}
+        self._stopping = False
+
+    def _spawn(self, index):
+        process = multiprocessing.Process(
+            target=run_worker_process,
+            args=(index, self.specs, self.channels, self.health_dir, self.health_interval, self.shutdown_timeout),
+            name=f"consumer-process-{index}",
+        )
+        process.start()
+        self._children[index] = process
+        logger.info(f"Đã khởi động consumer process {index} (pid {process.pid})")
+
+    def _stop(self, signum, frame):
+        if not self._stopping:
+            logger.info("Nhận tín hiệu dừng, chờ các consumer xử lý xong message hiện tại")
+        self._stopping = True
+
+    def run(self):
+        os.makedirs(self.health_dir, exist_ok=True)
+        # Bỏ file health của lần chạy trước
+        for name in os.listdir(self.health_dir):
+            if name.startswith('consumer-') and name.endswith('.json'):
+                os.remove(os.path.join(self.health_dir, name))
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        connections.close_all()
+
+        for index in range(self.processes):
+            self._spawn(index)
+
+        while not self._stopping:
+            time.sleep(1)
+            for index, process in list(self._children.items()):
+                if not process.is_alive() and not self._stopping:
+                    logger.error(f"Consumer process {index} đã thoát (exit code {process.exitcode}), khởi động lại")
+                    self._spawn(index)
+
+        for process in self._children.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: process con dừng êm
+        deadline = time.monotonic() + self.shutdown_timeout + 5
+        for process in self._children.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Consumer process pid {process.pid} không dừng kịp, kill")
+                process.kill()
+                process.join()
+
+
+def default_health_dir():
+    return getattr(settings, 'CONSUMER_HEALTH_DIR', None) or os.path.join(tempfile.gettempdir(), 'consumer_health')
+
+
+def check_health(health_dir=None, max_age=None):
+    """
+    Đọc các file health. Trả về (ok, reports): ok khi có ít nhất một process,
+    mọi file còn mới và mọi channel đang kết nối.
+    """
+    health_dir = health_dir or default_health_dir()
+    max_age = max_age or float(getattr(settings, 'CONSUMER_HEALTH_INTERVAL', 5)) * 3
+    reports = []
+    try:
+        names = sorted(name for name in os.listdir(health_dir) if name.endswith('.json'))
+    except FileNotFoundError:
+        names = []
+    now = time.time()
+    ok = bool(names)
+    for name in names:
+        try:
+            with open(os.path.join(health_dir, name), encoding='utf-8') as health_file:
+                report = json.load(health_file)
+        except (OSError, ValueError):
+            ok = False
+            continue
+        report['stale'] = now - report.get('updated_at', 0) > max_age
+        if report['stale'] or not all(worker['connected'] for worker in report.get('workers', [])):
+            ok = False
+        reports.append(report)
+    return ok, reports
@@ -0,0 +1,171 @@
+# Bản sao của services/common/http_client.py: sửa bản gốc rồi chạy python services/common/sync_copies.py
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Các method an toàn để gửi lại (RFC 9110); method khác chỉ retry khi caller khẳng định idempotent=True
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUS_CODES = frozenset([502, 503, 504])
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Upstream đang bị ngắt mạch; request bị từ chối ngay, không gửi đi.
+    Kế thừa RequestException để các chỗ đang bắt lỗi requests xử lý như lỗi kết nối.
+    """
+
+
+class CircuitBreaker:
+    """
+    Ngắt mạch theo upstream: sau failure_threshold lỗi liên tiếp thì mở mạch trong reset_timeout giây,
+    sau đó cho đúng một request thử (half-open); thành công thì đóng mạch, thất bại thì mở lại.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self._lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ServiceClient:
+    """
+    HTTP client nội bộ cho một upstream: Session giữ kết nối keep-alive (pool riêng),
+    timeout (connect, read) mặc định, retry có jitter cho request idempotent và circuit breaker.
+    """
+
+    def __init__(self, name, base_url, timeout=None, retries=None, backoff=None, backoff_max=None,
+                 pool_size=None, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout or getattr(settings, 'INTERNAL_HTTP_TIMEOUT', (1, 5))
+        self.retries = retries if retries is not None else int(getattr(settings, 'INTERNAL_HTTP_RETRIES', 2))
+        self.backoff = backoff if backoff is not None else float(getattr(settings, 'INTERNAL_HTTP_BACKOFF', 0.1))
+        self.backoff_max = backoff_max if backoff_max is not None else float(
+            getattr(settings, 'INTERNAL_HTTP_BACKOFF_MAX', 1)
+        )
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(getattr(settings, 'CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)),
+            reset_timeout=float(getattr(settings, 'CIRCUIT_BREAKER_RESET_TIMEOUT', 30)),
+        )
+        pool_size = pool_size or int(getattr(settings, 'INTERNAL_HTTP_POOL_SIZE', 10))
+        self.session = requests.Session()
+        # Retry do client tự làm (có jitter và tính vào circuit breaker), adapter không retry
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: ngủ ngẫu nhiên trong [0, min(backoff_max, backoff * 2^attempt)]
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt))))
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Gửi request tới base_url + path.
+
+        Lỗi kết nối, timeout và 502/503/504 được tính là lỗi của upstream; request idempotent
+        được thử lại tối đa `retries` lần. Trả về Response của lần thử cuối, hoặc raise
+        requests.RequestException (CircuitOpenError khi mạch đang mở).
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.retries if idempotent else 0)
+        kwargs.setdefault('timeout', self.timeout)
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(attempts):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Mạch tới {self.name} đang mở, bỏ qua {method} {path}")
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                if last_attempt:
+                    raise
+                logger.warning(f"{method} {self.name}{path} lỗi ({str(e)}), thử lại lần {attempt + 1}")
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code in RETRY_STATUS_CODES:
+                self.breaker.record_failure()
+                if not last_attempt:
+                    logger.warning(f"{method} {self.name}{path} trả về {response.status_code}, thử lại lần {attempt + 1}")
+                    response.close()
+                    self._sleep_before_retry(attempt)
+                    continue
+            else:
+                self.breaker.record_success()
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = None
+
+
+def get_client(name):
+    """
+    Client dùng chung trong process cho upstream `name` (khóa trong settings.INTERNAL_SERVICE_URLS).
+    Gọi thẳng service nội bộ, không vòng qua api_gateway. Process con sau fork tạo client mới
+    thay vì dùng chung socket với process cha.
+    """
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(name)
+        if client is None:
+            base_url = settings.INTERNAL_SERVICE_URLS[name]
+            client = ServiceClient(name, base_url)
+            _clients[name] = client
+        return client
@@ -0,0 +1,121 @@
+# Bản sao của services/common/pagination.py: sửa bản gốc rồi chạy python services/common/sync_copies.py
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Phân trang theo keyset (cursor) trên một bộ khóa sắp xếp duy nhất.
+
+    Trang tiếp theo được lọc bằng điều kiện WHERE (a, b) < (x, y) thay vì OFFSET,
+    nên thời gian lấy một trang không phụ thuộc vào độ sâu của trang.
+    Client cũ có thể gửi ?all=true để nhận toàn bộ danh sách như trước.
+    Bộ khóa sắp xếp mặc định của service lấy từ settings.KEYSET_PAGINATION_ORDERING
+    (trường cuối phải là khóa duy nhất); lớp con có thể ghi đè ordering.
+    """
+    ordering = tuple(getattr(settings, 'KEYSET_PAGINATION_ORDERING', ('-id',)))
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    legacy_query_param = 'all'
+    invalid_cursor_message = 'Cursor không hợp lệ'
+
+    def is_legacy_request(self, request):
+        value = request.query_params.get(self.legacy_query_param, '')
+        return value.lower() in ('1', 'true', 'yes')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_legacy_request(request):
+            return None
+
+        self.request = request
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.build_position_filter(position))
+
+        # Lấy dư một bản ghi để biết còn trang sau hay không
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def build_position_filter(self, position):
+        """
+        Dựng điều kiện so sánh bộ khóa: (a < x) OR (a = x AND b < y) ...
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            clause = Q(**{f"{name}__{lookup}": position[index]})
+            for previous_index in range(index):
+                previous_name = self.ordering[previous_index].lstrip('-')
+                clause &= Q(**{previous_name: position[previous_index]})
+            condition |= clause
+        return condition
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values = json.loads(payload)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError(values)
+            position = []
+            for field, value in zip(self.ordering, values):
+                model_field = self.model._meta.get_field(field.lstrip('-'))
+                position.append(model_field.to_python(value))
+            return position
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,74 @@
+"""
+Đồng bộ các module dùng chung giữa các service.
+
+Mỗi service được build và mount độc lập (build context và volume là thư mục của service),
+nên không import được code nằm ngoài thư mục đó. Bản gốc của các module dùng chung nằm trong
+services/common/ và được chép nguyên văn vào từng service; phần riêng của service lấy từ settings
+(vd. KEYSET_PAGINATION_ORDERING) hoặc import tương đối trong app (vd. models.OutboxEvent).
+Sửa bản gốc rồi chạy:
+
+    python services/common/sync_copies.py          # ghi đè các bản sao trong service
+    python services/common/sync_copies.py --check  # chỉ kiểm tra, exit 1 nếu có bản sao lệch
+
+Test của mỗi service cũng so bản sao của nó với bản gốc.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+COMMON_DIR = Path(__file__).resolve().parent
+SERVICES_DIR = COMMON_DIR.parent
+
+# Các app có consumer RabbitMQ, có outbox và có phân trang keyset
+CONSUMER_APPS = [
+    'auth_service/accounts',
+    'cart_service/carts',
+    'order_service/orders',
+    'payment_service/payments',
+    'product_service/products',
+]
+OUTBOX_APPS = ['order_service/orders', 'payment_service/payments', 'product_service/products']
+PAGINATION_APPS = ['auth_service/accounts', 'order_service/orders', 'product_service/products']
+
+# bản gốc (trong services/common/) -> các bản sao (đường dẫn trong services/)
+COPIES = {
+    'consumers.py': [f'{app}/consumers.py' for app in CONSUMER_APPS],
+    'http_client.py': ['cart_service/carts/http_client.py', 'payment_service/payments/http_client.py'],
+    'outbox.py': [f'{app}/outbox.py' for app in OUTBOX_APPS],
+    'relay_outbox.py': [f'{app}/management/commands/relay_outbox.py' for app in OUTBOX_APPS],
+    'pagination.py': [f'{app}/pagination.py' for app in PAGINATION_APPS],
+}
+
+
+def stale_copies():
+    """
+    Danh sách (bản gốc, bản sao) có nội dung khác nhau
+    """
+    stale = []
+    for name, copies in COPIES.items():
+        source = COMMON_DIR / name
+        for path in copies:
+            copy = SERVICES_DIR / path
+            if not copy.exists() or copy.read_bytes() != source.read_bytes():
+                stale.append((source, copy))
+    return stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Đồng bộ các module dùng chung từ services/common/')
+    parser.add_argument('--check', action='store_true', help='Chỉ kiểm tra, không ghi đè')
+    args = parser.parse_args(argv)
+
+    stale = stale_copies()
+    for source, copy in stale:
+        relative = copy.relative_to(SERVICES_DIR)
+        if args.check:
+            print(f'Lệch với bản gốc {source.name}: {relative}')
+        else:
+            copy.write_bytes(source.read_bytes())
+            print(f'Đã cập nhật {relative}')
+    return 1 if args.check and stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -119,6 +119,19 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
 
 # REST Framework Settings
+# Key ring xác thực access token của auth_service, chọn theo header kid.
+# Token không có kid dùng JWT_DEFAULT_KID. Thêm khóa khi xoay vòng: JWT_KEYS="kid1=key1,kid2=key2"
+JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'django-insecure-auth-service-key')
+JWT_DEFAULT_KID = os.environ.get('JWT_DEFAULT_KID', 'default')
+JWT_KEYS = {JWT_DEFAULT_KID: JWT_SECRET_KEY}
+JWT_KEYS.update(
+    part.split('=', 1) for part in os.environ.get('JWT_KEYS', '').split(',') if '=' in part
+)
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+# Cache token đã xác thực (LRU, TTL không vượt quá exp của token)
+JWT_VERIFIED_CACHE_TTL = int(os.environ.get('JWT_VERIFIED_CACHE_TTL', 300))
+JWT_VERIFIED_CACHE_MAX_ENTRIES = int(os.environ.get('JWT_VERIFIED_CACHE_MAX_ENTRIES', 10000))
+
 # JWT Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -129,6 +142,10 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
+
+# Bộ khóa sắp xếp của phân trang keyset (DonHang); trường cuối là khóa duy nhất
+KEYSET_PAGINATION_ORDERING = ('-NgayDatHang', '-MaDonHang')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -187,4 +204,26 @@ RABBITMQ_PORT = os.environ.get('RABBITMQ_PORT', 5672)
 RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASS = os.environ.get('RABBITMQ_PASS', 'guest')
 
+# Transactional outbox: relay_outbox gửi sự kiện lên RabbitMQ
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get('OUTBOX_RELAY_BATCH_SIZE', 100))
+OUTBOX_RELAY_POLL_INTERVAL = float(os.environ.get('OUTBOX_RELAY_POLL_INTERVAL', 0.5))
+OUTBOX_RELAY_CONFIRM_TIMEOUT = float(os.environ.get('OUTBOX_RELAY_CONFIRM_TIMEOUT', 30))
+OUTBOX_RELAY_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_RELAY_MAX_ATTEMPTS', 5))
+OUTBOX_RETENTION_HOURS = float(os.environ.get('OUTBOX_RETENTION_HOURS', 72))
+
+# Consumer RabbitMQ chạy bằng `manage.py run_consumers` (tách khỏi process web)
+CONSUMERS_IN_WEB_PROCESS = os.environ.get('CONSUMERS_IN_WEB_PROCESS', 'False') == 'True'
+CONSUMER_PROCESSES = int(os.environ.get('CONSUMER_PROCESSES', 1))
+CONSUMER_CHANNELS = int(os.environ.get('CONSUMER_CHANNELS', 1))
+# Số channel mỗi process theo queue, ví dụ "product_service_queue=4,other_queue=2"
+CONSUMER_QUEUE_CONCURRENCY = {
+    name.strip(): int(count)
+    for name, count in (
+        part.split('=', 1) for part in os.environ.get('CONSUMER_QUEUE_CONCURRENCY', '').split(',') if '=' in part
+    )
+}
+CONSUMER_HEALTH_DIR = os.environ.get('CONSUMER_HEALTH_DIR', '/tmp/consumer_health')
+CONSUMER_HEALTH_INTERVAL = float(os.environ.get('CONSUMER_HEALTH_INTERVAL', 5))
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.environ.get('CONSUMER_SHUTDOWN_TIMEOUT', 30))
+
 
@@ -1,12 +1,20 @@
 # File: order_service/apps/orders/apps.py
 
 from django.apps import AppConfig
+from django.conf import settings
 
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
     
     def ready(self):
+        # Đăng ký signal xóa cache TrangThai và cập nhật bảng tổng hợp đơn hàng
+        from . import statuses, summary  # noqa: F401
+
+        # Consumer chạy bằng `manage.py run_consumers`; chỉ chạy trong process web khi được bật rõ ràng
+        if not settings.CONSUMERS_IN_WEB_PROCESS:
+            return
+        
         # Import and start RabbitMQ consumer
         try:
             from .rabbitmq import start_consumer_thread
@@ -0,0 +1,124 @@
+import logging
+from collections import OrderedDict
+from django.db import transaction
+from .models import ChiTietDonHang, DonHang, InboxEvent
+from .outbox import enqueue_events
+from .statuses import status_cache
+from .summary import move_orders
+
+logger = logging.getLogger(__name__)
+
+# Đơn hàng chờ có hàng và trạng thái khi đã phân bổ đủ hàng
+WAITING_STOCK = 'Chờ xử lý'
+PROCESSING = 'Đang xử lý'
+
+
+def allocate(pending_items, stock):
+    """
+    Phân bổ stock cho các đơn hàng theo thứ tự đến trước (FIFO).
+
+    pending_items: các dòng (MaDonHang_id, SoLuong) đã sắp theo thứ tự đơn hàng.
+    Đơn không đủ hàng bị bỏ qua để đơn nhỏ hơn phía sau vẫn được phân bổ, như cách xử lý cũ.
+    Trả về danh sách mã đơn hàng được phân bổ.
+    """
+    needed = OrderedDict()
+    for order_id, quantity in pending_items:
+        needed[order_id] = needed.get(order_id, 0) + quantity
+
+    allocated = []
+    for order_id, quantity in needed.items():
+        if stock <= 0:
+            break
+        if quantity <= stock:
+            allocated.append(order_id)
+            stock -= quantity
+    return allocated
+
+
+def handle_stock_changed(message):
+    """
+    Xử lý sự kiện product.stock_changed ({event_id, product_id, old_stock, new_stock}).
+
+    Chỉ phần hàng mới về (new_stock - old_stock) được phân bổ cho các đơn chờ: product_service không
+    giữ chỗ số hàng đã phân bổ, nên phân bổ theo new_stock sẽ giao cùng một số hàng nhiều lần.
+    Sự kiện giảm tồn kho (trừ kho cho đơn hàng) bị bỏ qua. Trả về danh sách mã đơn hàng đã chuyển.
+    """
+    try:
+        product_id = int(message['product_id'])
+        increase = int(message['new_stock']) - int(message['old_stock'])
+    except (KeyError, TypeError, ValueError):
+        logger.error(f"Sự kiện product.stock_changed không hợp lệ: {message}")
+        return []
+    if increase <= 0:
+        return []
+    return fulfil_pending_orders(product_id, increase, event_id=message.get('event_id'))
+
+
+def fulfil_pending_orders(product_id, new_stock, event_id=None):
+    """
+    Chuyển các đơn hàng đang chờ sản phẩm product_id sang Đang xử lý khi có new_stock hàng về.
+    Có event_id thì sự kiện chỉ được xử lý một lần (message gửi lại không phân bổ lại số hàng đó).
+
+    Số câu truy vấn không phụ thuộc số đơn hàng chờ: một truy vấn lấy các dòng chờ (khóa lại),
+    phân bổ trong bộ nhớ, khóa các đơn được phân bổ và một UPDATE trạng thái, một truy vấn lấy chi tiết cho sự kiện,
+    bảng tổng hợp và outbox được ghi theo lô. Trả về danh sách mã đơn hàng đã chuyển trạng thái.
+    """
+    with transaction.atomic():
+        if event_id is not None:
+            _, created = InboxEvent.objects.get_or_create(
+                event_id=event_id, defaults={'routing_key': 'product.stock_changed'}
+            )
+            if not created:
+                logger.info(f"Bỏ qua product.stock_changed {event_id} đã xử lý")
+                return []
+        waiting = status_cache.get_by_name(WAITING_STOCK, loai='Đơn hàng')
+        processing = status_cache.get_by_name(PROCESSING, loai='Đơn hàng')
+
+        pending_items = list(
+            ChiTietDonHang.objects.select_for_update().filter(
+                MaSanPham=product_id, MaDonHang__MaTrangThai=waiting
+            ).order_by('MaDonHang', 'MaChiTietDonHang').values_list(
+                'MaDonHang_id', 'SoLuong', 'MaDonHang__MaNguoiDung', 'MaDonHang__TongTien'
+            )
+        )
+        if not pending_items:
+            return []
+
+        order_ids = allocate([(order_id, quantity) for order_id, quantity, _, _ in pending_items], new_stock)
+        if not order_ids:
+            return []
+
+        # Đơn có thể đã rời trạng thái chờ sau khi đọc các dòng chờ: khóa lại các đơn được phân bổ
+        # và chỉ chuyển (cập nhật tổng hợp, ghi sự kiện) những đơn vẫn đang chờ
+        still_waiting = set(
+            DonHang.objects.select_for_update().filter(
+                MaDonHang__in=order_ids, MaTrangThai=waiting
+            ).values_list('MaDonHang', flat=True)
+        )
+        order_ids = [order_id for order_id in order_ids if order_id in still_waiting]
+        if not order_ids:
+            return []
+        DonHang.objects.filter(MaDonHang__in=order_ids).update(MaTrangThai=processing)
+
+        orders = {order_id: (user_id, total) for order_id, _, user_id, total in pending_items}
+        user_ids = [orders[order_id][0] for order_id in order_ids]
+        move_orders(order_ids, user_ids, waiting.MaTrangThai, processing.MaTrangThai)
+
+        items = {order_id: [] for order_id in order_ids}
+        for order_id, item_product_id, quantity in ChiTietDonHang.objects.filter(
+            MaDonHang__in=order_ids
+        ).order_by('MaChiTietDonHang').values_list('MaDonHang_id', 'MaSanPham', 'SoLuong'):
+            items[order_id].append({'product_id': item_product_id, 'quantity': quantity})
+
+        enqueue_events('order.updated', [
+            {
+                'order_id': order_id,
+                'user_id': orders[order_id][0],
+                'status': processing.TenTrangThai,
+                'total_amount': float(orders[order_id][1]),
+                'items': items[order_id]
+            } for order_id in order_ids
+        ])
+
+    logger.info(f"Sản phẩm #{product_id} có hàng ({new_stock}): {len(order_ids)} đơn hàng chuyển sang {PROCESSING}")
+    return order_ids
@@ -0,0 +1,105 @@
+import logging
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from orders.middleware import TokenUser
+from orders.statuses import status_cache
+from orders.views import CreateOrderView
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(samples, percent):
+    """
+    Percentile theo phương pháp nearest-rank trên danh sách đã sắp xếp
+    """
+    if not samples:
+        return 0.0
+    rank = max(1, int(round(percent / 100.0 * len(samples))))
+    return samples[min(rank, len(samples)) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Đo độ trễ tạo đơn hàng (CreateOrderView) theo số dòng sản phẩm, in p50/p99'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100',
+                            help='Các số dòng sản phẩm mỗi đơn, phân tách bằng dấu phẩy (mặc định 1,10,100)')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Số đơn hàng đo cho mỗi kích thước (mặc định 200)')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Số đơn hàng chạy trước khi đo (mặc định 10)')
+        parser.add_argument('--user-id', type=int, default=1)
+        parser.add_argument('--keep', action='store_true',
+                            help='Giữ lại các đơn hàng đã tạo (mặc định rollback sau mỗi đơn)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes phải là danh sách số nguyên")
+        if not sizes or min(sizes) <= 0 or options['iterations'] <= 0:
+            raise CommandError("--sizes và --iterations phải lớn hơn 0")
+
+        # Không để log từng request làm sai lệch kết quả đo
+        logging.disable(logging.INFO)
+        view = CreateOrderView.as_view()
+        factory = APIRequestFactory()
+        user = TokenUser(options['user_id'])
+        with transaction.atomic():
+            status_cache.get_by_name("Đang xử lý", loai='Đơn hàng')
+
+        self.stdout.write(f"{'items':>6} {'n':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'queries':>8}")
+        try:
+            for size in sizes:
+                body = {
+                    'user_id': options['user_id'],
+                    'recipient_name': 'Benchmark',
+                    'phone_number': '0900000000',
+                    'address': 'Benchmark',
+                    'payment_method': 'COD',
+                    'items': [
+                        {'id': product_id, 'name': f'Sản phẩm {product_id}', 'price': 100000, 'quantity': 1}
+                        for product_id in range(1, size + 1)
+                    ],
+                }
+                for _ in range(options['warmup']):
+                    self._create(view, factory, user, body, options['keep'])
+                samples = []
+                queries = 0
+                for _ in range(options['iterations']):
+                    elapsed, queries = self._create(view, factory, user, body, options['keep'])
+                    samples.append(elapsed * 1000)
+                samples.sort()
+                self.stdout.write(
+                    f"{size:>6} {len(samples):>6} {percentile(samples, 50):>9.2f} "
+                    f"{percentile(samples, 99):>9.2f} {samples[-1]:>9.2f} {queries:>8}"
+                )
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def _create(self, view, factory, user, body, keep):
+        """
+        Tạo một đơn hàng; trả về (số giây, số câu truy vấn). Không --keep thì rollback đơn vừa tạo.
+        """
+        request = factory.post('/api/orders/create/', body, format='json')
+        force_authenticate(request, user=user)
+        # Tránh chạm giới hạn 9000 câu truy vấn được ghi lại của connection.queries
+        reset_queries()
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = view(request)
+                    elapsed = time.perf_counter() - started
+                if response.status_code != 201:
+                    raise CommandError(f"Tạo đơn hàng thất bại ({response.status_code}): {response.data}")
+                if not keep:
+                    raise _Rollback()
+        except _Rollback:
+            pass
+        return elapsed, len(captured.captured_queries)
@@ -0,0 +1,99 @@
+import random
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from orders.models import ChiTietDonHang, DonHang, TrangThai
+from orders.query_plans import HOT_QUERIES, explain
+from orders.summary import rebuild_summaries
+
+# Người dùng của dữ liệu mẫu có mã từ đây trở lên để không lẫn với dữ liệu thật
+SEED_USER_BASE = 900000000
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Chạy EXPLAIN cho các truy vấn nóng đã đăng ký (orders/query_plans.py) trên dữ liệu mẫu, '
+            'báo lỗi nếu có truy vấn quét toàn bảng')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20000,
+                            help='Số đơn hàng mẫu tạo trước khi EXPLAIN (mặc định 20000, 0 = dùng dữ liệu hiện có)')
+        parser.add_argument('--users', type=int, default=500, help='Số người dùng mẫu (mặc định 500)')
+        parser.add_argument('--products', type=int, default=200, help='Số sản phẩm mẫu (mặc định 200)')
+        parser.add_argument('--verbose-plans', action='store_true', help='In toàn bộ kế hoạch thực thi')
+
+    def handle(self, *args, **options):
+        if options['orders'] < 0 or options['users'] <= 0 or options['products'] <= 0:
+            raise CommandError("--orders không được âm, --users và --products phải lớn hơn 0")
+
+        failures = []
+        try:
+            # Dữ liệu mẫu chỉ tồn tại trong transaction này và bị rollback khi kiểm tra xong
+            with transaction.atomic():
+                if options['orders']:
+                    self._seed(options['orders'], options['users'], options['products'])
+                sample = self._sample()
+                for query in HOT_QUERIES:
+                    plan, full_scans = explain(query.build(sample))
+                    full_scans = [table for table in full_scans if table not in query.allow_full_scan]
+                    if full_scans:
+                        failures.append(f"{query.name}: quét toàn bảng {', '.join(full_scans)}")
+                        self.stdout.write(self.style.ERROR(f"FAIL {query.name}: {', '.join(full_scans)}"))
+                    else:
+                        self.stdout.write(f"OK   {query.name}")
+                    if options['verbose_plans'] or full_scans:
+                        self.stdout.write(plan)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        if failures:
+            raise CommandError("; ".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"{len(HOT_QUERIES)} truy vấn nóng đều dùng index"))
+
+    def _seed(self, total, users, products):
+        statuses = list(TrangThai.objects.filter(LoaiTrangThai='Đơn hàng').values_list('MaTrangThai', flat=True))
+        if not statuses:
+            raise CommandError("Chưa có TrangThai loại 'Đơn hàng', hãy chạy migrate")
+        rng = random.Random(0)
+        DonHang.objects.bulk_create([
+            DonHang(
+                MaNguoiDung=SEED_USER_BASE + rng.randrange(users),
+                MaTrangThai_id=rng.choice(statuses),
+                TongTien=100000,
+                DiaChi='Dữ liệu mẫu',
+                TenNguoiNhan='Dữ liệu mẫu',
+                SoDienThoai='0900000000',
+                PhuongThucThanhToan='COD'
+            ) for _ in range(total)
+        ], batch_size=1000)
+        # MySQL không trả về khóa chính sau bulk_create nên đọc lại mã đơn hàng
+        order_ids = DonHang.objects.filter(MaNguoiDung__gte=SEED_USER_BASE).values_list('MaDonHang', flat=True)
+        ChiTietDonHang.objects.bulk_create([
+            ChiTietDonHang(
+                MaDonHang_id=order_id,
+                MaSanPham=rng.randrange(1, products + 1),
+                SoLuong=1,
+                GiaSanPham=50000,
+                TenSanPham='Dữ liệu mẫu'
+            ) for order_id in order_ids.iterator() for _ in range(2)
+        ], batch_size=1000)
+        rebuild_summaries(range(SEED_USER_BASE, SEED_USER_BASE + users))
+        self.stdout.write(f"Đã tạo {total} đơn hàng mẫu cho {users} người dùng")
+
+    def _sample(self):
+        item = ChiTietDonHang.objects.select_related('MaDonHang').order_by('-MaChiTietDonHang').first()
+        if item is None:
+            raise CommandError("Không có dữ liệu đơn hàng để EXPLAIN, hãy bỏ --orders 0")
+        order = item.MaDonHang
+        order_ids = list(
+            DonHang.objects.filter(MaNguoiDung=order.MaNguoiDung).values_list('MaDonHang', flat=True)[:20]
+        )
+        return {
+            'user_id': order.MaNguoiDung,
+            'product_id': item.MaSanPham,
+            'status_id': order.MaTrangThai_id,
+            'order_ids': order_ids,
+        }
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from orders.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Tính lại bảng tổng hợp đơn hàng theo người dùng (TongHopDonHang) từ DonHang'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Chỉ tính lại cho người dùng này (có thể lặp lại); mặc định tất cả')
+
+    def handle(self, *args, **options):
+        count = rebuild_summaries(options['users'])
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {count} dòng tổng hợp"))
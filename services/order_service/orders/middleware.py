@@ -1,103 +1,150 @@
-import jwt
-import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+import jwt
 from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
 logger = logging.getLogger(__name__)
 
+class TokenUser:
+    """
+    Người dùng lấy từ claims của token; __slots__ để mỗi request chỉ cấp phát một object nhỏ
+    """
+    __slots__ = ('id', 'username', 'email')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username='', email=''):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    def __repr__(self):
+        return f"<TokenUser {self.id}>"
+
+
+class VerifiedTokenCache:
+    """
+    LRU các token đã xác thực, khóa theo chữ ký của token.
+
+    Mỗi entry lưu phần header.payload đã ký để đối chiếu, và hết hạn sau
+    JWT_VERIFIED_CACHE_TTL giây nhưng không muộn hơn exp của token.
+    """
+
+    def __init__(self, max_entries=None, ttl=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # signature -> (signing_input, user, expires_at)
+        self._max_entries = max_entries
+        self._ttl = ttl
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'JWT_VERIFIED_CACHE_MAX_ENTRIES', 10000)
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'JWT_VERIFIED_CACHE_TTL', 300)
+
+    def get(self, signing_input, signature):
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None:
+                return None
+            cached_input, user, expires_at = entry
+            if cached_input != signing_input or expires_at <= time.time():
+                del self._entries[signature]
+                return None
+            self._entries.move_to_end(signature)
+            return user
+
+    def set(self, signing_input, signature, user, exp=None):
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[signature] = (signing_input, user, expires_at)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def get_signing_key(kid):
+    """
+    Chọn khóa theo header kid; token không có kid (simplejwt mặc định) dùng JWT_DEFAULT_KID
+    """
+    return settings.JWT_KEYS.get(kid or settings.JWT_DEFAULT_KID)
+
+
 class JWTAuthentication(BaseAuthentication):
     """
     Custom JWT Authentication for Order Service
     """
+    # Các claim có thể chứa user_id, theo thứ tự ưu tiên
+    USER_ID_CLAIMS = ('user_id', 'id', 'sub', 'userId')
+
     def authenticate(self, request):
         # Lấy token từ header Authorization
         authorization_header = request.headers.get('Authorization', '')
-        
-        if not authorization_header:
+        if not authorization_header.startswith('Bearer '):
             return None
         
-        try:
-            # Lấy token từ Authorization header
-            if not authorization_header.startswith('Bearer '):
-                return None
-            
-            token = authorization_header.split(' ')[1]
-            logger.debug(f"Token found: {token[:10]}...")
-            
-            # Giải mã token
-            try:
-                # Thử các secret key khác nhau
-                try:
-                    # Thử với SECRET_KEY từ settings trước
-                    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                except jwt.InvalidSignatureError:
-                    # Nếu không thành công, thử dùng JWT_SECRET_KEY
-                    if hasattr(settings, 'JWT_SECRET_KEY'):
-                        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=['HS256'])
-                    else:
-                        # Thử dùng SECRET_KEY mặc định của auth_service
-                        payload = jwt.decode(
-                            token, 
-                            "django-insecure-auth-service-key", 
-                            algorithms=['HS256']
-                        )
-            except Exception as e:
-                # Thử parse token mà không verify signature (chỉ dùng trong development)
-                if settings.DEBUG:
-                    header, payload_b64, signature = token.split('.')
-                    from base64 import b64decode
-                    import json
-                    
-                    # Decode payload
-                    payload_str = b64decode(payload_b64 + '=' * (-len(payload_b64) % 4))
-                    payload = json.loads(payload_str)
-                    logger.warning(f"Using unverified token payload: {payload}")
-                else:
-                    raise e
-            
-            logger.debug(f"Token decoded successfully: {payload}")
-            
-            # Lấy user_id từ payload - kiểm tra nhiều trường khác nhau
-            user_id = None
-            possible_id_fields = ['user_id', 'id', 'sub', 'userId']
-            
-            for field in possible_id_fields:
-                if field in payload:
-                    user_id = payload[field]
-                    break
-            
-            if not user_id:
-                logger.warning("No user_id found in token payload")
-                # Sử dụng user_id mặc định nếu không tìm thấy
-                user_id = 1  # ID mặc định
-            
-            # Đảm bảo user_id là số
-            try:
-                user_id = int(user_id)
-            except (TypeError, ValueError):
-                user_id = 1  # ID mặc định nếu không thể chuyển đổi
-            
-            # Tạo một đối tượng user custom với thông tin từ token
-            user = type('User', (object,), {
-                'id': user_id,
-                'username': payload.get('username', ''),
-                'email': payload.get('email', ''),
-                'is_authenticated': True
-            })
-            
+        token = authorization_header[len('Bearer '):].strip()
+        signing_input, _, signature = token.rpartition('.')
+        if not signing_input or not signature:
+            raise AuthenticationFailed('Token không hợp lệ')
+        
+        user = verified_tokens.get(signing_input, signature)
+        if user is not None:
             return (user, token)
-            
+        
+        try:
+            header = jwt.get_unverified_header(token)
+            key = get_signing_key(header.get('kid'))
+            if key is None:
+                logger.warning(f"Không có khóa cho kid={header.get('kid')}")
+                raise AuthenticationFailed('Token không hợp lệ')
+            # Một lần xác thực chữ ký duy nhất cho mỗi token
+            payload = jwt.decode(token, key, algorithms=[settings.JWT_ALGORITHM])
         except jwt.ExpiredSignatureError:
             logger.warning("Token expired")
             raise AuthenticationFailed('Token đã hết hạn')
         except jwt.InvalidTokenError as e:
             logger.error(f"Invalid token: {str(e)}")
             raise AuthenticationFailed('Token không hợp lệ')
-        except Exception as e:
-            logger.error(f"Authentication error: {str(e)}")
-            return None
+        
+        user = TokenUser(
+            self.get_user_id(payload),
+            username=payload.get('username', ''),
+            email=payload.get('email', '')
+        )
+        verified_tokens.set(signing_input, signature, user, exp=payload.get('exp'))
+        return (user, token)
+
+    def get_user_id(self, payload):
+        user_id = next((payload[claim] for claim in self.USER_ID_CLAIMS if claim in payload), None)
+        if not user_id:
+            logger.warning("No user_id found in token payload")
+            # Sử dụng user_id mặc định nếu không tìm thấy
+            return 1
+        try:
+            return int(user_id)
+        except (TypeError, ValueError):
+            return 1  # ID mặc định nếu không thể chuyển đổi
 
 class AuthMiddleware:
     def __init__(self, get_response):
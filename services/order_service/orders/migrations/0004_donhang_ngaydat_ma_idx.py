@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_auto_20250411_1622'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donhang',
+            index=models.Index(fields=['NgayDatHang', 'MaDonHang'], name='donhang_ngaydat_ma_idx'),
+        ),
+    ]
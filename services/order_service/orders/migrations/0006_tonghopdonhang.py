@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-18 18:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    # Tính bảng tổng hợp ban đầu từ các đơn hàng hiện có
+    DonHang = apps.get_model('orders', 'DonHang')
+    TongHopDonHang = apps.get_model('orders', 'TongHopDonHang')
+    aggregates = DonHang.objects.values('MaNguoiDung', 'MaTrangThai_id').annotate(
+        count=models.Count('MaDonHang'), total=models.Sum('TongTien')
+    ).order_by()
+    TongHopDonHang.objects.bulk_create([
+        TongHopDonHang(
+            MaNguoiDung=row['MaNguoiDung'],
+            MaTrangThai_id=row['MaTrangThai_id'],
+            SoDonHang=row['count'],
+            TongTien=row['total'] or 0
+        ) for row in aggregates
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TongHopDonHang',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('MaNguoiDung', models.IntegerField()),
+                ('SoDonHang', models.IntegerField(default=0)),
+                ('TongTien', models.DecimalField(decimal_places=0, default=0, max_digits=15)),
+                ('MaTrangThai', models.ForeignKey(db_column='MaTrangThai', on_delete=django.db.models.deletion.CASCADE, to='orders.trangthai')),
+            ],
+            options={
+                'db_table': 'TongHopDonHang',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tonghopdonhang',
+            constraint=models.UniqueConstraint(fields=('MaNguoiDung', 'MaTrangThai'), name='tonghop_nguoidung_trangthai_uniq'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
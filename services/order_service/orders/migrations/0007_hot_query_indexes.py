@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_tonghopdonhang'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chitietdonhang',
+            index=models.Index(fields=['MaSanPham', 'MaDonHang'], name='chitiet_sanpham_donhang_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donhang',
+            index=models.Index(fields=['MaNguoiDung', 'NgayDatHang', 'MaDonHang'], name='donhang_nguoidung_ngaydat_idx'),
+        ),
+    ]
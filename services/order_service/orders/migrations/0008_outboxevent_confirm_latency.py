@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='confirm_latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_outboxevent_confirm_latency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=64, unique=True)),
+                ('routing_key', models.CharField(max_length=100)),
+                ('processed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'InboxEvent',
+            },
+        ),
+    ]
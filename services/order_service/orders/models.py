@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 
 class TrangThai(models.Model):
     MaTrangThai = models.AutoField(primary_key=True)
@@ -27,6 +28,25 @@ class DonHang(models.Model):
     
     class Meta:
         db_table = 'DonHang'
+        indexes = [
+            # Khóa phân trang keyset (NgayDatHang, MaDonHang)
+            models.Index(fields=['NgayDatHang', 'MaDonHang'], name='donhang_ngaydat_ma_idx'),
+            # Đơn hàng của một người dùng theo thứ tự mới nhất (get_user_orders, get_user_order_info,
+            # DonHangViewSet?user_id=): lọc và sắp xếp đều trên index, không cần filesort
+            models.Index(fields=['MaNguoiDung', 'NgayDatHang', 'MaDonHang'], name='donhang_nguoidung_ngaydat_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ giá trị lúc đọc để bảng tổng hợp biết đơn hàng chuyển từ đâu sang đâu khi save
+        instance.remember_summary_key()
+        return instance
+
+    def remember_summary_key(self):
+        deferred = self.get_deferred_fields()
+        if not deferred & {'MaNguoiDung', 'MaTrangThai_id', 'TongTien'}:
+            self._summary_key = (self.MaNguoiDung, self.MaTrangThai_id, self.TongTien)
 
 
 class ChiTietDonHang(models.Model):
@@ -39,4 +59,61 @@ class ChiTietDonHang(models.Model):
     HinhAnh = models.URLField(null=True, blank=True)
     
     class Meta:
-        db_table = 'ChiTietDonHang'
\ No newline at end of file
+        db_table = 'ChiTietDonHang'
+        indexes = [
+            # Các dòng chờ hàng của một sản phẩm theo thứ tự đơn (consumer product.stock_changed);
+            # trạng thái nằm ở DonHang và được kiểm tra qua khóa chính MaDonHang
+            models.Index(fields=['MaSanPham', 'MaDonHang'], name='chitiet_sanpham_donhang_idx'),
+        ]
+
+
+class TongHopDonHang(models.Model):
+    """
+    Tổng hợp đơn hàng theo người dùng và trạng thái (số đơn, tổng tiền), được cập nhật
+    tăng dần cùng transaction với mỗi lần tạo/đổi trạng thái đơn hàng (orders/summary.py)
+    """
+    MaNguoiDung = models.IntegerField()
+    MaTrangThai = models.ForeignKey(TrangThai, on_delete=models.CASCADE, db_column='MaTrangThai')
+    SoDonHang = models.IntegerField(default=0)
+    TongTien = models.DecimalField(max_digits=15, decimal_places=0, default=0)
+
+    class Meta:
+        db_table = 'TongHopDonHang'
+        constraints = [
+            models.UniqueConstraint(fields=['MaNguoiDung', 'MaTrangThai'], name='tonghop_nguoidung_trangthai_uniq'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Sự kiện chờ gửi lên RabbitMQ, được ghi cùng transaction với thay đổi dữ liệu (transactional outbox)
+    """
+    routing_key = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Thời gian từ lúc relay publish tới khi broker xác nhận (publisher confirms)
+    confirm_latency_ms = models.FloatField(null=True, blank=True)
+    # Bị từ chối quá OUTBOX_RELAY_MAX_ATTEMPTS lần: relay bỏ qua, chờ xử lý tay (relay_outbox --requeue-failed)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'OutboxEvent'
+        indexes = [
+            # Relay quét published_at IS NULL (và failed_at IS NULL) ORDER BY id; dọn dẹp quét theo published_at
+            models.Index(fields=['published_at', 'id'], name='outbox_published_id_idx'),
+        ]
+
+
+class InboxEvent(models.Model):
+    """
+    Sự kiện đã xử lý (theo event_id của bên gửi), để message được gửi lại không bị xử lý lần hai
+    """
+    event_id = models.CharField(max_length=64, unique=True)
+    routing_key = models.CharField(max_length=100)
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'InboxEvent'
@@ -0,0 +1,209 @@
+# Bản sao của services/common/outbox.py: sửa bản gốc rồi chạy python services/common/sync_copies.py
+import json
+import logging
+import time
+import pika
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_EXCHANGE = 'microservice_events'
+
+
+def enqueue_event(routing_key, payload):
+    """
+    Ghi sự kiện vào bảng outbox.
+
+    Phải được gọi trong cùng transaction với thay đổi dữ liệu: sự kiện chỉ tồn tại
+    khi thay đổi đã commit, và relay_outbox sẽ gửi nó lên RabbitMQ sau đó.
+    """
+    return OutboxEvent.objects.create(routing_key=routing_key, payload=payload)
+
+
+def enqueue_events(routing_key, payloads, batch_size=500):
+    """
+    Ghi nhiều sự kiện cùng routing key vào outbox bằng INSERT nhiều dòng (cùng điều kiện transaction như enqueue_event)
+    """
+    return OutboxEvent.objects.bulk_create(
+        [OutboxEvent(routing_key=routing_key, payload=payload) for payload in payloads],
+        batch_size=batch_size
+    )
+
+
+class OutboxRelay:
+    """
+    Đọc các sự kiện chưa gửi trong outbox theo lô và publish lên exchange với publisher confirms.
+
+    Mỗi lô được khóa bằng SELECT ... FOR UPDATE SKIP LOCKED nên nhiều relay có thể chạy
+    song song mà không gửi trùng cùng một dòng. Cả lô được publish liền một mạch rồi chờ
+    broker xác nhận một lần (theo delivery tag), thay vì chờ từng message. Dòng chỉ được đánh
+    dấu published_at sau khi broker ack; nếu relay chết giữa chừng, sự kiện sẽ được gửi lại
+    (at-least-once). Sự kiện bị từ chối quá OUTBOX_RELAY_MAX_ATTEMPTS lần được đánh dấu
+    failed_at và không chặn các sự kiện sau nó.
+    """
+
+    def __init__(self, batch_size=None, exchange=EVENT_EXCHANGE):
+        self.batch_size = batch_size or int(getattr(settings, 'OUTBOX_RELAY_BATCH_SIZE', 100))
+        self.confirm_timeout = float(getattr(settings, 'OUTBOX_RELAY_CONFIRM_TIMEOUT', 30))
+        self.max_attempts = int(getattr(settings, 'OUTBOX_RELAY_MAX_ATTEMPTS', 5))
+        self.exchange = exchange
+        self._connection = None
+        self._channel = None
+        self._confirmed = []
+        self._reset_confirms()
+
+    def _reset_confirms(self):
+        # Delivery tag do broker đánh số từ 1 trên mỗi kênh, sau Confirm.Select
+        self._delivery_tag = 0
+        self._unconfirmed = {}
+
+    def _get_channel(self):
+        if self._channel is not None and self._channel.is_open:
+            return self._channel
+        self.close()
+        credentials = pika.PlainCredentials(
+            settings.RABBITMQ_USER,
+            getattr(settings, 'RABBITMQ_PASS', None) or getattr(settings, 'RABBITMQ_PASSWORD', 'guest')
+        )
+        parameters = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=int(settings.RABBITMQ_PORT),
+            credentials=credentials,
+            heartbeat=600,
+            blocked_connection_timeout=300
+        )
+        self._connection = pika.BlockingConnection(parameters)
+        self._channel = self._connection.channel()
+        self._channel.exchange_declare(exchange=self.exchange, exchange_type='topic', durable=True)
+        # Bật confirm trên kênh gốc thay vì BlockingChannel.confirm_delivery(): kênh blocking ở chế độ
+        # confirm chờ ack sau từng basic_publish, ở đây ack/nack được gom lại bằng _on_confirm
+        self._channel._impl.confirm_delivery(ack_nack_callback=self._on_confirm)
+        logger.info("Outbox relay đã kết nối RabbitMQ (publisher confirms)")
+        return self._channel
+
+    def close(self):
+        connection, self._connection, self._channel = self._connection, None, None
+        self._reset_confirms()
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _on_confirm(self, frame):
+        """
+        Nhận Basic.Ack/Basic.Nack; multiple=True xác nhận mọi delivery tag đến tag này
+        """
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+        now = time.perf_counter()
+        for tag in tags:
+            entry = self._unconfirmed.pop(tag, None)
+            if entry is not None:
+                event, started = entry
+                self._confirmed.append((event, acked, round((now - started) * 1000, 3)))
+
+    def _wait_for_confirms(self):
+        deadline = time.monotonic() + self.confirm_timeout
+        while self._unconfirmed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._connection.process_data_events(time_limit=remaining)
+        return True
+
+    def relay_batch(self):
+        """
+        Gửi một lô sự kiện. Trả về số sự kiện đã được broker xác nhận.
+        """
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(published_at__isnull=True, failed_at__isnull=True)
+                .order_by('id')[:self.batch_size]
+            )
+            if not events:
+                return 0
+
+            self._confirmed = []
+            channel = self._get_channel()
+            properties = pika.BasicProperties(delivery_mode=2, content_type='application/json')
+            failed = {}
+            try:
+                for event in events:
+                    try:
+                        body = json.dumps(event.payload, cls=DjangoJSONEncoder)
+                    except (TypeError, ValueError) as e:
+                        failed[event] = f"Không tuần tự hóa được payload: {e}"
+                        continue
+                    started = time.perf_counter()
+                    channel.basic_publish(
+                        exchange=self.exchange,
+                        routing_key=event.routing_key,
+                        body=body,
+                        properties=properties
+                    )
+                    self._delivery_tag += 1
+                    self._unconfirmed[self._delivery_tag] = (event, started)
+                if not self._wait_for_confirms():
+                    logger.error(f"Outbox relay không nhận đủ xác nhận sau {self.confirm_timeout}s")
+                    self.close()
+            except pika.exceptions.AMQPError as e:
+                # Mất kết nối: lưu những gì đã được xác nhận, phần còn lại để lô sau
+                logger.error(f"Outbox relay mất kết nối RabbitMQ: {str(e)}")
+                self.close()
+
+            confirmed, self._confirmed = self._confirmed, []
+            published = []
+            now = timezone.now()
+            for event, acked, latency in confirmed:
+                if acked:
+                    event.published_at = now
+                    event.confirm_latency_ms = latency
+                    published.append(event)
+                else:
+                    failed[event] = "Broker nack"
+            if published:
+                OutboxEvent.objects.bulk_update(published, ['published_at', 'confirm_latency_ms'])
+            for event, error in failed.items():
+                parked = event.attempts + 1 >= self.max_attempts
+                OutboxEvent.objects.filter(id=event.id).update(
+                    attempts=F('attempts') + 1, last_error=error, failed_at=now if parked else None
+                )
+                if parked:
+                    logger.error(f"Sự kiện outbox #{event.id} bị từ chối {event.attempts + 1} lần, ngừng gửi: {error}")
+                else:
+                    logger.warning(f"Sự kiện outbox #{event.id} bị từ chối: {error}")
+        return len(published)
+
+    def requeue_failed(self):
+        """
+        Đưa các sự kiện đã ngừng gửi (failed_at) trở lại hàng đợi của relay
+        """
+        return OutboxEvent.objects.filter(published_at__isnull=True, failed_at__isnull=False).update(
+            failed_at=None, attempts=0
+        )
+
+    def purge_published(self, before):
+        """
+        Xóa các sự kiện đã gửi trước thời điểm before, theo từng lô để không khóa bảng lâu
+        """
+        deleted = 0
+        while True:
+            ids = list(
+                OutboxEvent.objects.filter(published_at__lt=before)
+                .order_by('published_at', 'id')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return deleted
+            deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
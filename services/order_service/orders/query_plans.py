@@ -0,0 +1,122 @@
+import json
+import re
+from django.db import connection
+from .models import ChiTietDonHang, DonHang, OutboxEvent, TongHopDonHang
+from .pagination import KeysetPagination
+
+
+class HotQuery:
+    """
+    Một truy vấn nóng cần luôn đi qua index.
+
+    build(sample) trả về queryset với tham số lấy từ dữ liệu mẫu (user_id, product_id, status_id, order_ids...).
+    allow_full_scan: các bảng tra cứu nhỏ (vd. TrangThai) được phép quét toàn bộ.
+    """
+    def __init__(self, name, build, allow_full_scan=()):
+        self.name = name
+        self.build = build
+        self.allow_full_scan = set(allow_full_scan)
+
+
+HOT_QUERIES = []
+
+
+def hot_query(name, allow_full_scan=()):
+    """
+    Đăng ký một truy vấn nóng cho `manage.py check_query_plans`
+    """
+    def decorator(build):
+        HOT_QUERIES.append(HotQuery(name, build, allow_full_scan))
+        return build
+    return decorator
+
+
+@hot_query('user_orders_first_page')
+def _user_orders_first_page(sample):
+    # get_user_orders, get_user_order_info?include_orders=true, DonHangViewSet?user_id=
+    return DonHang.objects.filter(MaNguoiDung=sample['user_id']).order_by(
+        *KeysetPagination.ordering
+    )[:KeysetPagination.page_size + 1]
+
+
+@hot_query('user_orders_next_page')
+def _user_orders_next_page(sample):
+    pagination = KeysetPagination()
+    position = DonHang.objects.filter(MaNguoiDung=sample['user_id']).order_by(
+        *KeysetPagination.ordering
+    ).values_list('NgayDatHang', 'MaDonHang').first()
+    return DonHang.objects.filter(MaNguoiDung=sample['user_id']).filter(
+        pagination.build_position_filter(position)
+    ).order_by(*KeysetPagination.ordering)[:KeysetPagination.page_size + 1]
+
+
+@hot_query('order_items_prefetch')
+def _order_items_prefetch(sample):
+    # prefetch_related('chi_tiet') của các trang đơn hàng
+    return ChiTietDonHang.objects.filter(MaDonHang__in=sample['order_ids'])
+
+
+@hot_query('user_order_summary', allow_full_scan=('TrangThai',))
+def _user_order_summary(sample):
+    return TongHopDonHang.objects.filter(MaNguoiDung=sample['user_id'], SoDonHang__gt=0).select_related(
+        'MaTrangThai'
+    ).order_by('MaTrangThai_id')
+
+
+@hot_query('pending_items_for_product')
+def _pending_items_for_product(sample):
+    # Consumer product.stock_changed: các dòng chờ hàng của sản phẩm theo thứ tự đơn
+    return ChiTietDonHang.objects.filter(
+        MaSanPham=sample['product_id'], MaDonHang__MaTrangThai_id=sample['status_id']
+    ).order_by('MaDonHang', 'MaChiTietDonHang')
+
+
+@hot_query('outbox_pending_batch')
+def _outbox_pending_batch(sample):
+    return OutboxEvent.objects.filter(published_at__isnull=True).order_by('id')[:100]
+
+
+def _mysql_full_scans(plan):
+    """
+    Các bảng có access_type ALL trong EXPLAIN FORMAT=JSON của MySQL
+    """
+    tables = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get('access_type') == 'ALL':
+                tables.append(node.get('table_name', '?'))
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(plan))
+    return tables
+
+
+# SQLite: "SCAN DonHang" là quét toàn bảng; "SCAN DonHang USING INDEX ..." là đi theo index
+_SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?\s*$')
+
+
+def _sqlite_full_scans(plan):
+    tables = []
+    for line in plan.splitlines():
+        match = _SQLITE_SCAN.search(line)
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+def explain(queryset):
+    """
+    Chạy EXPLAIN cho queryset; trả về (plan dạng text, danh sách bảng bị quét toàn bộ)
+    """
+    if connection.vendor == 'mysql':
+        plan = queryset.explain(format='JSON')
+        return plan, _mysql_full_scans(plan)
+    if connection.vendor == 'sqlite':
+        plan = queryset.explain()
+        return plan, _sqlite_full_scans(plan)
+    raise NotImplementedError(f"Chưa hỗ trợ đọc EXPLAIN của {connection.vendor}")
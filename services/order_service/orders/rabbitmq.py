@@ -6,7 +6,9 @@ import logging
 from django.conf import settings
 import time
 from .utils import get_rabbitmq_client
-from .models import DonHang as Order, ChiTietDonHang as OrderItem
+from .outbox import enqueue_event
+from .consumers import QueueSpec
+from .fulfilment import handle_stock_changed
 
 logger = logging.getLogger(__name__)
 
@@ -22,47 +24,8 @@ def message_callback(ch, method, properties, body):
         
         # Process message based on routing key
         if routing_key == 'product.stock_changed':
-            # Example: Check if any pending orders can be fulfilled now
-            product_id = message.get('product_id')
-            new_stock = message.get('new_stock', 0)
-            if product_id and new_stock > 0:
-                # Find pending orders with this product
-                order_items = OrderItem.objects.filter(
-                    MaSanPham=product_id,
-                    MaDonHang__MaTrangThai__TenTrangThai='Chờ xử lý'
-                )
-                
-                for item in order_items:
-                    if new_stock >= item.SoLuong:
-                        # We can fulfill this order item
-                        order = item.MaDonHang
-                        
-                        # Update order status to "Đang xử lý"
-                        from .models import TrangThai
-                        processing_status = TrangThai.objects.get(TenTrangThai='Đang xử lý')
-                        order.MaTrangThai = processing_status
-                        order.save()
-                        
-                        # Publish order updated event
-                        publish_order_event('updated', {
-                            'order_id': order.MaDonHang,
-                            'user_id': order.MaNguoiDung,
-                            'status': order.MaTrangThai.TenTrangThai,
-                            'total_amount': float(order.TongTien),
-                            'items': [
-                                {
-                                    'product_id': chi_tiet.MaSanPham,
-                                    'quantity': chi_tiet.SoLuong
-                                } for chi_tiet in order.chi_tiet.all()
-                            ]
-                        })
-                        
-                        logger.info(f"Order #{order.MaDonHang} status updated to PROCESSING")
-                        
-                        # Reduce available stock for next iteration
-                        new_stock -= item.SoLuong
-                        if new_stock <= 0:
-                            break
+            # Phân bổ phần hàng mới về cho các đơn đang chờ
+            handle_stock_changed(message)
         
         # Acknowledge message
         ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -86,34 +49,45 @@ def start_consumer():
     except Exception as e:
         logger.error(f"Error starting RabbitMQ consumer: {str(e)}")
 
-def publish_order_event(event_type, order_data, max_retries=3, retry_delay=2):
+def publish_order_event(event_type, order_data):
     """
-    Publish an order-related event to RabbitMQ with retry mechanism
+    Ghi sự kiện đơn hàng vào outbox; relay_outbox sẽ gửi lên RabbitMQ.
+    Cần gọi trong cùng transaction với thay đổi đơn hàng.
     """
-    logger.debug(f"Preparing to publish {event_type} event: {order_data}")
+    routing_key = f"order.{event_type}"
+    enqueue_event(routing_key, order_data)
+    logger.debug(f"Queued {routing_key} event: {order_data}")
+    return True
+
+def wallet_reply_callback(ch, method, properties, body):
+    """
+    Nhận kết quả giữ tiền từ auth_service (wallet.reserved / wallet.reservation_failed).
+    Lỗi DB được raise để ConsumerWorker nack và đưa message lại vào queue.
+    """
+    from .wallet import apply_wallet_reply
     try:
-        client = get_rabbitmq_client()
-        logger.debug("Got RabbitMQ client")
-        routing_key = f"order.{event_type}"
-        for attempt in range(max_retries):
-            try:
-                logger.debug(f"Attempt {attempt + 1} to publish to {routing_key}")
-                success = client.publish(routing_key, order_data)
-                if success:
-                    logger.info(f"Successfully published {routing_key} event: {order_data}")
-                    client.close()
-                    return True
-                logger.warning(f"Attempt {attempt + 1} failed to publish {routing_key}")
-            except Exception as e:
-                logger.error(f"Attempt {attempt + 1} error: {str(e)}", exc_info=True)
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-        logger.error(f"Failed to publish {routing_key} after {max_retries} attempts")
-        client.close()
-        return False
-    except Exception as e:
-        logger.error(f"Error initializing client for {routing_key}: {str(e)}", exc_info=True)
-        return False
+        message = json.loads(body)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in message: {body}, error: {str(e)}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+    apply_wallet_reply(method.routing_key, message)
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+# Các queue được chạy bởi `manage.py run_consumers`
+CONSUMER_QUEUES = [
+    QueueSpec(
+        'order_service_queue',
+        routing_keys=['product.stock_changed', 'product.updated', 'product.deleted', 'user.updated'],
+        on_message=message_callback
+    ),
+    QueueSpec(
+        'order_service_wallet_queue',
+        routing_keys=['wallet.reserved', 'wallet.reservation_failed'],
+        on_message=wallet_reply_callback,
+        prefetch_count=10
+    ),
+]
 
 def start_consumer_thread():
     """
@@ -0,0 +1,74 @@
+import threading
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import TrangThai
+
+
+class StatusCache:
+    """
+    Cache cấp process cho các dòng TrangThai (bảng nhỏ, gần như không đổi).
+
+    Tra theo tên hoặc theo mã; chỉ truy vấn DB ở lần đầu. Cache bị xóa khi TrangThai
+    được lưu/xóa trong process này (các process khác tự nạp lại sau khi khởi động lại).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_id = {}
+
+    def _remember(self, trang_thai):
+        with self._lock:
+            self._by_name[trang_thai.TenTrangThai] = trang_thai
+            self._by_id[trang_thai.MaTrangThai] = trang_thai
+
+    def get_by_name(self, name, loai=None):
+        """
+        Lấy trạng thái theo tên. Nếu có loai thì tạo mới khi chưa tồn tại (như get_or_create),
+        ngược lại raise TrangThai.DoesNotExist.
+        """
+        trang_thai = self._by_name.get(name)
+        if trang_thai is not None:
+            return trang_thai
+        if loai is None:
+            trang_thai = TrangThai.objects.get(TenTrangThai=name)
+        else:
+            trang_thai, created = TrangThai.objects.get_or_create(
+                TenTrangThai=name,
+                defaults={'LoaiTrangThai': loai}
+            )
+            if created:
+                # Dòng mới chỉ được cache khi transaction tạo ra nó đã commit
+                transaction.on_commit(lambda: self._remember(trang_thai))
+                return trang_thai
+        self._remember(trang_thai)
+        return trang_thai
+
+    def get_by_id(self, ma_trang_thai):
+        """
+        Lấy trạng thái theo mã; raise TrangThai.DoesNotExist nếu không tồn tại
+        """
+        try:
+            key = int(ma_trang_thai)
+        except (TypeError, ValueError):
+            raise TrangThai.DoesNotExist(f"MaTrangThai không hợp lệ: {ma_trang_thai}")
+        trang_thai = self._by_id.get(key)
+        if trang_thai is None:
+            trang_thai = TrangThai.objects.get(MaTrangThai=key)
+            self._remember(trang_thai)
+        return trang_thai
+
+    def clear(self):
+        with self._lock:
+            self._by_name.clear()
+            self._by_id.clear()
+
+
+status_cache = StatusCache()
+
+
+@receiver(post_save, sender=TrangThai)
+@receiver(post_delete, sender=TrangThai)
+def clear_status_cache(sender, **kwargs):
+    status_cache.clear()
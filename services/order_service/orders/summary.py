@@ -0,0 +1,136 @@
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import DonHang, TongHopDonHang
+
+logger = logging.getLogger(__name__)
+
+
+def bump(user_id, status_id, count, amount):
+    """
+    Cộng dồn (count, amount) vào dòng tổng hợp (user_id, status_id) bằng UPDATE ... SET x = x + n;
+    tạo dòng nếu chưa có.
+    """
+    rows = TongHopDonHang.objects.filter(MaNguoiDung=user_id, MaTrangThai_id=status_id)
+    if rows.update(SoDonHang=F('SoDonHang') + count, TongTien=F('TongTien') + amount):
+        return
+    try:
+        with transaction.atomic():
+            TongHopDonHang.objects.create(
+                MaNguoiDung=user_id, MaTrangThai_id=status_id, SoDonHang=count, TongTien=amount
+            )
+    except IntegrityError:
+        # Một transaction khác vừa tạo dòng này
+        rows.update(SoDonHang=F('SoDonHang') + count, TongTien=F('TongTien') + amount)
+
+
+def move_orders(order_ids, user_ids, from_status_id, to_status_id):
+    """
+    Cập nhật bảng tổng hợp sau khi các đơn hàng order_ids (của các người dùng user_ids) được chuyển
+    từ from_status_id sang to_status_id bằng QuerySet.update() (không phát signal).
+
+    Số câu truy vấn không phụ thuộc số đơn hàng: số đơn và tổng tiền chuyển đi của từng người dùng
+    được tính bằng subquery trên DonHang ngay trong câu UPDATE.
+    """
+    user_ids = set(user_ids)
+    TongHopDonHang.objects.bulk_create([
+        TongHopDonHang(MaNguoiDung=user_id, MaTrangThai_id=to_status_id) for user_id in user_ids
+    ], ignore_conflicts=True)
+    moved = DonHang.objects.filter(
+        MaDonHang__in=order_ids, MaNguoiDung=OuterRef('MaNguoiDung')
+    ).order_by().values('MaNguoiDung')
+    count = Subquery(moved.annotate(count=Count('MaDonHang')).values('count'))
+    amount = Subquery(moved.annotate(total=Sum('TongTien')).values('total'))
+    rows = TongHopDonHang.objects.filter(MaNguoiDung__in=user_ids)
+    rows.filter(MaTrangThai_id=from_status_id).update(
+        SoDonHang=F('SoDonHang') - count, TongTien=F('TongTien') - amount
+    )
+    rows.filter(MaTrangThai_id=to_status_id).update(
+        SoDonHang=F('SoDonHang') + count, TongTien=F('TongTien') + amount
+    )
+
+
+@receiver(pre_save, sender=DonHang)
+def remember_previous_summary_key(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._summary_previous = None
+        return
+    previous = getattr(instance, '_summary_key', None)
+    if previous is None:
+        # Đơn hàng được đọc với field bị defer: lấy giá trị cũ từ DB
+        previous = DonHang.objects.filter(pk=instance.pk).values_list(
+            'MaNguoiDung', 'MaTrangThai_id', 'TongTien'
+        ).first()
+    instance._summary_previous = previous
+
+
+@receiver(post_save, sender=DonHang)
+def update_summary_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_summary_previous', None)
+    current = (instance.MaNguoiDung, instance.MaTrangThai_id, instance.TongTien)
+    if previous == current:
+        return
+    with transaction.atomic():
+        if previous is not None:
+            bump(previous[0], previous[1], -1, -previous[2])
+        bump(current[0], current[1], 1, current[2])
+    instance._summary_key = current
+
+
+@receiver(post_delete, sender=DonHang)
+def update_summary_on_delete(sender, instance, **kwargs):
+    bump(instance.MaNguoiDung, instance.MaTrangThai_id, -1, -instance.TongTien)
+
+
+def get_user_summary(user_id):
+    """
+    Tổng quan đơn hàng của một người dùng từ bảng tổng hợp: một truy vấn trên tối đa
+    (số trạng thái) dòng, không quét DonHang.
+    """
+    rows = TongHopDonHang.objects.filter(MaNguoiDung=user_id, SoDonHang__gt=0).select_related(
+        'MaTrangThai'
+    ).order_by('MaTrangThai_id')
+    total_orders = 0
+    total_amount = 0
+    status_summary = []
+    for row in rows:
+        total_orders += row.SoDonHang
+        total_amount += row.TongTien
+        status_summary.append({
+            'MaTrangThai__TenTrangThai': row.MaTrangThai.TenTrangThai,
+            'count': row.SoDonHang,
+            'total_amount': float(row.TongTien),
+        })
+    return {
+        'total_orders': total_orders,
+        'total_amount': float(total_amount),
+        'order_status_summary': status_summary,
+    }
+
+
+def rebuild_summaries(user_ids=None):
+    """
+    Tính lại bảng tổng hợp từ DonHang (dùng khi khởi tạo hoặc sửa lệch); trả về số dòng đã ghi
+    """
+    orders = DonHang.objects.all()
+    existing = TongHopDonHang.objects.all()
+    if user_ids is not None:
+        orders = orders.filter(MaNguoiDung__in=user_ids)
+        existing = existing.filter(MaNguoiDung__in=user_ids)
+    aggregates = orders.values('MaNguoiDung', 'MaTrangThai_id').annotate(
+        count=Count('MaDonHang'), total=Sum('TongTien')
+    ).order_by()
+    with transaction.atomic():
+        existing.delete()
+        rows = TongHopDonHang.objects.bulk_create([
+            TongHopDonHang(
+                MaNguoiDung=row['MaNguoiDung'],
+                MaTrangThai_id=row['MaTrangThai_id'],
+                SoDonHang=row['count'],
+                TongTien=row['total'] or 0
+            ) for row in aggregates
+        ], batch_size=1000)
+    logger.info(f"Đã tính lại {len(rows)} dòng tổng hợp đơn hàng")
+    return len(rows)
@@ -1,3 +1,409 @@
-from django.test import TestCase
+import importlib.util
+import io
+import time
+from pathlib import Path
+from unittest import mock
+import jwt
+import pika
+from django.conf import settings
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .fulfilment import WAITING_STOCK, allocate, fulfil_pending_orders, handle_stock_changed
+from .middleware import JWTAuthentication, TokenUser, verified_tokens
+from .models import ChiTietDonHang, DonHang, OutboxEvent, TrangThai
+from .outbox import OutboxRelay, enqueue_events
+from .query_plans import explain
+from .statuses import status_cache
+from .summary import get_user_summary, rebuild_summaries
+from .views import CreateOrderView, get_user_order_info, list_orders, outbox_metrics
+from .wallet import apply_wallet_reply
 
-# Create your tests here.
+
+class JWTAuthenticationTest(TestCase):
+    """
+    Kiểm tra key ring theo kid và cache token đã xác thực
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.auth = JWTAuthentication()
+        verified_tokens.clear()
+
+    def _token(self, key=None, headers=None, **claims):
+        payload = {'token_type': 'access', 'user_id': 7, 'jti': 'abc', 'exp': int(time.time()) + 60}
+        payload.update(claims)
+        return jwt.encode(payload, key or settings.JWT_SECRET_KEY, algorithm='HS256', headers=headers)
+
+    def _authenticate(self, token):
+        return self.auth.authenticate(self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    def test_single_verification_then_cache(self):
+        token = self._token()
+        with mock.patch('orders.middleware.jwt.decode', wraps=jwt.decode) as decode:
+            user, _ = self._authenticate(token)
+            self.assertIsInstance(user, TokenUser)
+            self.assertEqual(user.id, 7)
+            self.assertTrue(user.is_authenticated)
+            self.assertIs(self._authenticate(token)[0], user)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_key_selected_by_kid(self):
+        with override_settings(JWT_KEYS={'default': settings.JWT_SECRET_KEY, 'k2': 'khoa-moi'}):
+            user, _ = self._authenticate(self._token(key='khoa-moi', headers={'kid': 'k2'}))
+            self.assertEqual(user.id, 7)
+            with self.assertRaises(AuthenticationFailed):
+                self._authenticate(self._token(key='khoa-moi', headers={'kid': 'khong-co'}))
+
+    def test_rejects_bad_tokens(self):
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(self._token(key='khoa-sai'))
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(self._token(exp=int(time.time()) - 1))
+        # Chữ ký hợp lệ nhưng payload bị sửa không được lấy từ cache
+        token = self._token()
+        self._authenticate(token)
+        header, _, signature = token.split('.')
+        forged_payload = self._token(user_id=1).split('.')[1]
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(f"{header}.{forged_payload}.{signature}")
+
+
+def post_order(size, payment_method='COD'):
+    request = APIRequestFactory().post('/api/orders/create/', {
+        'user_id': 7,
+        'recipient_name': 'A',
+        'phone_number': '0900000000',
+        'address': 'HN',
+        'payment_method': payment_method,
+        'items': [
+            {'id': product_id, 'name': f'SP {product_id}', 'price': 1000, 'quantity': 2}
+            for product_id in range(1, size + 1)
+        ],
+    }, format='json')
+    force_authenticate(request, user=TokenUser(7))
+    return CreateOrderView.as_view()(request)
+
+
+class CreateOrderViewTest(TestCase):
+    """
+    Tạo đơn hàng: số câu truy vấn không phụ thuộc số dòng sản phẩm
+    """
+    def setUp(self):
+        status_cache.clear()
+
+    def test_constant_queries_and_bulk_items(self):
+        post_order(1)  # lần đầu nạp cache TrangThai
+        with CaptureQueriesContext(connection) as small:
+            post_order(1)
+        with CaptureQueriesContext(connection) as large:
+            response = post_order(50)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        order = DonHang.objects.get(MaDonHang=response.data['order_id'])
+        self.assertEqual(order.TongTien, 100000)
+        self.assertEqual(ChiTietDonHang.objects.filter(MaDonHang=order).count(), 50)
+        event = OutboxEvent.objects.order_by('-id').first()
+        self.assertEqual(event.routing_key, 'order.created')
+        self.assertEqual(len(event.payload['items']), 50)
+
+    def test_status_cache(self):
+        trang_thai = TrangThai.objects.create(TenTrangThai='Đã giao', LoaiTrangThai='Đơn hàng')
+        status_cache.get_by_id(trang_thai.MaTrangThai)
+        with self.assertNumQueries(0):
+            self.assertEqual(status_cache.get_by_name('Đã giao'), trang_thai)
+        trang_thai.TenTrangThai = 'Đã nhận'
+        trang_thai.save()  # signal xóa cache
+        with self.assertRaises(TrangThai.DoesNotExist):
+            status_cache.get_by_name('Đã giao')
+        with self.assertRaises(TrangThai.DoesNotExist):
+            status_cache.get_by_id('abc')
+
+
+class WalletReservationTest(TestCase):
+    """
+    Đơn hàng ví điện tử: tạo ở Chờ thanh toán, kết quả giữ tiền từ auth_service cập nhật trạng thái
+    """
+    def setUp(self):
+        status_cache.clear()
+
+    def _events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('routing_key', flat=True))
+
+    def test_order_created_pending_with_reserve_command(self):
+        with mock.patch('requests.Session.request') as http_request:
+            response = post_order(2, payment_method='ewallet')
+        http_request.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['order_status'], 'Chờ thanh toán')
+        self.assertEqual(self._events(), ['order.created', 'wallet.reserve'])
+        command = OutboxEvent.objects.get(routing_key='wallet.reserve').payload
+        self.assertEqual((command['order_id'], command['user_id']), (response.data['order_id'], 7))
+
+    def test_reserved_then_duplicate(self):
+        order_id = post_order(1, payment_method='ewallet').data['order_id']
+        apply_wallet_reply('wallet.reserved', {'order_id': order_id})
+        apply_wallet_reply('wallet.reserved', {'order_id': order_id})
+        self.assertEqual(DonHang.objects.get(MaDonHang=order_id).MaTrangThai.TenTrangThai, 'Đã thanh toán')
+        self.assertEqual(self._events(), ['order.created', 'wallet.reserve', 'wallet.confirm', 'order.status_updated'])
+
+    def test_failed_cancels_order(self):
+        order_id = post_order(1, payment_method='ewallet').data['order_id']
+        apply_wallet_reply('wallet.reservation_failed', {'order_id': order_id, 'reason': 'Số dư không đủ'})
+        self.assertEqual(DonHang.objects.get(MaDonHang=order_id).MaTrangThai.TenTrangThai, 'Đã hủy')
+        self.assertEqual(self._events()[-2:], ['order.status_updated', 'order.cancelled'])
+        # Tiền giữ muộn cho đơn đã hủy được hoàn lại
+        apply_wallet_reply('wallet.reserved', {'order_id': order_id})
+        self.assertEqual(self._events()[-1], 'wallet.release')
+
+
+class UserOrderSummaryTest(TestCase):
+    """
+    Tổng quan đơn hàng theo người dùng: bảng tổng hợp luôn khớp với DonHang
+    """
+    def setUp(self):
+        status_cache.clear()
+
+    def _expected(self):
+        orders = DonHang.objects.filter(MaNguoiDung=7)
+        by_status = {}
+        for order in orders.select_related('MaTrangThai'):
+            count, amount = by_status.get(order.MaTrangThai.TenTrangThai, (0, 0))
+            by_status[order.MaTrangThai.TenTrangThai] = (count + 1, amount + float(order.TongTien))
+        return orders.count(), sum(float(order.TongTien) for order in orders), by_status
+
+    def _actual(self):
+        summary = get_user_summary(7)
+        by_status = {
+            row['MaTrangThai__TenTrangThai']: (row['count'], row['total_amount'])
+            for row in summary['order_status_summary']
+        }
+        return summary['total_orders'], summary['total_amount'], by_status
+
+    def _get_info(self, **params):
+        request = APIRequestFactory().get('/api/orders/user/7/info/', params, HTTP_HOST='localhost')
+        force_authenticate(request, user=TokenUser(7))
+        return get_user_order_info(request, user_id=7)
+
+    def test_summary_follows_create_status_change_and_delete(self):
+        post_order(1)
+        post_order(3)
+        paid_id = post_order(2, payment_method='ewallet').data['order_id']
+        cancelled_id = post_order(1, payment_method='ewallet').data['order_id']
+        apply_wallet_reply('wallet.reserved', {'order_id': paid_id})
+        apply_wallet_reply('wallet.reservation_failed', {'order_id': cancelled_id})
+        order = DonHang.objects.get(MaDonHang=paid_id)
+        order.TongTien = 500
+        order.save()
+        DonHang.objects.filter(MaDonHang=cancelled_id).first().delete()
+        self.assertEqual(self._actual(), self._expected())
+        self.assertEqual(self._actual()[0], 3)
+
+        rebuild_summaries([7])
+        self.assertEqual(self._actual(), self._expected())
+
+    def test_info_without_orders_is_single_query(self):
+        for size in (1, 2, 3):
+            post_order(size)
+        with self.assertNumQueries(1):
+            response = self._get_info()
+        self.assertEqual(response.data['total_orders'], 3)
+        self.assertEqual(response.data['total_amount'], 12000.0)
+        self.assertNotIn('orders', response.data)
+
+    def test_info_orders_paginated_on_request(self):
+        for size in (1, 2, 3):
+            post_order(size)
+        response = self._get_info(include_orders='true', page_size=2)
+        self.assertEqual(len(response.data['orders']), 2)
+        self.assertIsNotNone(response.data['next'])
+        response = self._get_info(include_orders='true', all='true')
+        self.assertEqual(len(response.data['orders']), 3)
+
+    def test_invalid_cursor_is_not_found(self):
+        post_order(1)
+        response = self._get_info(include_orders='true', cursor='khong-hop-le')
+        self.assertEqual(response.status_code, 404)
+        response = list_orders(APIRequestFactory().get('/api/orders/', {'cursor': 'khong-hop-le'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTest(TestCase):
+    """
+    Các truy vấn nóng đã đăng ký đều đi qua index
+    """
+    def test_hot_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('check_query_plans', orders=300, users=20, products=10, stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+        self.assertFalse(DonHang.objects.exists())  # dữ liệu mẫu đã được rollback
+
+    def test_full_scan_detected(self):
+        plan, full_scans = explain(DonHang.objects.filter(DiaChi='HN'))
+        self.assertEqual(full_scans, ['DonHang'])
+
+
+class StockFulfilmentTest(TestCase):
+    """
+    product.stock_changed: phân bổ hàng về cho các đơn đang chờ theo FIFO, số truy vấn không đổi
+    """
+    def setUp(self):
+        status_cache.clear()
+
+    def _waiting_orders(self, sizes):
+        waiting = status_cache.get_by_name(WAITING_STOCK, loai='Đơn hàng')
+        order_ids = []
+        for size in sizes:
+            order = DonHang.objects.get(MaDonHang=post_order(size).data['order_id'])
+            order.MaTrangThai = waiting
+            order.save()
+            order_ids.append(order.MaDonHang)
+        return order_ids
+
+    def test_allocate_fifo_skips_orders_that_do_not_fit(self):
+        self.assertEqual(allocate([(1, 3), (2, 1), (3, 1), (4, 1)], 2), [2, 3])
+        self.assertEqual(allocate([(1, 2), (2, 2)], 0), [])
+
+    def test_fulfil_updates_orders_summary_and_outbox(self):
+        # Mỗi đơn cần 2 sản phẩm #1: 5 hàng về đủ cho hai đơn đầu
+        order_ids = self._waiting_orders([1, 3, 1, 2])
+        OutboxEvent.objects.all().delete()
+        self.assertEqual(fulfil_pending_orders(1, 5), order_ids[:2])
+
+        statuses = dict(DonHang.objects.values_list('MaDonHang', 'MaTrangThai__TenTrangThai'))
+        self.assertEqual([statuses[order_id] for order_id in order_ids],
+                         ['Đang xử lý', 'Đang xử lý', WAITING_STOCK, WAITING_STOCK])
+        events = list(OutboxEvent.objects.order_by('id'))
+        self.assertEqual([event.payload['order_id'] for event in events], order_ids[:2])
+        self.assertEqual(len(events[1].payload['items']), 3)
+        summary = {row['MaTrangThai__TenTrangThai']: row['count'] for row in get_user_summary(7)['order_status_summary']}
+        self.assertEqual(summary, {'Đang xử lý': 2, WAITING_STOCK: 2})
+        # Đơn đã chuyển trạng thái không bị phân bổ lại
+        self.assertEqual(fulfil_pending_orders(1, 2), order_ids[2:3])
+
+    def test_order_that_left_waiting_is_not_moved(self):
+        order_ids = self._waiting_orders([1, 1])
+        OutboxEvent.objects.all().delete()
+        cancelled = TrangThai.objects.create(TenTrangThai='Đã hủy', LoaiTrangThai='Đơn hàng')
+        status_cache.clear()
+
+        def allocate_then_cancel(pending_items, stock):
+            # Đơn đầu bị hủy giữa lúc đọc các dòng chờ và lúc chuyển trạng thái
+            DonHang.objects.filter(MaDonHang=order_ids[0]).update(MaTrangThai=cancelled)
+            return allocate(pending_items, stock)
+
+        with mock.patch('orders.fulfilment.allocate', side_effect=allocate_then_cancel):
+            self.assertEqual(fulfil_pending_orders(1, 10), order_ids[1:])
+        statuses = dict(DonHang.objects.values_list('MaDonHang', 'MaTrangThai__TenTrangThai'))
+        self.assertEqual([statuses[order_id] for order_id in order_ids], ['Đã hủy', 'Đang xử lý'])
+        self.assertEqual([event.payload['order_id'] for event in OutboxEvent.objects.all()], order_ids[1:])
+        summary = {row['MaTrangThai__TenTrangThai']: row['count'] for row in get_user_summary(7)['order_status_summary']}
+        self.assertEqual(summary['Đang xử lý'], 1)
+
+    def test_stock_changed_allocates_only_the_increase(self):
+        # Mỗi đơn cần 2 sản phẩm #1
+        order_ids = self._waiting_orders([1, 1, 1])
+        message = {'event_id': 'a1', 'product_id': 1, 'old_stock': 10, 'new_stock': 7}
+        # Giảm tồn kho (trừ kho cho đơn khác): không đơn nào được chuyển
+        self.assertEqual(handle_stock_changed(message), [])
+        self.assertEqual(handle_stock_changed(dict(message, event_id='a2', old_stock=7, new_stock=7)), [])
+
+        # Tồn kho 7 -> 11: chỉ 4 hàng mới về được phân bổ (hai đơn), không phải 11
+        message = {'event_id': 'b1', 'product_id': 1, 'old_stock': 7, 'new_stock': 11}
+        self.assertEqual(handle_stock_changed(message), order_ids[:2])
+        # Message được gửi lại không phân bổ lại
+        self.assertEqual(handle_stock_changed(message), [])
+        self.assertEqual(handle_stock_changed({'product_id': 1, 'new_stock': 5}), [])
+        statuses = dict(DonHang.objects.values_list('MaDonHang', 'MaTrangThai__TenTrangThai'))
+        self.assertEqual(statuses[order_ids[2]], WAITING_STOCK)
+
+    def test_constant_queries(self):
+        self._waiting_orders([1] * 2)
+        # Nạp lại cache TrangThai (bị xóa khi tạo trạng thái chờ)
+        status_cache.get_by_name(WAITING_STOCK)
+        status_cache.get_by_name('Đang xử lý')
+        with CaptureQueriesContext(connection) as small:
+            fulfil_pending_orders(1, 100)
+        self._waiting_orders([1] * 20)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(len(fulfil_pending_orders(1, 100)), 20)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class FakeConfirmBroker:
+    """
+    Kênh/kết nối RabbitMQ giả: publish mất 2ms, broker ack cả lô (multiple=True) khi relay chờ xác nhận
+    """
+    def __init__(self, relay):
+        self.relay = relay
+        self.published = 0
+        self.waits = 0
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        time.sleep(0.002)
+        self.published += 1
+
+    def process_data_events(self, time_limit=None):
+        self.waits += 1
+        self.relay._on_confirm(mock.Mock(method=pika.spec.Basic.Ack(delivery_tag=self.published, multiple=True)))
+
+
+class OutboxRelayMetricsTest(TestCase):
+    """
+    Relay ghi độ trễ publish→confirm của từng sự kiện; /events/outbox/ tổng hợp theo cửa sổ thời gian
+    """
+    def _metrics(self, query=''):
+        response = outbox_metrics(APIRequestFactory().get('/api/orders/events/outbox/' + query))
+        return response.status_code, response.data.get('metrics')
+
+    def test_confirm_latency_recorded_and_reported(self):
+        enqueue_events('order.updated', [{'order_id': order_id} for order_id in range(3)])
+        relay = OutboxRelay(batch_size=10)
+        relay._connection = broker = FakeConfirmBroker(relay)
+        with mock.patch.object(OutboxRelay, '_get_channel', return_value=broker):
+            self.assertEqual(relay.relay_batch(), 3)
+        self.assertEqual(broker.waits, 1)
+
+        latencies = list(OutboxEvent.objects.values_list('confirm_latency_ms', flat=True))
+        self.assertTrue(all(latency >= 2 for latency in latencies))
+
+        status_code, metrics = self._metrics('?window=60')
+        self.assertEqual(status_code, 200)
+        self.assertEqual((metrics['pending'], metrics['published'], metrics['window_seconds']), (0, 3, 60))
+        self.assertEqual(metrics['confirm_latency_max_ms'], max(latencies))
+        self.assertIn(metrics['confirm_latency_p95_ms'], latencies)
+
+    def test_parked_events_reported_apart(self):
+        enqueue_events('order.updated', [{'order_id': order_id} for order_id in range(3)])
+        OutboxEvent.objects.filter(payload__order_id=0).update(attempts=5, failed_at=timezone.now())
+        _, metrics = self._metrics()
+        self.assertEqual((metrics['pending'], metrics['parked']), (2, 1))
+
+    def test_empty_window_and_invalid_param(self):
+        status_code, metrics = self._metrics()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(metrics['published'], 0)
+        self.assertIsNone(metrics['confirm_latency_avg_ms'])
+        self.assertEqual(self._metrics('?window=abc')[0], 400)
+
+
+class SharedModuleCopyTest(SimpleTestCase):
+    """
+    Các module dùng chung trong service này khớp bản gốc ở services/common/ (services/common/sync_copies.py)
+    """
+    def test_matches_common(self):
+        script = Path(__file__).resolve().parents[2] / 'common' / 'sync_copies.py'
+        if not script.exists():
+            self.skipTest('Không có services/common (chạy trong container của service)')
+        spec = importlib.util.spec_from_file_location('sync_copies', script)
+        sync_copies = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sync_copies)
+        service = Path(__file__).resolve().parents[1]
+        stale = [
+            str(copy.relative_to(sync_copies.SERVICES_DIR))
+            for _, copy in sync_copies.stale_copies() if service in copy.parents
+        ]
+        self.assertEqual(stale, [], 'Bản sao lệch với bản gốc, chạy python services/common/sync_copies.py')
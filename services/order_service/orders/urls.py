@@ -13,6 +13,7 @@ urlpatterns = [
     path('details/<int:order_id>/', views.get_order_details, name='order-details'),
     path('count-orders/', views.count_orders, name='count-orders'),
     path('list-orders/', views.list_orders, name='list-orders'),
+    path('events/outbox/', views.outbox_metrics, name='outbox-metrics'),
 
     path('update-status/<int:order_id>/', views.update_order_status, name='update_order_status'),
 ]
\ No newline at end of file
@@ -1,15 +1,21 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .rabbitmq import publish_order_event
-from .models import DonHang, ChiTietDonHang, TrangThai
+from .models import DonHang, ChiTietDonHang, TrangThai, OutboxEvent
 from .serializers import DonHangSerializer, ChiTietDonHangSerializer, CreateOrderSerializer
-from django.db.models import Sum, Count
+from .pagination import KeysetPagination
+from .statuses import status_cache
+from .summary import get_user_summary
+from .wallet import PENDING_PAYMENT, request_wallet_reservation
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
 import json
 import logging
-import requests
 from decimal import Decimal
 
 logger = logging.getLogger(__name__)
@@ -36,12 +42,26 @@ def count_orders(request):
 def list_orders(request):
     """API lấy danh sách tất cả đơn hàng"""
     try:
-        orders = DonHang.objects.all().order_by('-NgayDatHang')
-        serializer = DonHangSerializer(orders, many=True)
+        orders = DonHang.objects.prefetch_related('chi_tiet').order_by('-NgayDatHang', '-MaDonHang')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request)
+        if page is None:
+            # Chế độ cũ (?all=true): trả về toàn bộ đơn hàng
+            serializer = DonHangSerializer(orders, many=True)
+            return Response({
+                'status': 'success',
+                'orders': serializer.data
+            }, status=status.HTTP_200_OK)
+
+        serializer = DonHangSerializer(page, many=True)
         return Response({
             'status': 'success',
-            'orders': serializer.data
+            'orders': serializer.data,
+            'next': paginator.get_next_link()
         }, status=status.HTTP_200_OK)
+    except APIException:
+        # Lỗi của DRF (vd. NotFound khi cursor không hợp lệ) giữ nguyên mã lỗi
+        raise
     except Exception as e:
         logger.error(f"Lỗi khi lấy danh sách đơn hàng: {str(e)}", exc_info=True)
         return Response({
@@ -53,30 +73,32 @@ def list_orders(request):
 @permission_classes([IsAuthenticated])
 def get_user_order_info(request, user_id):
     """
-    API lấy thông tin tổng quan về các đơn hàng của một người dùng
+    API lấy thông tin tổng quan về các đơn hàng của một người dùng.
+
+    Tổng quan được đọc từ bảng TongHopDonHang (cập nhật dần khi tạo đơn / đổi trạng thái).
+    Danh sách đơn hàng chỉ trả về khi có ?include_orders=true, theo trang (cursor) như list_orders.
     """
     try:
-        orders = DonHang.objects.filter(MaNguoiDung=user_id).order_by('-NgayDatHang')
-        total_orders = orders.count()
-        total_amount = orders.aggregate(total=Sum('TongTien'))['total'] or 0.0
-        orders_serializer = DonHangSerializer(orders, many=True)
-        order_status_summary = orders.values('MaTrangThai__TenTrangThai').annotate(
-            count=Count('MaDonHang'),
-            total_amount=Sum('TongTien')
-        )
-        order_status_summary_list = []
-        for summary in order_status_summary:
-            summary_dict = dict(summary)
-            summary_dict['total_amount'] = float(summary_dict['total_amount']) if summary_dict['total_amount'] is not None else 0.0
-            order_status_summary_list.append(summary_dict)
-        
-        return Response({
-            'status': 'success',
-            'total_orders': total_orders,
-            'total_amount': float(total_amount),
-            'orders': orders_serializer.data,
-            'order_status_summary': order_status_summary_list
-        }, status=status.HTTP_200_OK)
+        data = {'status': 'success'}
+        data.update(get_user_summary(user_id))
+
+        if request.query_params.get('include_orders', '').lower() in ('1', 'true', 'yes'):
+            orders = DonHang.objects.filter(MaNguoiDung=user_id).prefetch_related('chi_tiet').order_by(
+                '-NgayDatHang', '-MaDonHang'
+            )
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(orders, request)
+            if page is None:
+                # ?all=true: trả về toàn bộ đơn hàng như trước
+                data['orders'] = DonHangSerializer(orders, many=True).data
+            else:
+                data['orders'] = DonHangSerializer(page, many=True).data
+                data['next'] = paginator.get_next_link()
+
+        return Response(data, status=status.HTTP_200_OK)
+    except APIException:
+        # Lỗi của DRF (vd. NotFound khi cursor không hợp lệ) giữ nguyên mã lỗi
+        raise
     except Exception as e:
         logger.error(f"Lỗi khi lấy thông tin đơn hàng theo user ID: {str(e)}", exc_info=True)
         return Response({
@@ -87,10 +109,11 @@ def get_user_order_info(request, user_id):
 class DonHangViewSet(viewsets.ModelViewSet):
     queryset = DonHang.objects.all()
     serializer_class = DonHangSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """Lọc đơn hàng theo người dùng nếu có tham số user_id"""
-        queryset = DonHang.objects.all()
+        queryset = DonHang.objects.prefetch_related('chi_tiet')
         user_id = self.request.query_params.get('user_id')
         if user_id:
             queryset = queryset.filter(MaNguoiDung=user_id)
@@ -129,10 +152,7 @@ class CreateOrderView(APIView):
             logger.info(f"Dữ liệu hợp lệ: {data}")
 
             try:
-                trang_thai, created = TrangThai.objects.get_or_create(
-                    TenTrangThai="Đang xử lý",
-                    defaults={'LoaiTrangThai': 'Đơn hàng'}
-                )
+                trang_thai = status_cache.get_by_name("Đang xử lý", loai='Đơn hàng')
 
                 total_amount = Decimal('0')
                 for item in data['items']:
@@ -160,94 +180,69 @@ class CreateOrderView(APIView):
 
                 logger.info(f"Tổng tiền đơn hàng: {total_amount}")
 
-                if data.get('payment_method', '').lower() == 'ewallet':
-                    auth_header = request.META.get('HTTP_AUTHORIZATION') or request.headers.get('Authorization')
-                    if not auth_header:
-                        logger.warning("Thiếu Authorization header khi gọi API ví điện tử")
-
-                    headers = {
-                        'Authorization': auth_header,
-                        'Content-Type': 'application/json'
-                    }
-
-                    logger.info(f"Gửi request tới ewallet với headers: {headers}, body: {{'tongtien': {float(total_amount)}}}")
-
-                    try:
-                        ewallet_response = requests.post(
-                            'http://api_gateway:8000/api/auth/balance/reduce/',
-                            json={'tongtien': float(total_amount)},
-                            headers=headers
-                        )
-
-                        logger.info(f"Mã trạng thái: {ewallet_response.status_code}")
-                        logger.info(f"Nội dung phản hồi: {ewallet_response.text}")
-
-                        if ewallet_response.status_code != 200:
-                            logger.error(f"Lỗi thanh toán ví điện tử: {ewallet_response.text}")
-                            try:
-                                error_details = ewallet_response.json()
-                            except ValueError:
-                                error_details = {'message': 'Không thể phân tích phản hồi từ API trừ tiền'}
-                            return Response({
-                                'status': 'error',
-                                'message': error_details.get('message', 'Thanh toán bằng ví điện tử thất bại'),
-                                'error_details': error_details
-                            }, status=status.HTTP_400_BAD_REQUEST)
-
-                    except requests.RequestException as e:
-                        logger.error(f"Lỗi kết nối API trừ tiền: {str(e)}")
+                # Ví điện tử: không chờ auth_service trừ tiền; đơn hàng tạo ở trạng thái Chờ thanh toán,
+                # lệnh giữ tiền đi qua RabbitMQ và kết quả trả về sẽ cập nhật trạng thái đơn hàng
+                is_ewallet = data.get('payment_method', '').lower() == 'ewallet'
+                if is_ewallet:
+                    if not token_user_id:
                         return Response({
                             'status': 'error',
-                            'message': 'Lỗi kết nối thanh toán'
-                        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                don_hang = DonHang.objects.create(
-                    MaNguoiDung=data['user_id'],
-                    MaTrangThai=trang_thai,
-                    TongTien=total_amount,
-                    DiaChi=data['address'],
-                    TenNguoiNhan=data['recipient_name'],
-                    SoDienThoai=data['phone_number'],
-                    PhuongThucThanhToan=data['payment_method']
-                )
-
-                chi_tiet_items = []
-                for item in data['items']:
-                    price = item.get('price', item.get('GiaBan', item.get('GiaSanPham', 0)))
-                    ten_san_pham = item.get('name', item.get('TenSanPham', ''))
-                    hinh_anh = item.get('image_url', item.get('HinhAnh_URL', ''))
-
-                    chi_tiet = ChiTietDonHang.objects.create(
-                        MaDonHang=don_hang,
-                        MaSanPham=item.get('id'),
-                        SoLuong=item.get('quantity', 1),
-                        GiaSanPham=price,
-                        TenSanPham=ten_san_pham,
-                        HinhAnh=hinh_anh
+                            'message': 'Cần đăng nhập để thanh toán bằng ví điện tử'
+                        }, status=status.HTTP_401_UNAUTHORIZED)
+                    trang_thai = status_cache.get_by_name(PENDING_PAYMENT, loai='Đơn hàng')
+
+                # Đơn hàng, chi tiết và sự kiện outbox được ghi trong cùng một transaction
+                with transaction.atomic():
+                    don_hang = DonHang.objects.create(
+                        MaNguoiDung=data['user_id'],
+                        MaTrangThai=trang_thai,
+                        TongTien=total_amount,
+                        DiaChi=data['address'],
+                        TenNguoiNhan=data['recipient_name'],
+                        SoDienThoai=data['phone_number'],
+                        PhuongThucThanhToan=data['payment_method']
                     )
-                    chi_tiet_items.append({
-                        'product_id': chi_tiet.MaSanPham,
-                        'quantity': chi_tiet.SoLuong
-                    })
 
-                order_data = {
-                    'order_id': don_hang.MaDonHang,
-                    'user_id': don_hang.MaNguoiDung,
-                    'status': don_hang.MaTrangThai.TenTrangThai,
-                    'total_amount': float(don_hang.TongTien),
-                    'payment_method': don_hang.PhuongThucThanhToan,
-                    'recipient_name': don_hang.TenNguoiNhan,
-                    'phone_number': don_hang.SoDienThoai,
-                    'address': don_hang.DiaChi,
-                    'items': chi_tiet_items
-                }
-                publish_order_event('created', order_data)
-                logger.info(f"Đã gửi sự kiện order.created cho đơn hàng #{don_hang.MaDonHang}")
+                    chi_tiet_list = [
+                        ChiTietDonHang(
+                            MaDonHang=don_hang,
+                            MaSanPham=item.get('id'),
+                            SoLuong=item.get('quantity', 1),
+                            GiaSanPham=item.get('price', item.get('GiaBan', item.get('GiaSanPham', 0))),
+                            TenSanPham=item.get('name', item.get('TenSanPham', '')),
+                            HinhAnh=item.get('image_url', item.get('HinhAnh_URL', ''))
+                        )
+                        for item in data['items']
+                    ]
+                    # Một câu INSERT nhiều dòng cho toàn bộ chi tiết đơn hàng
+                    ChiTietDonHang.objects.bulk_create(chi_tiet_list)
+                    chi_tiet_items = [
+                        {'product_id': chi_tiet.MaSanPham, 'quantity': chi_tiet.SoLuong}
+                        for chi_tiet in chi_tiet_list
+                    ]
+
+                    order_data = {
+                        'order_id': don_hang.MaDonHang,
+                        'user_id': don_hang.MaNguoiDung,
+                        'status': don_hang.MaTrangThai.TenTrangThai,
+                        'total_amount': float(don_hang.TongTien),
+                        'payment_method': don_hang.PhuongThucThanhToan,
+                        'recipient_name': don_hang.TenNguoiNhan,
+                        'phone_number': don_hang.SoDienThoai,
+                        'address': don_hang.DiaChi,
+                        'items': chi_tiet_items
+                    }
+                    publish_order_event('created', order_data)
+                    if is_ewallet:
+                        request_wallet_reservation(don_hang, token_user_id)
+
+                logger.info(f"Đã ghi sự kiện order.created vào outbox cho đơn hàng #{don_hang.MaDonHang}")
 
                 return Response({
                     'order_id': don_hang.MaDonHang,
                     'status': 'success',
                     'message': 'Đơn hàng đã được tạo thành công',
+                    'order_status': don_hang.MaTrangThai.TenTrangThai,
                     'total_amount': float(don_hang.TongTien)
                 }, status=status.HTTP_201_CREATED)
 
@@ -291,6 +286,47 @@ def get_order_details(request, order_id):
             'message': 'Đơn hàng không tồn tại'
         }, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def outbox_metrics(request):
+    """
+    API xem tình trạng outbox: số sự kiện chờ gửi, sự kiện bị broker từ chối, sự kiện đã ngừng gửi
+    (failed_at), tuổi của sự kiện cũ nhất,
+    số sự kiện đã gửi và độ trễ publish→confirm của relay trong ?window= giây gần nhất (mặc định 300)
+    """
+    try:
+        window = max(1, min(int(request.query_params.get('window', 300)), 86400))
+    except (TypeError, ValueError):
+        return Response({
+            'status': 'error',
+            'message': 'window phải là số giây'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    now = timezone.now()
+    unpublished = OutboxEvent.objects.filter(published_at__isnull=True)
+    pending = unpublished.filter(failed_at__isnull=True)
+    oldest = pending.order_by('id').values_list('created_at', flat=True).first()
+    latencies = sorted(
+        OutboxEvent.objects.filter(
+            published_at__gte=now - timedelta(seconds=window), confirm_latency_ms__isnull=False
+        ).values_list('confirm_latency_ms', flat=True)
+    )
+    return Response({
+        'status': 'success',
+        'metrics': {
+            'pending': pending.count(),
+            'failed': pending.filter(attempts__gt=0).count(),
+            'parked': unpublished.filter(failed_at__isnull=False).count(),
+            'oldest_pending_age_seconds': (now - oldest).total_seconds() if oldest else None,
+            'window_seconds': window,
+            'published': len(latencies),
+            'published_per_second': round(len(latencies) / window, 3),
+            'confirm_latency_avg_ms': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'confirm_latency_p95_ms': latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            'confirm_latency_max_ms': latencies[-1] if latencies else None,
+        }
+    }, status=status.HTTP_200_OK)
+
 @api_view(['PUT'])
 @permission_classes([AllowAny])
 def update_order_status(request, order_id):
@@ -308,7 +344,7 @@ def update_order_status(request, order_id):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            new_status = TrangThai.objects.get(MaTrangThai=new_status_id)
+            new_status = status_cache.get_by_id(new_status_id)
         except TrangThai.DoesNotExist:
             logger.error(f"Trạng thái với MaTrangThai={new_status_id} không tồn tại")
             return Response({
@@ -341,49 +377,43 @@ def update_order_status(request, order_id):
                 'message': 'Đơn hàng đã giao chỉ có thể được cập nhật sang trạng thái hoàn tiền'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        order.MaTrangThai = new_status
-        order.save()
-        
-        # Prepare order items for the event
-        order_items = ChiTietDonHang.objects.filter(MaDonHang=order)
-        chi_tiet_items = [
-            {
-                'product_id': item.MaSanPham,
-                'quantity': item.SoLuong,
-                'price': float(item.GiaSanPham),
-                'name': item.TenSanPham,
-                'image_url': item.HinhAnh
-            } for item in order_items
-        ]
-        
-        # Prepare order data for events
-        order_data = {
-            'order_id': order.MaDonHang,
-            'user_id': order.MaNguoiDung,
-            'old_status': old_status_name,
-            'new_status': new_status.TenTrangThai,
-            'total_amount': float(order.TongTien),
-            'payment_method': order.PhuongThucThanhToan,
-            'recipient_name': order.TenNguoiNhan,
-            'phone_number': order.SoDienThoai,
-            'address': order.DiaChi,
-            'items': chi_tiet_items
-        }
-        
-        # Publish order.status_updated event
-        try:
+        # Trạng thái mới và các sự kiện outbox được ghi trong cùng một transaction
+        with transaction.atomic():
+            order.MaTrangThai = new_status
+            order.save()
+            
+            # Prepare order items for the event
+            order_items = ChiTietDonHang.objects.filter(MaDonHang=order)
+            chi_tiet_items = [
+                {
+                    'product_id': item.MaSanPham,
+                    'quantity': item.SoLuong,
+                    'price': float(item.GiaSanPham),
+                    'name': item.TenSanPham,
+                    'image_url': item.HinhAnh
+                } for item in order_items
+            ]
+            
+            # Prepare order data for events
+            order_data = {
+                'order_id': order.MaDonHang,
+                'user_id': order.MaNguoiDung,
+                'old_status': old_status_name,
+                'new_status': new_status.TenTrangThai,
+                'total_amount': float(order.TongTien),
+                'payment_method': order.PhuongThucThanhToan,
+                'recipient_name': order.TenNguoiNhan,
+                'phone_number': order.SoDienThoai,
+                'address': order.DiaChi,
+                'items': chi_tiet_items
+            }
+            
             publish_order_event('status_updated', order_data)
-            logger.info(f"Đã gửi sự kiện order.status_updated cho đơn hàng #{order.MaDonHang}")
-        except Exception as e:
-            logger.error(f"Lỗi khi gửi sự kiện order.status_updated cho đơn hàng #{order.MaDonHang}: {str(e)}", exc_info=True)
-        
-        # Publish order.cancelled event if status is changed to Cancelled (MaTrangThai: 6)
-        if new_status_id == 6:
-            try:
+            
+            # Publish order.cancelled event if status is changed to Cancelled (MaTrangThai: 6)
+            if new_status_id == 6:
                 publish_order_event('cancelled', order_data)
-                logger.info(f"Đã gửi sự kiện order.cancelled cho đơn hàng #{order.MaDonHang}")
-            except Exception as e:
-                logger.error(f"Lỗi khi gửi sự kiện order.cancelled cho đơn hàng #{order.MaDonHang}: {str(e)}", exc_info=True)
+        logger.info(f"Đã ghi sự kiện order.status_updated vào outbox cho đơn hàng #{order.MaDonHang}")
         
         serializer = DonHangSerializer(order)
         
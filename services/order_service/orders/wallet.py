@@ -0,0 +1,88 @@
+import logging
+from django.db import transaction
+from .models import DonHang
+from .outbox import enqueue_event
+from .rabbitmq import publish_order_event
+from .statuses import status_cache
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái đơn hàng trong luồng thanh toán bằng ví (đã có sẵn từ migration 0003)
+PENDING_PAYMENT = 'Chờ thanh toán'
+PAID = 'Đã thanh toán'
+CANCELLED = 'Đã hủy'
+
+
+def request_wallet_reservation(order, user_id):
+    """
+    Ghi lệnh wallet.reserve vào outbox; auth_service giữ tiền rồi trả lời bằng
+    wallet.reserved hoặc wallet.reservation_failed. Cần gọi trong transaction tạo đơn hàng.
+    """
+    enqueue_event('wallet.reserve', {
+        'order_id': order.MaDonHang,
+        'user_id': user_id,
+        'amount': order.TongTien,
+    })
+
+
+def _status_event_data(order, old_status_name):
+    return {
+        'order_id': order.MaDonHang,
+        'user_id': order.MaNguoiDung,
+        'old_status': old_status_name,
+        'new_status': order.MaTrangThai.TenTrangThai,
+        'total_amount': float(order.TongTien),
+        'payment_method': order.PhuongThucThanhToan,
+        'recipient_name': order.TenNguoiNhan,
+        'phone_number': order.SoDienThoai,
+        'address': order.DiaChi,
+        'items': [
+            {
+                'product_id': item.MaSanPham,
+                'quantity': item.SoLuong,
+                'price': float(item.GiaSanPham),
+                'name': item.TenSanPham,
+                'image_url': item.HinhAnh
+            } for item in order.chi_tiet.all()
+        ]
+    }
+
+
+def apply_wallet_reply(routing_key, data):
+    """
+    Áp dụng kết quả giữ tiền cho đơn hàng đang Chờ thanh toán.
+
+    wallet.reserved: chuyển sang Đã thanh toán và gửi wallet.confirm.
+    wallet.reservation_failed: chuyển sang Đã hủy và gửi order.cancelled để hoàn kho.
+    Trả lời trùng (message giao lại) không làm gì; tiền đã giữ cho đơn không còn chờ thanh toán
+    được hoàn lại bằng wallet.release.
+    """
+    order_id = data.get('order_id')
+    with transaction.atomic():
+        order = DonHang.objects.select_for_update().select_related('MaTrangThai').filter(
+            MaDonHang=order_id
+        ).first()
+        if order is None:
+            logger.error(f"Nhận {routing_key} cho đơn hàng #{order_id} không tồn tại")
+            return
+        old_status_name = order.MaTrangThai.TenTrangThai
+
+        if old_status_name != PENDING_PAYMENT:
+            if routing_key == 'wallet.reserved' and old_status_name != PAID:
+                logger.warning(f"Đơn hàng #{order_id} không còn chờ thanh toán ({old_status_name}), hoàn lại tiền")
+                enqueue_event('wallet.release', {'order_id': order.MaDonHang})
+            return
+
+        if routing_key == 'wallet.reserved':
+            order.MaTrangThai = status_cache.get_by_name(PAID, loai='Đơn hàng')
+            order.save(update_fields=['MaTrangThai'])
+            enqueue_event('wallet.confirm', {'order_id': order.MaDonHang})
+            publish_order_event('status_updated', _status_event_data(order, old_status_name))
+        else:
+            order.MaTrangThai = status_cache.get_by_name(CANCELLED, loai='Đơn hàng')
+            order.save(update_fields=['MaTrangThai'])
+            order_data = _status_event_data(order, old_status_name)
+            order_data['reason'] = data.get('reason', '')
+            publish_order_event('status_updated', order_data)
+            publish_order_event('cancelled', order_data)
+    logger.info(f"Đơn hàng #{order_id}: {old_status_name} -> {order.MaTrangThai.TenTrangThai} ({routing_key})")
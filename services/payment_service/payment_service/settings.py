@@ -143,8 +143,47 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Service URLs
+ORDER_SERVICE_URL = os.environ.get('ORDER_SERVICE_URL', 'http://order_service:8000')
+# Các service nội bộ được gọi thẳng (không vòng qua api_gateway) bằng payments.http_client
+INTERNAL_SERVICE_URLS = {
+    'order_service': ORDER_SERVICE_URL,
+}
+INTERNAL_HTTP_TIMEOUT = (
+    float(os.environ.get('INTERNAL_HTTP_CONNECT_TIMEOUT', 1)),
+    float(os.environ.get('INTERNAL_HTTP_READ_TIMEOUT', 5)),
+)  # (connect, read) giây
+INTERNAL_HTTP_POOL_SIZE = int(os.environ.get('INTERNAL_HTTP_POOL_SIZE', 10))  # kết nối keep-alive mỗi upstream
+INTERNAL_HTTP_RETRIES = int(os.environ.get('INTERNAL_HTTP_RETRIES', 2))  # chỉ áp dụng cho request idempotent
+INTERNAL_HTTP_BACKOFF = float(os.environ.get('INTERNAL_HTTP_BACKOFF', 0.1))
+INTERNAL_HTTP_BACKOFF_MAX = float(os.environ.get('INTERNAL_HTTP_BACKOFF_MAX', 1))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_BREAKER_RESET_TIMEOUT', 30))
+
 # RabbitMQ Settings (will be used later)
 RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
 RABBITMQ_PORT = int(os.environ.get('RABBITMQ_PORT', 5672))
 RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASSWORD', 'guest')
+
+# Transactional outbox: relay_outbox gửi sự kiện lên RabbitMQ
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get('OUTBOX_RELAY_BATCH_SIZE', 100))
+OUTBOX_RELAY_POLL_INTERVAL = float(os.environ.get('OUTBOX_RELAY_POLL_INTERVAL', 0.5))
+OUTBOX_RELAY_CONFIRM_TIMEOUT = float(os.environ.get('OUTBOX_RELAY_CONFIRM_TIMEOUT', 30))
+OUTBOX_RELAY_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_RELAY_MAX_ATTEMPTS', 5))
+OUTBOX_RETENTION_HOURS = float(os.environ.get('OUTBOX_RETENTION_HOURS', 72))
+
+# Consumer RabbitMQ chạy bằng `manage.py run_consumers` (tách khỏi process web)
+CONSUMERS_IN_WEB_PROCESS = os.environ.get('CONSUMERS_IN_WEB_PROCESS', 'False') == 'True'
+CONSUMER_PROCESSES = int(os.environ.get('CONSUMER_PROCESSES', 1))
+CONSUMER_CHANNELS = int(os.environ.get('CONSUMER_CHANNELS', 1))
+# Số channel mỗi process theo queue, ví dụ "product_service_queue=4,other_queue=2"
+CONSUMER_QUEUE_CONCURRENCY = {
+    name.strip(): int(count)
+    for name, count in (
+        part.split('=', 1) for part in os.environ.get('CONSUMER_QUEUE_CONCURRENCY', '').split(',') if '=' in part
+    )
+}
+CONSUMER_HEALTH_DIR = os.environ.get('CONSUMER_HEALTH_DIR', '/tmp/consumer_health')
+CONSUMER_HEALTH_INTERVAL = float(os.environ.get('CONSUMER_HEALTH_INTERVAL', 5))
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.environ.get('CONSUMER_SHUTDOWN_TIMEOUT', 30))
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -6,6 +7,9 @@ class PaymentsConfig(AppConfig):
 
     def ready(self):
         import os
+        # Consumer chạy bằng `manage.py run_consumers`; chỉ chạy trong process web khi được bật rõ ràng
+        if not settings.CONSUMERS_IN_WEB_PROCESS:
+            return
         # Chỉ khởi động consumer trong môi trường không phải test
         if os.environ.get('RUN_MAIN', None) == 'true':
             from .rabbitmq import start_consumer_thread
@@ -0,0 +1,76 @@
+# Bản sao của services/common/relay_outbox.py: sửa bản gốc rồi chạy python services/common/sync_copies.py
+import logging
+import signal
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from ...outbox import OutboxRelay
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Chuyển các sự kiện trong bảng outbox lên RabbitMQ (có thể chạy nhiều tiến trình song song)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Số sự kiện tối đa mỗi lô (mặc định OUTBOX_RELAY_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Số giây nghỉ khi outbox trống (mặc định OUTBOX_RELAY_POLL_INTERVAL)')
+        parser.add_argument('--once', action='store_true',
+                            help='Gửi hết các sự kiện đang chờ rồi thoát')
+        parser.add_argument('--requeue-failed', action='store_true',
+                            help='Đưa các sự kiện đã ngừng gửi (quá OUTBOX_RELAY_MAX_ATTEMPTS) về hàng đợi rồi thoát')
+
+    def handle(self, *args, **options):
+        relay = OutboxRelay(batch_size=options['batch_size'])
+        if options['requeue_failed']:
+            self.stdout.write(f"Đã đưa {relay.requeue_failed()} sự kiện về hàng đợi")
+            return
+        interval = options['interval']
+        if interval is None:
+            interval = float(getattr(settings, 'OUTBOX_RELAY_POLL_INTERVAL', 0.5))
+        retention = timedelta(hours=float(getattr(settings, 'OUTBOX_RETENTION_HOURS', 72)))
+        purge_every = 3600
+        last_purge = 0
+
+        self._running = True
+
+        def stop(signum, frame):
+            logger.info("Outbox relay nhận tín hiệu dừng, kết thúc sau lô hiện tại")
+            self._running = False
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write("Outbox relay đang chạy")
+        try:
+            while self._running:
+                try:
+                    close_old_connections()
+                    sent = relay.relay_batch()
+                except Exception as e:
+                    logger.error(f"Outbox relay lỗi: {str(e)}", exc_info=True)
+                    relay.close()
+                    if options['once']:
+                        raise
+                    time.sleep(max(interval, 1))
+                    continue
+
+                if sent >= relay.batch_size:
+                    continue
+                if options['once']:
+                    break
+
+                if time.monotonic() - last_purge > purge_every:
+                    last_purge = time.monotonic()
+                    deleted = relay.purge_published(timezone.now() - retention)
+                    if deleted:
+                        logger.info(f"Đã xóa {deleted} sự kiện outbox cũ")
+                time.sleep(interval)
+        finally:
+            relay.close()
+        self.stdout.write("Outbox relay đã dừng")
@@ -0,0 +1,48 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from payments.consumers import ConsumerSupervisor, check_health, queue_concurrency
+from payments.rabbitmq import CONSUMER_QUEUES
+
+
+class Command(BaseCommand):
+    help = 'Chạy các RabbitMQ consumer của service trong các process riêng, tách khỏi HTTP worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Số process consumer (mặc định CONSUMER_PROCESSES)')
+        parser.add_argument('--channels', type=int, default=None,
+                            help='Số channel cho mỗi queue trong mỗi process (mặc định CONSUMER_CHANNELS, '
+                                 'ghi đè theo queue bằng CONSUMER_QUEUE_CONCURRENCY)')
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Chỉ chạy queue này (có thể lặp lại)')
+        parser.add_argument('--health-dir', default=None,
+                            help='Thư mục ghi file health (mặc định CONSUMER_HEALTH_DIR)')
+        parser.add_argument('--check', action='store_true',
+                            help='Kiểm tra health của các consumer đang chạy rồi thoát (dùng cho healthcheck)')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            ok, reports = check_health(options['health_dir'])
+            self.stdout.write(json.dumps({'ok': ok, 'processes': reports}, indent=2))
+            if not ok:
+                raise CommandError("Consumer không khỏe")
+            return
+
+        specs = CONSUMER_QUEUES
+        if options['queues']:
+            unknown = set(options['queues']) - {spec.name for spec in specs}
+            if unknown:
+                raise CommandError(f"Queue không tồn tại: {', '.join(sorted(unknown))}")
+            specs = [spec for spec in specs if spec.name in options['queues']]
+
+        processes = options['processes'] or int(getattr(settings, 'CONSUMER_PROCESSES', 1))
+        channels = options['channels'] or int(getattr(settings, 'CONSUMER_CHANNELS', 1))
+        for spec in specs:
+            self.stdout.write(
+                f"{spec.name}: {processes} process x {queue_concurrency(spec, channels)} channel, "
+                f"prefetch {spec.prefetch_count}"
+            )
+
+        ConsumerSupervisor(specs, processes, channels, health_dir=options['health_dir']).run()
+        self.stdout.write("Các consumer đã dừng")
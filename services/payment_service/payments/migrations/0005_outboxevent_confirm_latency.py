@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='confirm_latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 # File: /app/payments/models.py
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 
 class ThanhToan(models.Model):
     pk_MaThanhToan = models.AutoField(primary_key=True)
@@ -26,4 +27,26 @@ class UserBalance(models.Model):
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  # Số dư (VND)
 
     class Meta:
-        db_table = 'UserBalance'
\ No newline at end of file
+        db_table = 'UserBalance'
+
+class OutboxEvent(models.Model):
+    """
+    Sự kiện chờ gửi lên RabbitMQ, được ghi cùng transaction với thay đổi dữ liệu (transactional outbox)
+    """
+    routing_key = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Thời gian từ lúc relay publish tới khi broker xác nhận (publisher confirms)
+    confirm_latency_ms = models.FloatField(null=True, blank=True)
+    # Bị từ chối quá OUTBOX_RELAY_MAX_ATTEMPTS lần: relay bỏ qua, chờ xử lý tay (relay_outbox --requeue-failed)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'OutboxEvent'
+        indexes = [
+            # Relay quét published_at IS NULL (và failed_at IS NULL) ORDER BY id; dọn dẹp quét theo published_at
+            models.Index(fields=['published_at', 'id'], name='outbox_published_id_idx'),
+        ]
@@ -7,6 +7,8 @@ from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
 from .utils import get_rabbitmq_client
+from .outbox import enqueue_event
+from .consumers import QueueSpec
 from .models import ThanhToan, UserBalance
 
 logger = logging.getLogger(__name__)
@@ -39,12 +41,9 @@ def message_callback(ch, method, properties, body):
                     ch.basic_ack(delivery_tag=method.delivery_tag)
                     return
 
-                if payment_method == 'ewallet' :
-    # Bỏ kiểm tra số dư, luôn đánh dấu là đã thanh toán
-                    status = 'Đã thanh toán'
-                else:
-                    # Cash hoặc Stripe: Đặt trạng thái ban đầu là Chờ thanh toán
-                    status = 'Chờ thanh toán'
+                # Mọi phương thức bắt đầu ở Chờ thanh toán; ví điện tử được cập nhật khi
+                # auth_service trả lời wallet.reserved / wallet.reservation_failed
+                status = 'Chờ thanh toán'
 
                 # Tạo bản ghi ThanhToan
                 thanh_toan = ThanhToan.objects.create(
@@ -56,20 +55,15 @@ def message_callback(ch, method, properties, body):
 
                 logger.info(f"Created ThanhToan for order #{order_id}: {thanh_toan.pk_MaThanhToan}")
 
-                # Publish sự kiện payment.created
-                try:
-                    client = get_rabbitmq_client()
-                    payment_data = {
-                        'payment_id': thanh_toan.pk_MaThanhToan,
-                        'order_id': order_id,
-                        'status': status,
-                        'payment_method': payment_method,
-                        'created_at': thanh_toan.NgayThanhToan.isoformat()
-                    }
-                    client.publish('payment.created', payment_data)
-                    client.close()
-                except Exception as e:
-                    logger.error(f"Failed to publish payment.created event for order #{order_id}: {str(e)}")
+                # Ghi sự kiện payment.created vào outbox cùng transaction với ThanhToan
+                payment_data = {
+                    'payment_id': thanh_toan.pk_MaThanhToan,
+                    'order_id': order_id,
+                    'status': status,
+                    'payment_method': payment_method,
+                    'created_at': thanh_toan.NgayThanhToan.isoformat()
+                }
+                enqueue_event('payment.created', payment_data)
 
             ch.basic_ack(delivery_tag=method.delivery_tag)
 
@@ -80,6 +74,36 @@ def message_callback(ch, method, properties, body):
         logger.error(f"Error processing message: {str(e)}", exc_info=True)
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
+def wallet_reply_callback(ch, method, properties, body):
+    """
+    Cập nhật ThanhToan của đơn hàng ví điện tử theo kết quả giữ tiền.
+    Trả lời có thể đến trước order.created nên bản ghi được tạo nếu chưa có.
+    """
+    try:
+        message = json.loads(body)
+        order_id = int(message['order_id'])
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error(f"Invalid wallet reply: {body}, error: {str(e)}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+
+    status = 'Đã thanh toán' if method.routing_key == 'wallet.reserved' else 'Thất bại'
+    with transaction.atomic():
+        thanh_toan, created = ThanhToan.objects.select_for_update().get_or_create(
+            fk_MaDonHang=order_id,
+            defaults={
+                'PhuongThucThanhToan': 'ewallet',
+                'NgayThanhToan': timezone.now().date(),
+                'TrangThaiThanhToan': status
+            }
+        )
+        if not created and thanh_toan.TrangThaiThanhToan == 'Chờ thanh toán':
+            thanh_toan.TrangThaiThanhToan = status
+            thanh_toan.NgayThanhToan = timezone.now().date()
+            thanh_toan.save()
+    logger.info(f"ThanhToan for order #{order_id}: {thanh_toan.TrangThaiThanhToan}")
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
 def start_consumer():
     try:
         client = get_rabbitmq_client()
@@ -90,6 +114,16 @@ def start_consumer():
         logger.error(f"Error starting RabbitMQ consumer: {str(e)}", exc_info=True)
         raise
 
+# Các queue được chạy bởi `manage.py run_consumers`
+CONSUMER_QUEUES = [
+    QueueSpec('payment_service_queue', routing_keys=['order.created'], on_message=message_callback),
+    QueueSpec(
+        'payment_service_wallet_queue',
+        routing_keys=['wallet.reserved', 'wallet.reservation_failed'],
+        on_message=wallet_reply_callback
+    ),
+]
+
 def start_consumer_thread():
     try:
         consumer_thread = threading.Thread(target=start_consumer)
@@ -1,3 +1,22 @@
-from django.test import TestCase
+import importlib.util
+from pathlib import Path
+from django.test import SimpleTestCase
 
-# Create your tests here.
+
+class SharedModuleCopyTest(SimpleTestCase):
+    """
+    Các module dùng chung trong service này khớp bản gốc ở services/common/ (services/common/sync_copies.py)
+    """
+    def test_matches_common(self):
+        script = Path(__file__).resolve().parents[2] / 'common' / 'sync_copies.py'
+        if not script.exists():
+            self.skipTest('Không có services/common (chạy trong container của service)')
+        spec = importlib.util.spec_from_file_location('sync_copies', script)
+        sync_copies = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sync_copies)
+        service = Path(__file__).resolve().parents[1]
+        stale = [
+            str(copy.relative_to(sync_copies.SERVICES_DIR))
+            for _, copy in sync_copies.stale_copies() if service in copy.parents
+        ]
+        self.assertEqual(stale, [], 'Bản sao lệch với bản gốc, chạy python services/common/sync_copies.py')
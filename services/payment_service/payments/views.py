@@ -1,13 +1,13 @@
 import stripe
 import json
 import logging
-import requests
 from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from django.db import transaction
 from payments.models import ThanhToan
+from payments.http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -57,10 +57,11 @@ def stripe_webhook(request):
                 logger.info(f"Updated ThanhToan for order #{order_id}: {thanh_toan.pk_MaThanhToan}")
 
                 # Cập nhật trạng thái DonHang qua API order_service
-                response = requests.patch(
-                    f'{settings.ORDER_SERVICE_URL}/orders/update/{order_id}/',
+                response = get_client('order_service').patch(
+                    f'/orders/update/{order_id}/',
                     json={'status': 'Đã thanh toán'},
-                    headers={'Authorization': f'Bearer {settings.INTERNAL_API_TOKEN}'}
+                    headers={'Authorization': f'Bearer {settings.INTERNAL_API_TOKEN}'},
+                    idempotent=True  # đặt trạng thái cố định, gửi lại an toàn
                 )
                 if response.status_code != 200:
                     logger.error(f"Failed to update DonHang #{order_id}: {response.text}")
@@ -98,10 +99,11 @@ def stripe_webhook(request):
                 logger.info(f"Updated ThanhToan for order #{order_id}: {thanh_toan.pk_MaThanhToan}")
 
                 # Cập nhật trạng thái DonHang qua API order_service
-                response = requests.patch(
-                    f'{settings.ORDER_SERVICE_URL}/orders/update/{order_id}/',
+                response = get_client('order_service').patch(
+                    f'/orders/update/{order_id}/',
                     json={'status': 'Thất bại'},
-                    headers={'Authorization': f'Bearer {settings.INTERNAL_API_TOKEN}'}
+                    headers={'Authorization': f'Bearer {settings.INTERNAL_API_TOKEN}'},
+                    idempotent=True  # đặt trạng thái cố định, gửi lại an toàn
                 )
                 if response.status_code != 200:
                     logger.error(f"Failed to update DonHang #{order_id}: {response.text}")
@@ -197,10 +199,11 @@ def refund_payment(request):
             logger.info(f"Refunded ThanhToan for order #{order_id}: {refund.id}")
 
             # Cập nhật trạng thái DonHang qua API order_service
-            response = requests.patch(
-                f'{settings.ORDER_SERVICE_URL}/orders/update/{order_id}/',
+            response = get_client('order_service').patch(
+                f'/orders/update/{order_id}/',
                 json={'status': 'Hoàn tiền'},
-                headers={'Authorization': f'Bearer {settings.INTERNAL_API_TOKEN}'}
+                headers={'Authorization': f'Bearer {settings.INTERNAL_API_TOKEN}'},
+                idempotent=True  # đặt trạng thái cố định, gửi lại an toàn
             )
             if response.status_code != 200:
                 logger.error(f"Failed to update DonHang #{order_id}: {response.text}")
@@ -122,16 +122,90 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [],
 }
 
+# Bộ khóa sắp xếp của phân trang keyset (SanPham); trường cuối là khóa duy nhất
+KEYSET_PAGINATION_ORDERING = ('-NgayTao', '-id')
+
 # Service URLs
 AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://auth_service:8000')
 API_GATEWAY_URL = os.environ.get('API_GATEWAY_URL', 'http://localhost:8000')
 
+# Xác thực access token (simplejwt của auth_service) tại chỗ
+JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'django-insecure-auth-service-key')
+JWT_VERIFYING_KEY = os.environ.get('JWT_VERIFYING_KEY')  # khóa công khai khi auth_service ký bằng RS256
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+
 # RabbitMQ Settings
 RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
 RABBITMQ_PORT = os.environ.get('RABBITMQ_PORT', 5672)
 RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASS = os.environ.get('RABBITMQ_PASS', 'guest')
 
+# Transactional outbox: relay_outbox gửi sự kiện lên RabbitMQ
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get('OUTBOX_RELAY_BATCH_SIZE', 100))
+OUTBOX_RELAY_POLL_INTERVAL = float(os.environ.get('OUTBOX_RELAY_POLL_INTERVAL', 0.5))
+OUTBOX_RELAY_CONFIRM_TIMEOUT = float(os.environ.get('OUTBOX_RELAY_CONFIRM_TIMEOUT', 30))
+OUTBOX_RELAY_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_RELAY_MAX_ATTEMPTS', 5))
+OUTBOX_RETENTION_HOURS = float(os.environ.get('OUTBOX_RETENTION_HOURS', 72))
+
+# Consumer RabbitMQ chạy bằng `manage.py run_consumers` (tách khỏi process web)
+CONSUMERS_IN_WEB_PROCESS = os.environ.get('CONSUMERS_IN_WEB_PROCESS', 'False') == 'True'
+CONSUMER_PROCESSES = int(os.environ.get('CONSUMER_PROCESSES', 1))
+CONSUMER_CHANNELS = int(os.environ.get('CONSUMER_CHANNELS', 1))
+# Số channel mỗi process theo queue, ví dụ "product_service_queue=4,other_queue=2"
+CONSUMER_QUEUE_CONCURRENCY = {
+    name.strip(): int(count)
+    for name, count in (
+        part.split('=', 1) for part in os.environ.get('CONSUMER_QUEUE_CONCURRENCY', '').split(',') if '=' in part
+    )
+}
+CONSUMER_HEALTH_DIR = os.environ.get('CONSUMER_HEALTH_DIR', '/tmp/consumer_health')
+CONSUMER_HEALTH_INTERVAL = float(os.environ.get('CONSUMER_HEALTH_INTERVAL', 5))
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.environ.get('CONSUMER_SHUTDOWN_TIMEOUT', 30))
+
+# Consumer trừ kho (order.created/order.cancelled): số message prefetch và số message mỗi transaction
+PRODUCT_CONSUMER_PREFETCH = int(os.environ.get('PRODUCT_CONSUMER_PREFETCH', 50))
+PRODUCT_CONSUMER_BATCH_SIZE = int(os.environ.get('PRODUCT_CONSUMER_BATCH_SIZE', 20))
+PRODUCT_CONSUMER_BATCH_TIMEOUT = float(os.environ.get('PRODUCT_CONSUMER_BATCH_TIMEOUT', 0.2))
+
+# Chỉ mục tìm kiếm sản phẩm trong bộ nhớ: số giây tối đa trước khi dựng lại từ DB
+PRODUCT_SEARCH_INDEX_MAX_AGE = int(os.environ.get('PRODUCT_SEARCH_INDEX_MAX_AGE', 300))
+
+# Cache facet (số lượng theo bộ lọc) cho danh sách sản phẩm
+PRODUCT_FACET_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_FACET_CACHE_MAX_ENTRIES', 256))
+PRODUCT_FACET_CACHE_MAX_AGE = int(os.environ.get('PRODUCT_FACET_CACHE_MAX_AGE', 300))
+# Cache (Redis) giữ thế hệ facet dùng chung giữa các worker
+PRODUCT_FACET_CACHE_ALIAS = 'default'
+# Các mốc giá (VND) chia khoảng giá cho facet, có thể ghi đè bằng ?price_buckets=...
+PRODUCT_PRICE_BUCKETS = [5000000, 10000000, 20000000, 30000000]
+
+# Số mã tối đa mỗi lần gọi /api/products/batch/?ids=
+PRODUCT_BATCH_MAX_IDS = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', 500))
+
+# Redis (django-redis): cache response của catalog, dùng chung giữa các process/container
+REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
+REDIS_PORT = os.environ.get('REDIS_PORT', '6379')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f"redis://{REDIS_HOST}:{REDIS_PORT}/2",
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # Redis không khả dụng thì request vẫn được phục vụ từ MySQL
+            'SOCKET_CONNECT_TIMEOUT': 1,
+            'SOCKET_TIMEOUT': 1,
+        }
+    }
+}
+
+# Cache response GET của danh mục, hãng, thông số và sản phẩm (products/response_cache.py)
+PRODUCT_RESPONSE_CACHE_ALIAS = 'default'
+PRODUCT_RESPONSE_CACHE_TTL = int(os.environ.get('PRODUCT_RESPONSE_CACHE_TTL', 300))
+# Số entry tối đa của cache L1 trong mỗi process
+PRODUCT_RESPONSE_CACHE_L1_MAX_ENTRIES = int(os.environ.get('PRODUCT_RESPONSE_CACHE_L1_MAX_ENTRIES', 512))
+# max-age của header Cache-Control; 0 = trình duyệt/nginx luôn hỏi lại bằng If-None-Match
+PRODUCT_RESPONSE_CACHE_CONTROL_MAX_AGE = int(os.environ.get('PRODUCT_RESPONSE_CACHE_CONTROL_MAX_AGE', 0))
+
 # Logging
 LOGGING = {
     'version': 1,
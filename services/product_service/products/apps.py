@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +12,13 @@ class ProductsConfig(AppConfig):
         """
         Khởi động RabbitMQ consumer sau khi Django app registry sẵn sàng
         """
+        # Đăng ký các receiver cho sự kiện sản phẩm (chỉ mục tìm kiếm, cache facet, cache response)
+        from . import search, facets, response_cache  # noqa: F401
+        
+        # Consumer chạy bằng `manage.py run_consumers`; chỉ chạy trong process web khi được bật rõ ràng
+        if not settings.CONSUMERS_IN_WEB_PROCESS:
+            return
+        
         try:
             from .rabbitmq import initialize_rabbitmq_consumer
             initialize_rabbitmq_consumer()
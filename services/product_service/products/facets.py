@@ -0,0 +1,382 @@
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+from .models import DanhMuc, HangSanXuat, ThongSo, ChiTietThongSo
+from .signals import product_event
+
+logger = logging.getLogger(__name__)
+
+# Các tham số lọc ảnh hưởng tới kết quả facet (phải trùng với SanPhamViewSet.get_queryset)
+FILTER_PARAMS = ('danh_muc', 'hang_san_xuat', 'min_price', 'max_price', 'search', 'ten')
+# Lọc theo từ khóa phụ thuộc chỉ mục tìm kiếm, không kiểm tra được trên một sản phẩm riêng lẻ
+TEXT_FILTER_PARAMS = ('search', 'ten')
+
+
+def _to_decimal(value):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+# Tham số lọc theo mã (số nguyên) và theo giá (số)
+ID_FILTER_PARAMS = ('danh_muc', 'hang_san_xuat')
+PRICE_FILTER_PARAMS = ('min_price', 'max_price')
+
+
+def parse_filters(query_params):
+    """
+    Đọc các tham số FILTER_PARAMS một lần: mã danh mục/hãng là số nguyên, giá là số, từ khóa là chuỗi
+    (đã bỏ khoảng trắng thừa). Tham số rỗng cho None; giá trị sai raise ValueError.
+    """
+    filters = {}
+    for param in FILTER_PARAMS:
+        value = (query_params.get(param) or '').strip()
+        if not value:
+            filters[param] = None
+            continue
+        if param in ID_FILTER_PARAMS:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"Tham số {param} không hợp lệ: {value}")
+        elif param in PRICE_FILTER_PARAMS:
+            parsed = _to_decimal(value)
+            if parsed is None or not parsed.is_finite():
+                raise ValueError(f"Tham số {param} không hợp lệ: {value}")
+            value = parsed
+        filters[param] = value
+    return filters
+
+
+def parse_price_buckets(raw=None):
+    """
+    Trả về tuple các mốc giá tăng dần, ví dụ (5000000, 10000000) tạo 3 khoảng:
+    [0, 5tr), [5tr, 10tr), [10tr, +inf)
+    """
+    if raw:
+        boundaries = [_to_decimal(part.strip()) for part in raw.split(',') if part.strip()]
+        if None in boundaries:
+            raise ValueError("Mốc giá không hợp lệ")
+    else:
+        boundaries = [Decimal(value) for value in getattr(settings, 'PRODUCT_PRICE_BUCKETS', [])]
+    return tuple(sorted(set(boundaries)))
+
+
+def bucket_index(price, boundaries):
+    for index, boundary in enumerate(boundaries):
+        if price < boundary:
+            return index
+    return len(boundaries)
+
+
+class FacetEntry:
+    """
+    Kết quả facet của một bộ lọc: tập sản phẩm khớp và số đếm theo từng giá trị
+    """
+    def __init__(self, filters, boundaries):
+        self.filters = filters
+        self.boundaries = boundaries
+        self.product_ids = set()
+        self.danh_muc = Counter()
+        self.hang_san_xuat = Counter()
+        self.khoang_gia = Counter()
+        self.thong_so = Counter()
+        self.built_at = time.monotonic()
+        self.generation = None  # thế hệ dùng chung lúc entry được tính
+
+    @property
+    def has_text_filter(self):
+        return any(self.filters.get(param) for param in TEXT_FILTER_PARAMS)
+
+    def matches(self, attrs):
+        # filters là kết quả parse_filters (mã là số nguyên, giá là Decimal)
+        filters = self.filters
+        for param in ID_FILTER_PARAMS:
+            if filters.get(param) is not None and attrs[param] != filters[param]:
+                return False
+        if filters.get('min_price') is not None and attrs['gia'] < filters['min_price']:
+            return False
+        if filters.get('max_price') is not None and attrs['gia'] > filters['max_price']:
+            return False
+        return True
+
+    def apply(self, product_id, attrs, sign):
+        if sign > 0:
+            self.product_ids.add(product_id)
+        else:
+            self.product_ids.discard(product_id)
+        if attrs['danh_muc'] is not None:
+            self.danh_muc[attrs['danh_muc']] += sign
+        if attrs['hang_san_xuat'] is not None:
+            self.hang_san_xuat[attrs['hang_san_xuat']] += sign
+        self.khoang_gia[bucket_index(attrs['gia'], self.boundaries)] += sign
+        for spec in attrs['thong_so']:
+            self.thong_so[spec] += sign
+
+
+class FacetCache:
+    """
+    Cache facet theo bộ lọc, được cập nhật tăng dần khi có sự kiện sản phẩm.
+
+    Mỗi sự kiện chỉ trừ/cộng đóng góp của đúng sản phẩm đó vào các entry liên quan,
+    nên không phải chạy lại GROUP BY. Entry có lọc theo từ khóa bị bỏ đi vì không
+    kiểm tra được điều kiện tìm kiếm trên dữ liệu sự kiện.
+
+    Mỗi worker giữ cache riêng nhưng dùng chung một số thế hệ trong Redis: mọi thay đổi
+    (sự kiện sản phẩm, dữ liệu tham chiếu, tồn kho) tăng số này, và entry chỉ được dùng khi
+    được tính ở đúng thế hệ hiện tại. Worker nhận sự kiện vẫn cập nhật tăng dần entry của mình
+    nếu không có thay đổi nào khác xen giữa; worker khác tính lại ở lần đọc sau.
+    """
+    generation_key = 'product:facets:generation'
+
+    def __init__(self, max_entries=None, max_age=None):
+        self._lock = threading.RLock()
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self.clear()
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'PRODUCT_FACET_CACHE_MAX_ENTRIES', 256)
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, 'PRODUCT_FACET_CACHE_MAX_AGE', 300)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'PRODUCT_FACET_CACHE_ALIAS', 'default')]
+
+    def clear(self):
+        """
+        Xóa cache của process hiện tại
+        """
+        with self._lock:
+            self._entries = OrderedDict()
+            self._attributes = {}  # product_id -> thuộc tính facet của sản phẩm
+            self._names = {'danh_muc': {}, 'hang_san_xuat': {}, 'thong_so': {}}
+            self._names_generation = None
+            self._names_loaded = False
+            self._generation = getattr(self, '_generation', 0) + 1
+
+    def invalidate(self):
+        """
+        Xóa cache của mọi worker sau khi transaction hiện tại commit
+        (để request đồng thời không lưu lại dữ liệu cũ)
+        """
+        def invalidate_all():
+            self._bump_shared_generation()
+            self.clear()
+        transaction.on_commit(invalidate_all)
+
+    def _shared_generation(self):
+        """
+        Thế hệ dùng chung hiện tại; None nếu Redis lỗi (khi đó chỉ dựa vào max_age)
+        """
+        try:
+            generation = self.cache.get(self.generation_key)
+            if generation is None:
+                # Khởi tạo bằng thời điểm hiện tại (ms) để giá trị mới không trùng thế hệ
+                # của các entry cũ khi khóa bị mất
+                self.cache.add(self.generation_key, int(time.time() * 1000), timeout=None)
+                generation = self.cache.get(self.generation_key)
+            return generation
+        except Exception as e:
+            logger.warning(f"Không đọc được thế hệ facet: {str(e)}")
+            return None
+
+    def _bump_shared_generation(self):
+        """
+        Tăng thế hệ dùng chung; trả về giá trị mới, hoặc None nếu khóa chưa có hoặc Redis lỗi
+        """
+        try:
+            return self.cache.incr(self.generation_key)
+        except ValueError:
+            # Khóa chưa có: lần đọc sau khởi tạo giá trị mới, không entry nào khớp
+            return None
+        except Exception as e:
+            logger.error(f"Không tăng được thế hệ facet: {str(e)}")
+            return None
+
+    @staticmethod
+    def make_key(filters, boundaries):
+        return tuple(filters.get(param) for param in FILTER_PARAMS) + (boundaries,)
+
+    def _load_names(self):
+        self._names['danh_muc'] = dict(DanhMuc.objects.values_list('id', 'TenDanhMuc'))
+        self._names['hang_san_xuat'] = dict(HangSanXuat.objects.values_list('id', 'TenHangSanXuat'))
+        self._names['thong_so'] = dict(ThongSo.objects.values_list('id', 'TenThongSo'))
+        self._names_loaded = True
+
+    def get(self, filters, boundaries, queryset):
+        """
+        Trả về facet cho bộ lọc; queryset là danh sách sản phẩm đã lọc, chỉ dùng khi chưa có cache
+        """
+        key = self.make_key(filters, boundaries)
+        shared = self._shared_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry.generation == shared
+                    and time.monotonic() - entry.built_at <= self.max_age):
+                self._entries.move_to_end(key)
+                return self._render(entry)
+            generation = self._generation
+
+        entry, attributes = self._compute(filters, boundaries, queryset)
+        entry.generation = shared
+        with self._lock:
+            if not self._names_loaded or self._names_generation != shared:
+                # Tên danh mục/hãng/thông số có thể đã được worker khác đổi
+                self._load_names()
+                self._names_generation = shared
+            if generation != self._generation:
+                # Có sự kiện sản phẩm trong lúc tính toán: trả kết quả nhưng không lưu cache
+                return self._render(entry)
+            self._attributes.update(attributes)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return self._render(entry)
+
+    def _compute(self, filters, boundaries, queryset):
+        attributes = {}
+        for product_id, danh_muc_id, hang_id, gia in queryset.values_list(
+                'id', 'DanhMuc_id', 'HangSanXuat_id', 'GiaBan'):
+            attributes[product_id] = {
+                'danh_muc': danh_muc_id,
+                'hang_san_xuat': hang_id,
+                'gia': gia,
+                'thong_so': [],
+            }
+        specs = ChiTietThongSo.objects.filter(
+            SanPham_id__in=queryset.values('id')
+        ).values_list('SanPham_id', 'ThongSo_id', 'GiaTriThongSo')
+        for product_id, thong_so_id, gia_tri in specs:
+            if product_id in attributes:
+                attributes[product_id]['thong_so'].append((thong_so_id, gia_tri))
+
+        entry = FacetEntry(filters, boundaries)
+        for product_id, attrs in attributes.items():
+            entry.apply(product_id, attrs, 1)
+        return entry, attributes
+
+    def _render(self, entry):
+        names = self._names
+
+        def ranked(counter):
+            return sorted(
+                ((key, count) for key, count in counter.items() if count > 0),
+                key=lambda item: (-item[1], str(item[0]))
+            )
+
+        khoang_gia = []
+        lower = Decimal(0)
+        for index in range(len(entry.boundaries) + 1):
+            upper = entry.boundaries[index] if index < len(entry.boundaries) else None
+            khoang_gia.append({
+                'min': lower,
+                'max': upper,
+                'count': entry.khoang_gia.get(index, 0),
+            })
+            lower = upper
+
+        thong_so = OrderedDict()
+        for (thong_so_id, gia_tri), count in ranked(entry.thong_so):
+            group = thong_so.setdefault(thong_so_id, {
+                'id': thong_so_id,
+                'TenThongSo': names['thong_so'].get(thong_so_id),
+                'values': [],
+            })
+            group['values'].append({'GiaTriThongSo': gia_tri, 'count': count})
+
+        return {
+            'total': len(entry.product_ids),
+            'danh_muc': [
+                {'id': key, 'TenDanhMuc': names['danh_muc'].get(key), 'count': count}
+                for key, count in ranked(entry.danh_muc)
+            ],
+            'hang_san_xuat': [
+                {'id': key, 'TenHangSanXuat': names['hang_san_xuat'].get(key), 'count': count}
+                for key, count in ranked(entry.hang_san_xuat)
+            ],
+            'khoang_gia': khoang_gia,
+            'thong_so': list(thong_so.values()),
+        }
+
+    def apply_product_event(self, event_type, product):
+        product_id = product.get('id')
+        if product_id is None:
+            return
+
+        new_attrs = None
+        if event_type in ('created', 'updated'):
+            gia = _to_decimal(product.get('GiaBan'))
+            if gia is None:
+                # Không đủ dữ liệu để cập nhật tăng dần
+                self._bump_shared_generation()
+                self.clear()
+                return
+            new_attrs = {
+                'danh_muc': product.get('DanhMuc'),
+                'hang_san_xuat': product.get('HangSanXuat'),
+                'gia': gia,
+                'thong_so': [
+                    (item.get('ThongSo'), item.get('GiaTriThongSo'))
+                    for item in product.get('ChiTietThongSo') or []
+                ],
+            }
+
+        shared = self._bump_shared_generation()
+        with self._lock:
+            self._generation += 1
+            old_attrs = self._attributes.get(product_id)
+            for key, entry in list(self._entries.items()):
+                was_member = product_id in entry.product_ids
+                # Có thay đổi khác (của worker khác) giữa lúc tính entry và sự kiện này: tính lại
+                stale = shared is not None and entry.generation != shared - 1
+                if stale or entry.has_text_filter or (was_member and old_attrs is None):
+                    del self._entries[key]
+                    continue
+                if was_member:
+                    entry.apply(product_id, old_attrs, -1)
+                if new_attrs is not None and entry.matches(new_attrs):
+                    entry.apply(product_id, new_attrs, 1)
+                entry.generation = shared
+            if shared is not None and self._names_generation == shared - 1:
+                self._names_generation = shared
+
+            if new_attrs is None:
+                self._attributes.pop(product_id, None)
+            else:
+                self._attributes[product_id] = new_attrs
+                self._update_names(product)
+
+    def _update_names(self, product):
+        if product.get('DanhMuc') is not None and product.get('TenDanhMuc'):
+            self._names['danh_muc'][product['DanhMuc']] = product['TenDanhMuc']
+        if product.get('HangSanXuat') is not None and product.get('TenHangSanXuat'):
+            self._names['hang_san_xuat'][product['HangSanXuat']] = product['TenHangSanXuat']
+        for item in product.get('ChiTietThongSo') or []:
+            if item.get('ThongSo') is not None and item.get('TenThongSo'):
+                self._names['thong_so'][item['ThongSo']] = item['TenThongSo']
+
+
+facet_cache = FacetCache()
+
+
+@receiver(product_event)
+def update_facet_cache(sender, event_type, product, **kwargs):
+    # Sự kiện được phát trong transaction của view: chỉ cộng/trừ số đếm khi transaction đã commit
+    transaction.on_commit(lambda: facet_cache.apply_product_event(event_type, product))
@@ -0,0 +1,39 @@
+import hashlib
+import json
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def compute_etag(data):
+    """
+    ETag mạnh tính từ nội dung JSON của response (khóa được sắp xếp nên ổn định giữa các lần gọi)
+    """
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return '"' + hashlib.sha1(payload.encode('utf-8')).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    """
+    Kiểm tra If-None-Match của request (có thể là danh sách, W/ hoặc *) với etag
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # So sánh yếu (RFC 7232): bỏ tiền tố W/ trước khi so
+    candidates = {value.strip()[2:] if value.strip().startswith('W/') else value.strip() for value in header.split(',')}
+    return etag in candidates
+
+
+def conditional_response(request, data, headers=None, etag=None):
+    """
+    Trả về 304 (không có body) nếu client đã có đúng phiên bản, ngược lại 200 kèm ETag.
+    etag có thể truyền vào nếu đã tính sẵn (vd. lưu cùng entry trong cache)
+    """
+    etag = etag or compute_etag(data)
+    headers = dict(headers or {}, ETag=etag)
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
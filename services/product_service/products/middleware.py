@@ -1,37 +1,53 @@
-import requests
+import logging
+import jwt
 from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from django.http import JsonResponse
 
+logger = logging.getLogger(__name__)
+
+
+def verify_token(token):
+    """
+    Xác thực access token của auth_service (simplejwt) ngay trong process, không gọi mạng.
+    Dùng JWT_VERIFYING_KEY (khóa công khai) nếu có, ngược lại dùng khóa ký chung JWT_SECRET_KEY.
+
+    Returns:
+        dict claims nếu token hợp lệ, None nếu không
+    """
+    key = getattr(settings, 'JWT_VERIFYING_KEY', None) or settings.JWT_SECRET_KEY
+    try:
+        claims = jwt.decode(token, key, algorithms=[getattr(settings, 'JWT_ALGORITHM', 'HS256')])
+    except jwt.ExpiredSignatureError:
+        logger.debug("Token đã hết hạn")
+        return None
+    except jwt.InvalidTokenError as e:
+        logger.warning(f"Token không hợp lệ: {str(e)}")
+        return None
+    if claims.get('token_type', 'access') != 'access' or claims.get('user_id') is None:
+        return None
+    return claims
+
+
 class AuthMiddleware:
+    """
+    request.user_data là claims của access token đã xác thực (user_id, jti, exp...), hoặc None.
+    Không gọi auth_service: view cần hồ sơ đầy đủ phải tự lấy từ auth_service.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        if 'HTTP_AUTHORIZATION' in request.META:
-            token = request.META.get('HTTP_AUTHORIZATION').split(' ')[1]
-            try:
-                # Validate token with Auth service
-                response = requests.get(
-                    f"{settings.AUTH_SERVICE_URL}/api/auth/users/me/",
-                    headers={"Authorization": f"Bearer {token}"}
-                )
-                
-                if response.status_code == 200:
-                    # Token is valid, attach user info to request
-                    request.user_data = response.json()
-                else:
-                    # For simplicity, we'll just continue without user data
-                    # In a real application, you might want to enforce authentication
-                    request.user_data = None
-            except requests.RequestException:
-                # Error communicating with Auth service
-                # We'll just continue without user data
-                request.user_data = None
-        else:
-            request.user_data = None
-            
+        request.user_data = None
+        request.auth_token = None
+        parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(parts) == 2 and parts[0] == 'Bearer':
+            # Xác thực token tại chỗ; token sai hoặc hết hạn được xử lý như request ẩn danh
+            request.user_data = verify_token(parts[1])
+            if request.user_data is not None:
+                request.auth_token = parts[1]
+
         response = self.get_response(request)
         return response
 
@@ -40,4 +56,4 @@ def auth_required(view_func):
         if request.user_data is None:
             return JsonResponse({"message": "Authentication required"}, status=401)
         return view_func(request, *args, **kwargs)
-    return wrapper
\ No newline at end of file
+    return wrapper
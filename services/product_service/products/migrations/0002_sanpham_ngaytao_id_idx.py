@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sanpham',
+            index=models.Index(fields=['NgayTao', 'id'], name='sanpham_ngaytao_id_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.text import slugify
 import os
 import uuid
@@ -46,6 +47,19 @@ class DanhMuc(models.Model):
         verbose_name = "Danh Mục"
         verbose_name_plural = "Danh Mục"
 
+class SanPhamQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Nạp sẵn danh mục, hãng sản xuất và chi tiết thông số (kèm ThongSo)
+        để serializer không phát sinh truy vấn N+1 cho mỗi sản phẩm
+        """
+        return self.select_related('DanhMuc', 'HangSanXuat').prefetch_related(
+            models.Prefetch(
+                'chi_tiet_thong_so',
+                queryset=ChiTietThongSo.objects.select_related('ThongSo')
+            )
+        )
+
 class SanPham(models.Model):
     TenSanPham = models.CharField(max_length=200)
     MoTa = models.TextField()
@@ -60,6 +74,8 @@ class SanPham(models.Model):
     NgayTao = models.DateTimeField(auto_now_add=True)
     NgayCapNhat = models.DateTimeField(auto_now=True)
     
+    objects = SanPhamQuerySet.as_manager()
+    
     def __str__(self):
         return self.TenSanPham
     
@@ -67,6 +83,10 @@ class SanPham(models.Model):
         db_table = "SanPham"
         verbose_name = "Sản Phẩm"
         verbose_name_plural = "Sản Phẩm"
+        indexes = [
+            # Khóa phân trang keyset (NgayTao, id)
+            models.Index(fields=['NgayTao', 'id'], name='sanpham_ngaytao_id_idx'),
+        ]
 
 class ChiTietThongSo(models.Model):
     SanPham = models.ForeignKey(SanPham, related_name='chi_tiet_thong_so', on_delete=models.CASCADE)
@@ -80,4 +100,27 @@ class ChiTietThongSo(models.Model):
         db_table = "ChiTietThongSo"
         verbose_name = "Chi Tiết Thông Số"
         verbose_name_plural = "Chi Tiết Thông Số"
-        unique_together = ('SanPham', 'ThongSo')  # Mỗi sản phẩm chỉ có một giá trị cho mỗi loại thông số
\ No newline at end of file
+        unique_together = ('SanPham', 'ThongSo')  # Mỗi sản phẩm chỉ có một giá trị cho mỗi loại thông số
+
+
+class OutboxEvent(models.Model):
+    """
+    Sự kiện chờ gửi lên RabbitMQ, được ghi cùng transaction với thay đổi dữ liệu (transactional outbox)
+    """
+    routing_key = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Thời gian từ lúc relay publish tới khi broker xác nhận (publisher confirms)
+    confirm_latency_ms = models.FloatField(null=True, blank=True)
+    # Bị từ chối quá OUTBOX_RELAY_MAX_ATTEMPTS lần: relay bỏ qua, chờ xử lý tay (relay_outbox --requeue-failed)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'OutboxEvent'
+        indexes = [
+            # Relay quét published_at IS NULL (và failed_at IS NULL) ORDER BY id; dọn dẹp quét theo published_at
+            models.Index(fields=['published_at', 'id'], name='outbox_published_id_idx'),
+        ]
@@ -5,8 +5,12 @@ from django.conf import settings
 import threading
 import time
 import os
-from django.db import transaction
+from django.db import close_old_connections
 from .models import SanPham
+from .signals import product_event
+from .outbox import enqueue_event
+from .consumers import QueueSpec
+from .stock import ACK, REJECT, REQUEUE, process_order_events
 
 # Cấu hình logging
 logger = logging.getLogger(__name__)
@@ -49,47 +53,94 @@ def get_rabbitmq_connection():
 
 def publish_product_event(event_type, product_data):
     """
-    Đăng sự kiện sản phẩm lên RabbitMQ exchange
+    Ghi sự kiện sản phẩm vào outbox; relay_outbox sẽ gửi lên RabbitMQ exchange.
+    Cần gọi trong cùng transaction với thay đổi sản phẩm.
     """
-    global rabbitmq_available
+    # Cập nhật các chỉ mục/cache cục bộ trước, kể cả khi RabbitMQ không khả dụng
+    product_event.send_robust(sender=SanPham, event_type=event_type, product=product_data)
     
-    if not rabbitmq_available:
-        logger.warning(f"RabbitMQ không khả dụng. Bỏ qua publish sự kiện {event_type}")
-        return False
+    message = {
+        'event_type': event_type,
+        'product': product_data
+    }
+    
+    enqueue_event(f"product.{event_type}", message)
+    logger.info(f"Đã ghi sự kiện {event_type} vào outbox cho sản phẩm ID: {product_data.get('id')}")
+    return True
+
+def handle_stock_batch(ch, messages):
+    """
+    Xử lý một lô message (method, body) trong một transaction rồi ack/nack theo kết quả
+    """
+    outcomes = [None] * len(messages)
+    events, decoded = [], []
+    for index, (method, body) in enumerate(messages):
+        try:
+            events.append((method.routing_key, json.loads(body)))
+            decoded.append(index)
+        except ValueError:
+            logger.error(f"Message không phải JSON hợp lệ: {body}")
+            outcomes[index] = REJECT
     
     try:
-        connection = get_rabbitmq_connection()
-        if not connection:
-            rabbitmq_available = False
-            logger.error("Không thể kết nối đến RabbitMQ để publish sự kiện")
-            return False
-        
-        ch = connection.channel()
-        
-        ch.exchange_declare(exchange=PRODUCT_EXCHANGE, exchange_type='topic', durable=True)
-        
-        message = {
-            'event_type': event_type,
-            'product': product_data
-        }
-        
-        ch.basic_publish(
-            exchange=PRODUCT_EXCHANGE,
-            routing_key=f"product.{event_type}",
-            body=json.dumps(message),
-            properties=pika.BasicProperties(
-                delivery_mode=2,
-                content_type='application/json'
-            )
-        )
-        
-        connection.close()
-        logger.info(f"Đã publish sự kiện {event_type} cho sản phẩm ID: {product_data.get('id')}")
-        return True
+        close_old_connections()
+        results = process_order_events(events)
     except Exception as e:
-        rabbitmq_available = False
-        logger.error(f"Lỗi khi publish sự kiện sản phẩm: {str(e)}", exc_info=True)
-        return False
+        logger.error(f"Lỗi khi xử lý lô sự kiện kho: {str(e)}", exc_info=True)
+        results = [REQUEUE] * len(events)
+    for index, result in zip(decoded, results):
+        outcomes[index] = result
+    
+    if all(outcome == ACK for outcome in outcomes):
+        # Ack cả lô bằng một frame
+        ch.basic_ack(delivery_tag=messages[-1][0].delivery_tag, multiple=True)
+        return
+    for (method, _), outcome in zip(messages, outcomes):
+        if outcome == ACK:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        else:
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=outcome == REQUEUE)
+
+def consume_stock_events(ch, queue=PRODUCT_QUEUE, stop_event=None, stats=None):
+    """
+    Gom message thành lô (tối đa PRODUCT_CONSUMER_BATCH_SIZE, hoặc sau PRODUCT_CONSUMER_BATCH_TIMEOUT giây).
+    Khi stop_event được set: xử lý nốt lô đang gom rồi dừng, message đã prefetch được trả lại queue.
+    """
+    batch_size = int(getattr(settings, 'PRODUCT_CONSUMER_BATCH_SIZE', 20))
+    batch_timeout = float(getattr(settings, 'PRODUCT_CONSUMER_BATCH_TIMEOUT', 0.2))
+    buffer = []
+    started_at = None
+    for method, properties, body in ch.consume(queue, inactivity_timeout=batch_timeout):
+        if method is not None:
+            if not buffer:
+                started_at = time.monotonic()
+            buffer.append((method, body))
+        if buffer and (
+            method is None
+            or len(buffer) >= batch_size
+            or time.monotonic() - started_at >= batch_timeout
+            or (stop_event is not None and stop_event.is_set())
+        ):
+            handle_stock_batch(ch, buffer)
+            if stats is not None:
+                stats.record(len(buffer))
+            buffer = []
+        if stop_event is not None and stop_event.is_set() and not buffer:
+            ch.cancel()
+            break
+
+# Các queue được chạy bởi `manage.py run_consumers`
+CONSUMER_QUEUES = [
+    QueueSpec(
+        PRODUCT_QUEUE,
+        routing_keys=['order.created', 'order.cancelled'],
+        run=consume_stock_events,
+        prefetch_count=max(
+            int(getattr(settings, 'PRODUCT_CONSUMER_PREFETCH', 50)),
+            int(getattr(settings, 'PRODUCT_CONSUMER_BATCH_SIZE', 20))
+        ),
+    ),
+]
 
 def start_consumer_thread():
     """
@@ -98,7 +149,7 @@ def start_consumer_thread():
     global channel
     if channel is not None:
         try:
-            channel.start_consuming()
+            consume_stock_events(channel)
         except Exception as e:
             logger.error(f"Consumer bị ngắt: {str(e)}")
             time.sleep(5)
@@ -129,60 +180,10 @@ def setup_rabbitmq_consumer():
             for routing_key in routing_keys:
                 channel.queue_bind(exchange=PRODUCT_EXCHANGE, queue=queue_name, routing_key=routing_key)
             
-            def callback(ch, method, properties, body):
-                """
-                Xử lý các sự kiện RabbitMQ
-                """
-                try:
-                    data = json.loads(body)
-                    logger.info(f"Đã nhận sự kiện: {method.routing_key}")
-                    
-                    if method.routing_key == 'order.created':
-                        items = data.get('items', [])
-                        with transaction.atomic():
-                            for item in items:
-                                product_id = item.get('product_id')
-                                quantity = item.get('quantity')
-                                
-                                try:
-                                    product = SanPham.objects.select_for_update().get(id=product_id)
-                                    if product.SoLuongTon >= quantity:
-                                        product.SoLuongTon -= quantity
-                                        product.save()
-                                        logger.info(f"Updated stock for product {product_id}: new stock = {product.SoLuongTon}")
-                                    else:
-                                        logger.error(f"Insufficient stock for product {product_id}: required {quantity}, available {product.SoLuongTon}")
-                                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                                        return
-                                except SanPham.DoesNotExist:
-                                    logger.error(f"Product {product_id} not found")
-                                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                                    return
-                    
-                    elif method.routing_key == 'order.cancelled':
-                        items = data.get('items', [])
-                        with transaction.atomic():
-                            for item in items:
-                                product_id = item.get('product_id')
-                                quantity = item.get('quantity')
-                                
-                                try:
-                                    product = SanPham.objects.select_for_update().get(id=product_id)
-                                    product.SoLuongTon += quantity
-                                    product.save()
-                                    logger.info(f"Restored stock for product {product_id}: new stock = {product.SoLuongTon}")
-                                except SanPham.DoesNotExist:
-                                    logger.error(f"Product {product_id} not found")
-                                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                                    return
-                    
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                except Exception as e:
-                    logger.error(f"Lỗi khi xử lý message: {str(e)}", exc_info=True)
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-            
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(queue=queue_name, on_message_callback=callback)
+            # Prefetch phải đủ lớn để gom được một lô message mỗi transaction
+            prefetch_count = int(getattr(settings, 'PRODUCT_CONSUMER_PREFETCH', 50))
+            batch_size = int(getattr(settings, 'PRODUCT_CONSUMER_BATCH_SIZE', 20))
+            channel.basic_qos(prefetch_count=max(prefetch_count, batch_size))
             
             consumer_thread = threading.Thread(target=start_consumer_thread)
             consumer_thread.daemon = True
@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework import status
+from .http_cache import compute_etag, conditional_response
+from .signals import product_event
+
+logger = logging.getLogger(__name__)
+
+# Tag mọi entry đều phụ thuộc (đổi phiên bản = xóa toàn bộ cache)
+ALL_TAG = '*'
+# Tag của các response: tag chung của sản phẩm (mọi response có dữ liệu sản phẩm),
+# danh sách sản phẩm và chi tiết từng sản phẩm
+PRODUCT_TAG = 'san-pham'
+PRODUCT_LIST_TAG = 'san-pham:list'
+
+
+def product_tag(product_id):
+    return f'san-pham:{product_id}'
+
+
+def normalize_params(query_params):
+    """
+    Chuỗi tham số chuẩn hóa: sắp theo tên, bỏ khoảng trắng thừa và tham số rỗng
+    (?b=2&a=1 và ?a=1&b=2&c= dùng chung một entry)
+    """
+    parts = []
+    for name in sorted(query_params.keys()):
+        values = [value.strip() for value in query_params.getlist(name) if value.strip()]
+        parts.extend(f'{name}={value}' for value in values)
+    return '&'.join(parts)
+
+
+class ResponseCache:
+    """
+    Cache response GET của catalog: Redis (cache `PRODUCT_RESPONSE_CACHE_ALIAS`) và L1 LRU trong process.
+
+    Mỗi entry gắn với một số tag (vd. 'san-pham:list', 'san-pham:12'); phiên bản hiện tại của
+    các tag được lưu trong Redis và là một phần của khóa entry. Xóa cache = đổi phiên bản tag
+    (sau khi transaction commit), nên mọi process cùng thấy ngay mà không phải tìm và xóa từng khóa;
+    entry cũ tự hết hạn. Mỗi lần đọc tốn một MGET phiên bản, L1 hit thì không cần đọc entry từ Redis.
+    Redis lỗi thì response được tính trực tiếp như khi không có cache.
+    """
+    key_prefix = 'product:response:'
+
+    def __init__(self, max_entries=None, timeout=None):
+        self._lock = threading.RLock()
+        self._max_entries = max_entries
+        self._timeout = timeout
+        self._local = OrderedDict()
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'PRODUCT_RESPONSE_CACHE_L1_MAX_ENTRIES', 512)
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'PRODUCT_RESPONSE_CACHE_TTL', 300)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'PRODUCT_RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def cache_control(self):
+        max_age = getattr(settings, 'PRODUCT_RESPONSE_CACHE_CONTROL_MAX_AGE', 0)
+        return f'public, max-age={max_age}, must-revalidate'
+
+    def clear(self):
+        """
+        Xóa toàn bộ cache ngay lập tức (mọi process), không chờ transaction
+        """
+        self._bump((ALL_TAG,))
+        with self._lock:
+            self._local.clear()
+
+    def _version_key(self, tag):
+        return f'{self.key_prefix}v:{tag}'
+
+    @property
+    def version_timeout(self):
+        # Phiên bản là chuỗi ngẫu nhiên nên để hết hạn vẫn an toàn (entry cũ chỉ bị bỏ);
+        # sống lâu hơn entry để entry không bị mất sớm khi phiên bản hết hạn
+        return self.timeout * 2
+
+    def _versions(self, tags):
+        """
+        Phiên bản hiện tại của các tag; tag chưa có phiên bản cho giá trị None (chưa có entry nào)
+        """
+        keys = [self._version_key(tag) for tag in tags]
+        versions = self.cache.get_many(keys)
+        return [versions.get(key) for key in keys]
+
+    def _create_versions(self, tags, versions):
+        """
+        Tạo phiên bản cho các tag còn thiếu. Trả về None nếu tag đã được process khác tạo/đổi
+        trong lúc render (entry vừa render có thể đã cũ nên không được lưu).
+        """
+        versions = list(versions)
+        for index, tag in enumerate(tags):
+            if versions[index] is None:
+                version = uuid.uuid4().hex
+                if not self.cache.add(self._version_key(tag), version, timeout=self.version_timeout):
+                    return None
+                versions[index] = version
+        return versions
+
+    def _entry_key(self, request, tags, versions):
+        # Response có URL tuyệt đối (ảnh, trang tiếp theo) nên khóa gồm cả scheme/host
+        raw = '|'.join([
+            request.build_absolute_uri(request.path),
+            normalize_params(request.query_params),
+            *(f'{tag}@{version}' for tag, version in zip(tags, versions)),
+        ])
+        return self.key_prefix + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+                return entry
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def respond(self, request, tags, render):
+        """
+        Trả response từ cache (kèm ETag, Cache-Control, 304 khi If-None-Match khớp),
+        hoặc gọi render() để tạo response rồi lưu lại nếu là 200.
+        Response khác 200 (vd. 404 của mã không tồn tại) không được lưu và không tạo tag.
+        """
+        tags = (ALL_TAG,) + tuple(tags)
+        try:
+            versions = self._versions(tags)
+            entry = self._get(self._entry_key(request, tags, versions)) if None not in versions else None
+        except Exception as e:
+            logger.warning(f"Không đọc được cache response: {str(e)}")
+            return render()
+
+        if entry is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            # ReturnDict/ReturnList được pickle thành dict/list thường
+            entry = (compute_etag(response.data), response.data)
+            try:
+                versions = self._create_versions(tags, versions)
+                if versions is not None:
+                    key = self._entry_key(request, tags, versions)
+                    self.cache.set(key, entry, timeout=self.timeout)
+                    self._remember(key, entry)
+            except Exception as e:
+                logger.warning(f"Không ghi được cache response: {str(e)}")
+
+        etag, data = entry
+        return conditional_response(request, data, headers={'Cache-Control': self.cache_control}, etag=etag)
+
+    def _bump(self, tags):
+        try:
+            self.cache.set_many(
+                {self._version_key(tag): uuid.uuid4().hex for tag in tags}, timeout=self.version_timeout
+            )
+        except Exception as e:
+            logger.error(f"Không xóa được cache response {tags}: {str(e)}")
+
+    def invalidate(self, *tags):
+        """
+        Đổi phiên bản các tag sau khi transaction hiện tại commit
+        (để request đồng thời không lưu lại dữ liệu cũ dưới phiên bản mới)
+        """
+        tags = tuple(dict.fromkeys(tags))
+        if tags:
+            transaction.on_commit(lambda: self._bump(tags))
+
+    def invalidate_products(self, product_ids):
+        if product_ids:
+            self.invalidate(PRODUCT_LIST_TAG, *(product_tag(product_id) for product_id in product_ids))
+
+
+response_cache = ResponseCache()
+
+
+@receiver(product_event)
+def invalidate_product_responses(sender, event_type, product, **kwargs):
+    product_id = product.get('id')
+    if event_type == 'created' or product_id is None:
+        response_cache.invalidate(PRODUCT_LIST_TAG)
+    else:
+        response_cache.invalidate_products([product_id])
@@ -0,0 +1,227 @@
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from .models import SanPham, ChiTietThongSo
+from .signals import product_event
+
+logger = logging.getLogger(__name__)
+
+# Trọng số theo trường: tên sản phẩm quan trọng hơn thông số, thông số hơn mô tả
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'spec': 1.5,
+    'description': 1.0,
+}
+# Hệ số cho từ khớp theo tiền tố (typeahead) so với khớp nguyên từ
+PREFIX_MATCH_FACTOR = 0.7
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+    """
+    Chuẩn hóa chuỗi để tìm kiếm: chữ thường và bỏ dấu tiếng Việt ("Điện thoại" -> "dien thoai")
+    """
+    if not text:
+        return ''
+    text = str(text).lower().replace('đ', 'd')
+    decomposed = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+class ProductSearchIndex:
+    """
+    Chỉ mục ngược (inverted index) trong bộ nhớ cho sản phẩm.
+
+    Được dựng lần đầu từ DB, sau đó cập nhật theo sự kiện product.created/updated/deleted.
+    Vì mỗi worker giữ chỉ mục riêng, chỉ mục cũng được dựng lại định kỳ
+    (PRODUCT_SEARCH_INDEX_MAX_AGE giây) để bắt các thay đổi từ worker khác.
+    """
+
+    def __init__(self, max_age=None):
+        self._lock = threading.RLock()
+        self._max_age = max_age
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)  # token -> {product_id: weight}
+        self._doc_tokens = {}  # product_id -> set(token)
+        self._names = {}  # product_id -> TenSanPham (dùng cho gợi ý)
+        self._vocabulary = []  # danh sách token đã sắp xếp, phục vụ tìm theo tiền tố
+        self._built_at = None
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, 'PRODUCT_SEARCH_INDEX_MAX_AGE', 300)
+
+    def _add(self, product_id, name, description, spec_values):
+        weights = defaultdict(float)
+        for token in tokenize(name):
+            weights[token] += FIELD_WEIGHTS['name']
+        for value in spec_values:
+            for token in tokenize(value):
+                weights[token] += FIELD_WEIGHTS['spec']
+        for token in tokenize(description):
+            weights[token] += FIELD_WEIGHTS['description']
+
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if not postings:
+                insort(self._vocabulary, token)
+            postings[product_id] = weight
+        self._doc_tokens[product_id] = set(weights)
+        self._names[product_id] = name
+
+    def _remove(self, product_id):
+        for token in self._doc_tokens.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect_left(self._vocabulary, token)
+                if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                    del self._vocabulary[index]
+        self._names.pop(product_id, None)
+
+    def rebuild(self):
+        """
+        Dựng lại toàn bộ chỉ mục từ DB (2 truy vấn)
+        """
+        spec_values = defaultdict(list)
+        for san_pham_id, gia_tri in ChiTietThongSo.objects.values_list('SanPham_id', 'GiaTriThongSo'):
+            spec_values[san_pham_id].append(gia_tri)
+        rows = list(SanPham.objects.values_list('id', 'TenSanPham', 'MoTa'))
+
+        with self._lock:
+            self._reset()
+            for product_id, name, description in rows:
+                self._add(product_id, name, description, spec_values.get(product_id, []))
+            self._built_at = time.monotonic()
+        logger.info(f"Đã dựng chỉ mục tìm kiếm cho {len(rows)} sản phẩm")
+
+    def _is_stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.max_age
+
+    def ensure_fresh(self):
+        """
+        Dựng lại chỉ mục nếu chưa dựng hoặc đã cũ. Kiểm tra lại trong lock để các request
+        đồng thời chỉ dựng một lần (request đến sau chờ rồi dùng chỉ mục vừa dựng).
+        """
+        if not self._is_stale():
+            return
+        with self._lock:
+            if self._is_stale():
+                self.rebuild()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def index_product(self, product):
+        """
+        Cập nhật một sản phẩm từ dữ liệu sự kiện (SanPhamSerializer.data)
+        """
+        product_id = product.get('id')
+        if product_id is None:
+            return
+        spec_values = [item.get('GiaTriThongSo', '') for item in product.get('ChiTietThongSo') or []]
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(product_id)
+            self._add(product_id, product.get('TenSanPham', ''), product.get('MoTa', ''), spec_values)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def apply_product_event(self, event_type, product):
+        if event_type == 'deleted':
+            self.remove_product(product.get('id'))
+        elif event_type in ('created', 'updated'):
+            self.index_product(product)
+
+    def _expand(self, token):
+        """
+        Trả về các token trong từ điển có tiền tố là token
+        """
+        start = bisect_left(self._vocabulary, token)
+        matches = []
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(token):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(self, query, limit=None):
+        """
+        Trả về danh sách (product_id, score) theo độ liên quan giảm dần.
+        Mọi từ trong truy vấn đều phải khớp (nguyên từ hoặc tiền tố).
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.ensure_fresh()
+
+        with self._lock:
+            total_docs = len(self._doc_tokens) or 1
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for token in self._expand(term):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total_docs / len(postings))
+                    factor = 1.0 if token == term else PREFIX_MATCH_FACTOR
+                    for product_id, weight in postings.items():
+                        term_scores[product_id] = max(term_scores[product_id], weight * idf * factor)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        product_id: score + term_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in term_scores
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return ranked
+
+    def suggest(self, query, limit=10):
+        """
+        Gợi ý tên sản phẩm cho ô tìm kiếm (typeahead), không truy vấn DB
+        """
+        results = self.search(query, limit=limit)
+        with self._lock:
+            return [
+                {'id': product_id, 'TenSanPham': self._names.get(product_id, '')}
+                for product_id, _ in results
+            ]
+
+
+product_search_index = ProductSearchIndex()
+
+
+@receiver(product_event)
+def update_search_index(sender, event_type, product, **kwargs):
+    # Sự kiện được phát trong transaction của view: chỉ cập nhật chỉ mục khi transaction đã commit
+    transaction.on_commit(lambda: product_search_index.apply_product_event(event_type, product))
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Phát ra mỗi khi publish_product_event được gọi (created/updated/deleted),
+# để các chỉ mục/cache cục bộ trong process cập nhật ngay mà không cần chờ RabbitMQ.
+# Tham số: event_type (str), product (dict dữ liệu đã serialize)
+product_event = Signal()
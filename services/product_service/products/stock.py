@@ -0,0 +1,156 @@
+import logging
+import uuid
+from collections import OrderedDict
+from django.db import transaction
+from django.db.models import F
+from .facets import facet_cache
+from .models import SanPham
+from .outbox import enqueue_events
+from .response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Kết quả xử lý một message
+ACK = 'ack'
+REJECT = 'reject'  # nack, không đưa lại vào queue (dữ liệu sai, hết hàng...)
+REQUEUE = 'requeue'  # nack, đưa lại vào queue (lỗi tạm thời)
+
+
+class StockError(Exception):
+    """
+    Đơn hàng không thể trừ kho (sản phẩm không tồn tại, không đủ hàng, dữ liệu sai)
+    """
+
+
+def order_quantities(items):
+    """
+    Gộp số lượng theo sản phẩm, sắp theo id để thứ tự khóa luôn cố định
+    """
+    quantities = {}
+    for item in items or []:
+        try:
+            product_id = int(item.get('product_id'))
+            quantity = int(item.get('quantity'))
+        except (TypeError, ValueError):
+            raise StockError(f"Dòng sản phẩm không hợp lệ: {item}")
+        if quantity <= 0:
+            raise StockError(f"Số lượng không hợp lệ cho sản phẩm {product_id}: {quantity}")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return OrderedDict(sorted(quantities.items()))
+
+
+def lock_products(product_ids):
+    """
+    Khóa các sản phẩm bằng một câu SELECT ... FOR UPDATE WHERE id IN (...) ORDER BY id.
+    Mọi consumer khóa theo cùng thứ tự id nên các đơn hàng đồng thời không deadlock lẫn nhau.
+    """
+    if not product_ids:
+        return {}
+    return dict(
+        SanPham.objects.select_for_update()
+        .filter(id__in=sorted(set(product_ids)))
+        .order_by('id')
+        .values_list('id', 'SoLuongTon')
+    )
+
+
+def reserve_stock(quantities, stock):
+    """
+    Trừ kho cho một đơn hàng; stock là số tồn của các sản phẩm đã khóa (được cập nhật tại chỗ).
+    Phải chạy trong transaction; nếu raise StockError thì caller rollback toàn bộ đơn hàng.
+    """
+    for product_id, quantity in quantities.items():
+        if product_id not in stock:
+            raise StockError(f"Product {product_id} not found")
+        if stock[product_id] < quantity:
+            raise StockError(
+                f"Insufficient stock for product {product_id}: required {quantity}, available {stock[product_id]}"
+            )
+        # UPDATE có điều kiện: không bao giờ để tồn kho âm kể cả khi dữ liệu khóa đã cũ
+        updated = SanPham.objects.filter(id=product_id, SoLuongTon__gte=quantity).update(
+            SoLuongTon=F('SoLuongTon') - quantity
+        )
+        if not updated:
+            raise StockError(f"Insufficient stock for product {product_id}: required {quantity}")
+        stock[product_id] -= quantity
+
+
+def restore_stock(quantities, stock):
+    """
+    Hoàn kho khi đơn hàng bị hủy
+    """
+    for product_id, quantity in quantities.items():
+        if product_id not in stock:
+            raise StockError(f"Product {product_id} not found")
+        SanPham.objects.filter(id=product_id).update(SoLuongTon=F('SoLuongTon') + quantity)
+        stock[product_id] += quantity
+
+
+STOCK_HANDLERS = {
+    'order.created': reserve_stock,
+    'order.cancelled': restore_stock,
+}
+
+
+def process_order_events(events):
+    """
+    Xử lý một lô sự kiện đơn hàng trong một transaction.
+
+    events: danh sách (routing_key, data). Trả về danh sách kết quả ACK/REJECT/REQUEUE
+    theo đúng thứ tự. Toàn bộ sản phẩm của lô được khóa một lần ở đầu transaction;
+    mỗi đơn hàng chạy trong một savepoint riêng nên một đơn lỗi không ảnh hưởng đơn khác.
+    Caller chỉ được ack sau khi hàm này trả về (transaction đã commit).
+    """
+    outcomes = [None] * len(events)
+    parsed = []
+    for index, (routing_key, data) in enumerate(events):
+        if routing_key not in STOCK_HANDLERS:
+            outcomes[index] = ACK
+            continue
+        try:
+            parsed.append((index, routing_key, order_quantities(data.get('items'))))
+        except StockError as e:
+            logger.error(f"Sự kiện {routing_key} không hợp lệ: {str(e)}")
+            outcomes[index] = REJECT
+
+    if parsed:
+        with transaction.atomic():
+            stock = lock_products([product_id for _, _, quantities in parsed for product_id in quantities])
+            initial = dict(stock)
+            for index, routing_key, quantities in parsed:
+                snapshot = {product_id: stock.get(product_id) for product_id in quantities}
+                try:
+                    with transaction.atomic():
+                        STOCK_HANDLERS[routing_key](quantities, stock)
+                    outcomes[index] = ACK
+                except StockError as e:
+                    logger.error(str(e))
+                    outcomes[index] = REJECT
+                except Exception as e:
+                    logger.error(f"Lỗi khi xử lý {routing_key}: {str(e)}", exc_info=True)
+                    outcomes[index] = REQUEUE
+                if outcomes[index] != ACK:
+                    # Savepoint đã rollback: khôi phục số tồn trong bộ nhớ cho các đơn sau
+                    stock.update({key: value for key, value in snapshot.items() if value is not None})
+            # Tồn kho thay đổi không đi qua publish_product_event: xóa cache response của các sản phẩm
+            # có tồn kho thay đổi và cache facet của mọi worker (chạy sau khi transaction commit),
+            # ghi product.stock_changed vào outbox trong cùng transaction
+            # (cart_service làm mới tồn kho, order_service giao các đơn chờ hàng)
+            changed = sorted(product_id for product_id, value in stock.items() if value != initial[product_id])
+            response_cache.invalidate_products(changed)
+            if changed:
+                facet_cache.invalidate()
+            enqueue_events('product.stock_changed', [
+                {
+                    'event_id': uuid.uuid4().hex,  # để consumer bỏ qua message được gửi lại
+                    'product_id': product_id,
+                    'old_stock': initial[product_id],
+                    'new_stock': stock[product_id],
+                }
+                for product_id in changed
+            ])
+        logger.info(
+            f"Đã xử lý lô {len(events)} sự kiện kho: "
+            f"{outcomes.count(ACK)} ack, {outcomes.count(REJECT)} reject, {outcomes.count(REQUEUE)} requeue"
+        )
+    return outcomes
@@ -1,3 +1,717 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import jwt
+from pathlib import Path
+from unittest import mock
+import pika
+from django.db import DatabaseError, connection
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .models import DanhMuc, SanPham, HangSanXuat, ThongSo, ChiTietThongSo, OutboxEvent
+from .outbox import OutboxRelay
+from .consumers import ConsumerWorker, check_health, queue_concurrency, write_health
+from .rabbitmq import CONSUMER_QUEUES, handle_stock_batch, publish_product_event
+from .stock import ACK, REJECT, process_order_events
+from .facets import FacetCache, facet_cache, parse_price_buckets
+from .response_cache import product_tag, response_cache
+from .middleware import AuthMiddleware
+from .search import ProductSearchIndex, product_search_index
+from .serializers import SanPhamSerializer
+from .signals import product_event
 
-# Create your tests here.
+
+class SanPhamQueryCountTest(TestCase):
+    """
+    Đảm bảo danh sách sản phẩm dùng số truy vấn cố định, không phụ thuộc số dòng
+    """
+    # 1 truy vấn SanPham JOIN DanhMuc/HangSanXuat + 1 truy vấn prefetch ChiTietThongSo JOIN ThongSo
+    MAX_LIST_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.thong_so = [ThongSo.objects.create(TenThongSo=f"Thông số {i}") for i in range(3)]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _tao_san_pham(self, so_luong):
+        for i in range(so_luong):
+            danh_muc = DanhMuc.objects.create(TenDanhMuc=f"Danh mục {i}")
+            hang = HangSanXuat.objects.create(TenHangSanXuat=f"Hãng {i}")
+            san_pham = SanPham.objects.create(
+                TenSanPham=f"Sản phẩm {i}", MoTa="Mô tả", GiaBan=1000 + i,
+                SoLuongTon=10, DanhMuc=danh_muc, HangSanXuat=hang
+            )
+            for thong_so in self.thong_so:
+                ChiTietThongSo.objects.create(
+                    SanPham=san_pham, ThongSo=thong_so, GiaTriThongSo=f"Giá trị {i}"
+                )
+
+    def _dem_truy_van(self, url):
+        # Đếm truy vấn khi không có cache response
+        response_cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_constant(self):
+        self._tao_san_pham(3)
+        so_truy_van_it, _ = self._dem_truy_van('/api/products/san-pham/')
+
+        self._tao_san_pham(30)
+        so_truy_van_nhieu, response = self._dem_truy_van('/api/products/san-pham/')
+
+        self.assertEqual(so_truy_van_it, so_truy_van_nhieu)
+        self.assertLessEqual(so_truy_van_nhieu, self.MAX_LIST_QUERIES)
+        self.assertEqual(len(response.data['results'][0]['ChiTietThongSo']), len(self.thong_so))
+
+    def test_retrieve_query_count(self):
+        self._tao_san_pham(1)
+        san_pham = SanPham.objects.get()
+        so_truy_van, response = self._dem_truy_van(f'/api/products/san-pham/{san_pham.id}/')
+
+        self.assertLessEqual(so_truy_van, self.MAX_LIST_QUERIES)
+        self.assertEqual(response.data['TenDanhMuc'], san_pham.DanhMuc.TenDanhMuc)
+        self.assertEqual(response.data['TenHangSanXuat'], san_pham.HangSanXuat.TenHangSanXuat)
+
+
+class SanPhamKeysetPaginationTest(TestCase):
+    """
+    Kiểm tra phân trang keyset trên (NgayTao, id) cho danh sách sản phẩm
+    """
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        for i in range(7):
+            SanPham.objects.create(TenSanPham=f"Sản phẩm {i}", MoTa="Mô tả", GiaBan=1000)
+        # Gán cùng một NgayTao để buộc phải dùng id làm khóa phụ
+        SanPham.objects.update(NgayTao=SanPham.objects.first().NgayTao)
+
+    def test_cursor_walks_all_pages_without_duplicates(self):
+        url = '/api/products/san-pham/?page_size=3'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        expected = list(SanPham.objects.order_by('-NgayTao', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_legacy_full_dump(self):
+        response = self.client.get('/api/products/san-pham/?all=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/products/san-pham/?cursor=khong-hop-le')
+        self.assertEqual(response.status_code, 404)
+
+
+
+class SanPhamBatchTest(TestCase):
+    """
+    Kiểm tra endpoint lấy nhiều sản phẩm theo mã: map theo mã, danh sách mã thiếu và ETag
+    """
+    def setUp(self):
+        self.client = APIClient()
+        thong_so = ThongSo.objects.create(TenThongSo="Pin")
+        self.san_pham = []
+        for i in range(5):
+            san_pham = SanPham.objects.create(TenSanPham=f"Sản phẩm {i}", MoTa="Mô tả", GiaBan=1000 + i)
+            ChiTietThongSo.objects.create(SanPham=san_pham, ThongSo=thong_so, GiaTriThongSo="5000mAh")
+            self.san_pham.append(san_pham)
+
+    def test_products_by_id_and_missing(self):
+        a, b = self.san_pham[0].id, self.san_pham[3].id
+        response = self.client.get(f'/api/products/batch/?ids={b},999999,{a},{b}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['products']), {str(a), str(b)})
+        self.assertEqual(response.data['products'][str(b)]['TenSanPham'], "Sản phẩm 3")
+        self.assertEqual(len(response.data['products'][str(a)]['ChiTietThongSo']), 1)
+        self.assertEqual(response.data['missing'], [999999])
+
+    def test_query_count_is_constant(self):
+        def dem(ids):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/products/san-pham/batch/?ids=' + ','.join(map(str, ids)))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        ids = [san_pham.id for san_pham in self.san_pham]
+        self.assertEqual(dem(ids[:1]), dem(ids))
+        self.assertLessEqual(dem(ids), SanPhamQueryCountTest.MAX_LIST_QUERIES)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get('/api/products/batch/').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/batch/?ids=1,abc').status_code, 400)
+        with override_settings(PRODUCT_BATCH_MAX_IDS=2):
+            self.assertEqual(self.client.get('/api/products/batch/?ids=1,2,3').status_code, 400)
+
+    def test_etag_not_modified(self):
+        url = f'/api/products/batch/?ids={self.san_pham[0].id},{self.san_pham[1].id}'
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        SanPham.objects.filter(id=self.san_pham[0].id).update(GiaBan=5000)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ProductSearchIndexTest(TestCase):
+    """
+    Kiểm tra chỉ mục tìm kiếm: bỏ dấu tiếng Việt, xếp hạng và tìm theo tiền tố
+    """
+    def setUp(self):
+        self.client = APIClient()
+        pin = ThongSo.objects.create(TenThongSo="Pin")
+        self.dien_thoai = SanPham.objects.create(
+            TenSanPham="Điện thoại Samsung Galaxy", MoTa="Màn hình lớn", GiaBan=1000
+        )
+        self.op_lung = SanPham.objects.create(
+            TenSanPham="Ốp lưng", MoTa="Phụ kiện cho điện thoại", GiaBan=100
+        )
+        self.laptop = SanPham.objects.create(TenSanPham="Laptop Dell", MoTa="Văn phòng", GiaBan=2000)
+        ChiTietThongSo.objects.create(SanPham=self.laptop, ThongSo=pin, GiaTriThongSo="5000 mAh")
+        product_search_index.rebuild()
+        response_cache.clear()
+
+    def test_diacritic_folding_and_ranking(self):
+        ids = [product_id for product_id, _ in product_search_index.search("dien thoai")]
+        # Khớp ở tên được xếp trên khớp ở mô tả
+        self.assertEqual(ids, [self.dien_thoai.id, self.op_lung.id])
+
+    def test_search_covers_spec_values(self):
+        ids = [product_id for product_id, _ in product_search_index.search("mah")]
+        self.assertEqual(ids, [self.laptop.id])
+
+    def test_prefix_suggest(self):
+        suggestions = product_search_index.suggest("sams")
+        self.assertEqual(suggestions, [{'id': self.dien_thoai.id, 'TenSanPham': self.dien_thoai.TenSanPham}])
+
+    def test_index_follows_product_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_event.send(sender=SanPham, event_type='deleted', product={'id': self.laptop.id})
+        self.assertEqual(product_search_index.search("laptop"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product_event.send(sender=SanPham, event_type='updated', product={
+                'id': self.laptop.id, 'TenSanPham': "Laptop Asus", 'MoTa': "", 'ChiTietThongSo': []
+            })
+        self.assertEqual([pid for pid, _ in product_search_index.search("asus")], [self.laptop.id])
+
+    def test_rolled_back_update_leaves_index_unchanged(self):
+        # Ghi outbox lỗi: transaction của view rollback sau khi sự kiện đã được phát
+        with mock.patch('products.rabbitmq.enqueue_event', side_effect=DatabaseError("outbox")), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(DatabaseError):
+                self.client.patch(f'/api/products/san-pham/{self.laptop.id}/', {'TenSanPham': "Laptop Asus"})
+            with self.assertRaises(DatabaseError):
+                self.client.delete(f'/api/products/san-pham/{self.dien_thoai.id}/')
+        self.assertEqual(callbacks, [])
+        self.assertEqual(SanPham.objects.get(id=self.laptop.id).TenSanPham, "Laptop Dell")
+        self.assertEqual(product_search_index.search("asus"), [])
+        self.assertEqual([pid for pid, _ in product_search_index.search("laptop")], [self.laptop.id])
+        self.assertEqual([pid for pid, _ in product_search_index.search("samsung")], [self.dien_thoai.id])
+
+    def test_list_search_param_uses_index(self):
+        response = self.client.get('/api/products/san-pham/?search=ĐIỆN THOẠI')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['id'] for item in response.data['results']}, {self.dien_thoai.id, self.op_lung.id})
+
+    def test_concurrent_ensure_fresh_rebuilds_once(self):
+        index = ProductSearchIndex(max_age=300)
+
+        def slow_rebuild():
+            time.sleep(0.05)
+            index._built_at = time.monotonic()
+
+        with mock.patch.object(index, 'rebuild', side_effect=slow_rebuild) as rebuild:
+            threads = [threading.Thread(target=index.ensure_fresh) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(rebuild.call_count, 1)
+
+            # Hết max_age thì dựng lại một lần nữa
+            index._built_at -= 301
+            index.ensure_fresh()
+            index.ensure_fresh()
+            self.assertEqual(rebuild.call_count, 2)
+
+
+class SanPhamFacetTest(TestCase):
+    """
+    Kiểm tra endpoint facet và việc cập nhật tăng dần theo sự kiện sản phẩm
+    """
+    def setUp(self):
+        self.client = APIClient()
+        facet_cache.clear()
+        self.dien_thoai = DanhMuc.objects.create(TenDanhMuc="Điện thoại")
+        self.samsung = HangSanXuat.objects.create(TenHangSanXuat="Samsung")
+        self.apple = HangSanXuat.objects.create(TenHangSanXuat="Apple")
+        self.ram = ThongSo.objects.create(TenThongSo="RAM")
+        for i, (hang, gia) in enumerate([(self.samsung, 4000000), (self.samsung, 12000000), (self.apple, 25000000)]):
+            san_pham = SanPham.objects.create(
+                TenSanPham=f"Máy {i}", MoTa="", GiaBan=gia,
+                DanhMuc=self.dien_thoai, HangSanXuat=hang
+            )
+            ChiTietThongSo.objects.create(SanPham=san_pham, ThongSo=self.ram, GiaTriThongSo="8GB")
+
+    def _facets(self, query=''):
+        response = self.client.get(f'/api/products/san-pham/facets/?price_buckets=5000000,20000000{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_counts(self):
+        data = self._facets()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(
+            [(item['TenHangSanXuat'], item['count']) for item in data['hang_san_xuat']],
+            [("Samsung", 2), ("Apple", 1)]
+        )
+        self.assertEqual([bucket['count'] for bucket in data['khoang_gia']], [1, 1, 1])
+        self.assertEqual(data['thong_so'][0]['values'], [{'GiaTriThongSo': "8GB", 'count': 3}])
+
+        data = self._facets(f'&hang_san_xuat={self.apple.id}')
+        self.assertEqual(data['total'], 1)
+
+    def test_incremental_update_matches_recompute(self):
+        self._facets()
+        self._facets(f'&hang_san_xuat={self.apple.id}')
+
+        san_pham = SanPham.objects.filter(HangSanXuat=self.samsung).first()
+        san_pham.HangSanXuat = self.apple
+        san_pham.GiaBan = 30000000
+        san_pham.save()
+        san_pham.chi_tiet_thong_so.update(GiaTriThongSo="12GB")
+        with self.captureOnCommitCallbacks(execute=True):
+            product_event.send(
+                sender=SanPham, event_type='updated',
+                product=SanPhamSerializer(SanPham.objects.with_related().get(id=san_pham.id)).data
+            )
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached_all = self._facets()
+            cached_apple = self._facets(f'&hang_san_xuat={self.apple.id}')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        facet_cache.clear()
+        self.assertEqual(cached_all, self._facets())
+        self.assertEqual(cached_apple, self._facets(f'&hang_san_xuat={self.apple.id}'))
+
+    def test_filter_values_are_parsed(self):
+        expected = self._facets(f'&hang_san_xuat={self.samsung.id}')
+        self.assertEqual(expected['total'], 2)
+        for raw in (f'0{self.samsung.id}', f'%20{self.samsung.id}%20'):
+            self.assertEqual(self._facets(f'&hang_san_xuat={raw}'), expected)
+        self.assertEqual(self._facets('&min_price=%2012000000')['total'], 2)
+
+        for query in ('danh_muc=abc', 'hang_san_xuat=1.5', 'min_price=re', 'max_price=NaN'):
+            for url in ('/api/products/san-pham/facets/', '/api/products/san-pham/'):
+                with self.subTest(url=url, query=query):
+                    self.assertEqual(self.client.get(f'{url}?{query}').status_code, 400)
+        response = self.client.get(f'/api/products/san-pham/?hang_san_xuat=0{self.samsung.id}')
+        self.assertEqual(len(response.data['results']), 2)
+
+        # Entry được cập nhật tăng dần với bộ lọc đã parse: sản phẩm chuyển sang Samsung được tính
+        san_pham = SanPham.objects.filter(HangSanXuat=self.apple).first()
+        san_pham.HangSanXuat = self.samsung
+        san_pham.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            product_event.send(
+                sender=SanPham, event_type='updated',
+                product=SanPhamSerializer(SanPham.objects.with_related().get(id=san_pham.id)).data
+            )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._facets(f'&hang_san_xuat=0{self.samsung.id}')['total'], 3)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_workers_share_generation(self):
+        # Hai worker: mỗi worker có FacetCache riêng, dùng chung Redis
+        other = FacetCache()
+        queryset = SanPham.objects.all()
+        boundaries = parse_price_buckets()
+        before = other.get({}, boundaries, queryset)
+        self._facets()
+
+        san_pham = SanPham.objects.filter(HangSanXuat=self.samsung).first()
+        san_pham.HangSanXuat = self.apple
+        san_pham.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            product_event.send(
+                sender=SanPham, event_type='updated',
+                product=SanPhamSerializer(SanPham.objects.with_related().get(id=san_pham.id)).data
+            )
+        # Worker nhận sự kiện cập nhật tăng dần; worker kia tính lại
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._facets()
+        self.assertEqual(len(ctx.captured_queries), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            after = other.get({}, boundaries, queryset)
+        self.assertGreater(len(ctx.captured_queries), 0)
+        self.assertNotEqual(before['hang_san_xuat'], after['hang_san_xuat'])
+        self.assertEqual(after['hang_san_xuat'], data['hang_san_xuat'])
+
+        # Tồn kho thay đổi cũng làm mới cache của mọi worker
+        SanPham.objects.filter(id=san_pham.id).update(SoLuongTon=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            process_order_events([('order.created', {'items': [{'product_id': san_pham.id, 'quantity': 1}]})])
+        with CaptureQueriesContext(connection) as ctx:
+            other.get({}, boundaries, queryset)
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+    def test_rolled_back_update_leaves_counts_unchanged(self):
+        before = self._facets()
+        san_pham = SanPham.objects.filter(HangSanXuat=self.samsung).first()
+        with mock.patch('products.rabbitmq.enqueue_event', side_effect=DatabaseError("outbox")), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(DatabaseError):
+                APIClient().patch(f'/api/products/san-pham/{san_pham.id}/', {'HangSanXuat': self.apple.id})
+        self.assertEqual(callbacks, [])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._facets(), before)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+
+class ResponseCacheTest(TestCase):
+    """
+    Kiểm tra cache response (Redis + L1): ETag/Cache-Control và xóa cache đúng phạm vi theo sự kiện
+    """
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        self.danh_muc = DanhMuc.objects.create(TenDanhMuc="Điện thoại")
+        self.a = SanPham.objects.create(TenSanPham="A", MoTa="", GiaBan=1000, SoLuongTon=5, DanhMuc=self.danh_muc)
+        self.b = SanPham.objects.create(TenSanPham="B", MoTa="", GiaBan=2000, SoLuongTon=5, DanhMuc=self.danh_muc)
+
+    def _get(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, **headers)
+        return len(ctx.captured_queries), response
+
+    def _publish(self, event_type, san_pham):
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_product_event(
+                event_type, SanPhamSerializer(SanPham.objects.with_related().get(id=san_pham.id)).data
+            )
+
+    def test_hit_skips_database_and_sets_headers(self):
+        so_truy_van, first = self._get('/api/products/san-pham/?page_size=5&danh_muc=')
+        self.assertGreater(so_truy_van, 0)
+
+        # Tham số được chuẩn hóa: thứ tự và tham số rỗng không tạo entry mới
+        so_truy_van, second = self._get('/api/products/san-pham/?danh_muc=&page_size=5')
+        self.assertEqual(so_truy_van, 0)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('must-revalidate', second['Cache-Control'])
+
+        so_truy_van, response = self._get('/api/products/san-pham/?page_size=5', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((so_truy_van, response.status_code), (0, 304))
+
+    def test_missing_product_creates_no_tag(self):
+        for product_id in (999998, 999999):
+            response = self.client.get(f'/api/products/san-pham/{product_id}/')
+            self.assertEqual(response.status_code, 404)
+            self.assertIsNone(response_cache.cache.get(response_cache._version_key(product_tag(product_id))))
+
+        self.client.get(f'/api/products/san-pham/{self.a.id}/')
+        ttl = response_cache.cache.ttl(response_cache._version_key(product_tag(self.a.id)))
+        self.assertIsNotNone(ttl)
+        self.assertGreaterEqual(ttl, response_cache.timeout)
+
+    def test_shared_between_processes(self):
+        self.client.get('/api/products/danh-muc/')
+        # Process khác (L1 trống) đọc entry từ Redis
+        response_cache._local.clear()
+        so_truy_van, response = self._get('/api/products/danh-muc/')
+        self.assertEqual(so_truy_van, 0)
+        self.assertEqual(response.data[0]['TenDanhMuc'], "Điện thoại")
+
+    def test_product_event_invalidates_list_and_own_detail(self):
+        self.client.get('/api/products/san-pham/')
+        self.client.get(f'/api/products/san-pham/{self.a.id}/')
+        self.client.get(f'/api/products/san-pham/{self.b.id}/')
+
+        SanPham.objects.filter(id=self.a.id).update(GiaBan=1500)
+        self._publish('updated', self.a)
+
+        _, response = self._get(f'/api/products/san-pham/{self.a.id}/')
+        self.assertEqual(float(response.data['GiaBan']), 1500)
+        so_truy_van, response = self._get('/api/products/san-pham/')
+        self.assertGreater(so_truy_van, 0)
+        self.assertIn(1500, [float(item['GiaBan']) for item in response.data['results']])
+        # Sản phẩm khác vẫn dùng cache
+        so_truy_van, _ = self._get(f'/api/products/san-pham/{self.b.id}/')
+        self.assertEqual(so_truy_van, 0)
+
+    def test_reference_data_change_invalidates_products(self):
+        self.client.get('/api/products/danh-muc/')
+        self.client.get(f'/api/products/san-pham/{self.a.id}/')
+        self.client.get('/api/products/hang-san-xuat/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/products/danh-muc/{self.danh_muc.id}/', {'TenDanhMuc': "Di động"})
+        self.assertEqual(response.status_code, 200)
+
+        _, response = self._get('/api/products/danh-muc/')
+        self.assertEqual(response.data[0]['TenDanhMuc'], "Di động")
+        _, response = self._get(f'/api/products/san-pham/{self.a.id}/')
+        self.assertEqual(response.data['TenDanhMuc'], "Di động")
+        so_truy_van, _ = self._get('/api/products/hang-san-xuat/')
+        self.assertEqual(so_truy_van, 0)
+
+    def test_stock_change_invalidates_product(self):
+        self.client.get(f'/api/products/san-pham/{self.a.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            process_order_events([('order.created', {'items': [{'product_id': self.a.id, 'quantity': 2}]})])
+        _, response = self._get(f'/api/products/san-pham/{self.a.id}/')
+        self.assertEqual(response.data['SoLuongTon'], 3)
+
+class FakeConfirmBroker:
+    """
+    Kênh/kết nối RabbitMQ giả: ghi lại message được publish, ack/nack cả lô khi relay chờ xác nhận
+    """
+    def __init__(self, relay, nack=lambda body: False):
+        self.relay = relay
+        self.nack = nack
+        self.bodies = []
+        self.waits = 0
+        self._tag = 0
+        self._pending = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self._tag += 1
+        self.bodies.append(body)
+        self._pending.append((self._tag, body))
+
+    def process_data_events(self, time_limit=None):
+        self.waits += 1
+        pending, self._pending = self._pending, []
+        for tag, body in pending:
+            if self.nack(body):
+                self.relay._on_confirm(mock.Mock(method=pika.spec.Basic.Nack(delivery_tag=tag)))
+        if pending:
+            # Một Basic.Ack multiple=True cho các message còn lại
+            self.relay._on_confirm(mock.Mock(method=pika.spec.Basic.Ack(delivery_tag=pending[-1][0], multiple=True)))
+
+    def attach(self):
+        self.relay._connection = self
+        return mock.patch.object(OutboxRelay, '_get_channel', return_value=self)
+
+
+class OutboxRelayTest(TestCase):
+    """
+    Kiểm tra sự kiện được ghi vào outbox và relay chỉ đánh dấu các sự kiện đã được broker xác nhận
+    """
+    def test_publish_writes_outbox_row(self):
+        publish_product_event('deleted', {'id': 1})
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.routing_key, 'product.deleted')
+        self.assertEqual(event.payload, {'event_type': 'deleted', 'product': {'id': 1}})
+        self.assertIsNone(event.published_at)
+
+    def test_relay_marks_confirmed_events(self):
+        for product_id in range(3):
+            publish_product_event('deleted', {'id': product_id})
+        rejected = OutboxEvent.objects.order_by('id')[1]
+
+        relay = OutboxRelay(batch_size=10)
+        # Broker từ chối sự kiện thứ hai ở lần gửi đầu tiên
+        broker = FakeConfirmBroker(relay, nack=lambda body: '"id": 1' in body and broker.bodies.count(body) == 1)
+        with broker.attach():
+            self.assertEqual(relay.relay_batch(), 2)
+            # Cả lô chỉ chờ xác nhận một lần
+            self.assertEqual(broker.waits, 1)
+            rejected.refresh_from_db()
+            self.assertIsNone(rejected.published_at)
+            self.assertEqual(rejected.attempts, 1)
+
+            # Lô sau chỉ gửi lại sự kiện bị từ chối
+            self.assertEqual(relay.relay_batch(), 1)
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        self.assertEqual(len(broker.bodies), 4)
+
+    @override_settings(OUTBOX_RELAY_MAX_ATTEMPTS=2)
+    def test_rejected_event_is_parked(self):
+        for product_id in range(3):
+            publish_product_event('deleted', {'id': product_id})
+        rejected = OutboxEvent.objects.order_by('id')[0]
+
+        relay = OutboxRelay(batch_size=1)
+        broker = FakeConfirmBroker(relay, nack=lambda body: '"id": 0' in body)
+        with broker.attach():
+            self.assertEqual(relay.relay_batch(), 0)
+            self.assertEqual(relay.relay_batch(), 0)
+            rejected.refresh_from_db()
+            self.assertEqual(rejected.attempts, 2)
+            self.assertIsNotNone(rejected.failed_at)
+            # Sự kiện bị ngừng gửi không chặn các sự kiện sau nó
+            self.assertEqual(relay.relay_batch(), 1)
+            self.assertEqual(relay.relay_batch(), 1)
+            self.assertEqual(relay.relay_batch(), 0)
+        self.assertEqual(len(broker.bodies), 4)
+
+        self.assertEqual(relay.requeue_failed(), 1)
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.attempts, rejected.failed_at), (0, None))
+
+    @override_settings(OUTBOX_RELAY_CONFIRM_TIMEOUT=0.01)
+    def test_unconfirmed_events_stay_pending(self):
+        publish_product_event('deleted', {'id': 1})
+        relay = OutboxRelay(batch_size=10)
+        broker = FakeConfirmBroker(relay)
+        broker.process_data_events = lambda time_limit=None: time.sleep(time_limit)
+        with broker.attach(), mock.patch.object(OutboxRelay, 'close') as close:
+            self.assertEqual(relay.relay_batch(), 0)
+        close.assert_called_once()
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.published_at, event.attempts), (None, 0))
+
+
+class StockBatchConsumerTest(TestCase):
+    """
+    Kiểm tra trừ/hoàn kho theo lô: mỗi đơn hàng thành công hoặc thất bại trọn vẹn
+    """
+    def setUp(self):
+        self.a = SanPham.objects.create(TenSanPham="A", MoTa="", GiaBan=1000, SoLuongTon=5)
+        self.b = SanPham.objects.create(TenSanPham="B", MoTa="", GiaBan=1000, SoLuongTon=2)
+
+    def _order(self, *items):
+        return {'items': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in items]}
+
+    def _stock(self):
+        return dict(SanPham.objects.values_list('id', 'SoLuongTon'))
+
+    def test_batch_outcomes_and_stock(self):
+        events = [
+            ('order.created', self._order((self.a.id, 2), (self.b.id, 1))),
+            # Không đủ hàng B: cả đơn bị từ chối, A không bị trừ
+            ('order.created', self._order((self.a.id, 1), (self.b.id, 5))),
+            # Cùng sản phẩm xuất hiện hai dòng được gộp lại
+            ('order.created', self._order((self.a.id, 1), (self.a.id, 1))),
+            ('order.created', self._order((999, 1))),
+            ('order.cancelled', self._order((self.b.id, 1))),
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            outcomes = process_order_events(events)
+        self.assertEqual(outcomes, [ACK, REJECT, ACK, REJECT, ACK])
+        self.assertEqual(self._stock(), {self.a.id: 1, self.b.id: 2})
+        locks = [query['sql'] for query in ctx.captured_queries if 'SoLuongTon' in query['sql'] and 'SELECT' in query['sql']]
+        self.assertEqual(len(locks), 1)
+
+        # Chỉ sản phẩm có tồn kho thay đổi được báo product.stock_changed (B: -1 rồi +1)
+        events = OutboxEvent.objects.filter(routing_key='product.stock_changed')
+        self.assertEqual(
+            [{key: value for key, value in event.payload.items() if key != 'event_id'} for event in events],
+            [{'product_id': self.a.id, 'old_stock': 5, 'new_stock': 1}],
+        )
+        self.assertEqual(len(events[0].payload['event_id']), 32)
+
+    def test_handle_batch_acks_once_when_all_succeed(self):
+        channel = mock.Mock()
+        messages = [
+            (mock.Mock(routing_key='order.created', delivery_tag=tag), json.dumps(self._order((self.a.id, 1))))
+            for tag in (1, 2)
+        ]
+        handle_stock_batch(channel, messages)
+        channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+        channel.basic_nack.assert_not_called()
+
+        channel.reset_mock()
+        messages = [
+            (mock.Mock(routing_key='order.created', delivery_tag=3), json.dumps(self._order((self.b.id, 9)))),
+            (mock.Mock(routing_key='order.created', delivery_tag=4), b'not json'),
+        ]
+        handle_stock_batch(channel, messages)
+        channel.basic_nack.assert_has_calls([
+            mock.call(delivery_tag=3, requeue=False),
+            mock.call(delivery_tag=4, requeue=False),
+        ])
+        self.assertEqual(self._stock(), {self.a.id: 3, self.b.id: 2})
+
+
+class ConsumerHealthTest(TestCase):
+    """
+    Kiểm tra cấu hình số channel theo queue và báo cáo health của run_consumers
+    """
+    def test_queue_concurrency_override(self):
+        spec = CONSUMER_QUEUES[0]
+        self.assertEqual(queue_concurrency(spec, 2), 2)
+        with override_settings(CONSUMER_QUEUE_CONCURRENCY={spec.name: 4}):
+            self.assertEqual(queue_concurrency(spec, 2), 4)
+
+    def test_check_health(self):
+        with tempfile.TemporaryDirectory() as health_dir:
+            self.assertFalse(check_health(health_dir)[0])
+
+            worker = ConsumerWorker(CONSUMER_QUEUES[0], 0, threading.Event())
+            worker.stats.connected = True
+            worker.stats.record(3)
+            write_health(os.path.join(health_dir, 'consumer-0.json'), 0, [worker])
+            ok, reports = check_health(health_dir)
+            self.assertTrue(ok)
+            self.assertEqual(reports[0]['workers'][0]['processed'], 3)
+
+            worker.stats.connected = False
+            write_health(os.path.join(health_dir, 'consumer-0.json'), 0, [worker])
+            self.assertFalse(check_health(health_dir)[0])
+
+
+class AuthMiddlewareTest(TestCase):
+    """
+    Token được xác thực tại chỗ, không gọi auth_service trên đường đọc catalog
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = AuthMiddleware(lambda request: request)
+
+    def _token(self, key=None, **claims):
+        payload = {'token_type': 'access', 'user_id': 7, 'jti': 'abc', 'exp': int(time.time()) + 60}
+        payload.update(claims)
+        return jwt.encode(payload, key or settings.JWT_SECRET_KEY, algorithm='HS256')
+
+    def _request(self, token):
+        return self.middleware(self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    @mock.patch('requests.Session.request')
+    def test_verifies_locally(self, requests_get):
+        self.assertEqual(self._request(self._token()).user_data['user_id'], 7)
+        self.assertIsNone(self._request(self._token(key='khoa-khac')).user_data)
+        self.assertIsNone(self._request(self._token(exp=int(time.time()) - 1)).user_data)
+        self.assertIsNone(self._request(self._token(token_type='refresh')).user_data)
+        requests_get.assert_not_called()
+
+
+class SharedModuleCopyTest(SimpleTestCase):
+    """
+    Các module dùng chung trong service này khớp bản gốc ở services/common/ (services/common/sync_copies.py)
+    """
+    def test_matches_common(self):
+        script = Path(__file__).resolve().parents[2] / 'common' / 'sync_copies.py'
+        if not script.exists():
+            self.skipTest('Không có services/common (chạy trong container của service)')
+        spec = importlib.util.spec_from_file_location('sync_copies', script)
+        sync_copies = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sync_copies)
+        service = Path(__file__).resolve().parents[1]
+        stale = [
+            str(copy.relative_to(sync_copies.SERVICES_DIR))
+            for _, copy in sync_copies.stale_copies() if service in copy.parents
+        ]
+        self.assertEqual(stale, [], 'Bản sao lệch với bản gốc, chạy python services/common/sync_copies.py')
@@ -13,5 +13,7 @@ router.register('chi-tiet-thong-so', ChiTietThongSoViewSet, basename='chi-tiet-t
 router.register('san-pham', SanPhamViewSet, basename='san-pham')
 
 urlpatterns = [
+    # Lấy nhiều sản phẩm theo mã: /api/products/batch/?ids=1,2,3 (cùng action san-pham/batch/)
+    path('batch/', SanPhamViewSet.as_view({'get': 'batch'}), name='san-pham-batch-lookup'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
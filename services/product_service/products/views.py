@@ -2,79 +2,250 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import ParseError
+from django.db import transaction
 from .models import DanhMuc, SanPham, HangSanXuat, ThongSo, ChiTietThongSo
 from .serializers import (
     DanhMucSerializer, SanPhamSerializer,
     HangSanXuatSerializer, ThongSoSerializer, ChiTietThongSoSerializer
 )
 from .middleware import auth_required
+from .pagination import KeysetPagination
+from .search import product_search_index
+from .facets import facet_cache, parse_filters, parse_price_buckets
 from .rabbitmq import publish_product_event
+from .http_cache import conditional_response
+from .response_cache import PRODUCT_LIST_TAG, PRODUCT_TAG, product_tag, response_cache
+from django.conf import settings
 import os
 
-class DanhMucViewSet(viewsets.ModelViewSet):
+class CachedReadMixin:
+    """
+    list/retrieve đi qua response_cache (Redis + L1, kèm ETag và Cache-Control).
+    Tag của response do list_cache_tags/retrieve_cache_tags quyết định.
+    """
+    response_cache_tag = None
+
+    def list_cache_tags(self):
+        return (self.response_cache_tag,)
+
+    def retrieve_cache_tags(self):
+        return (self.response_cache_tag,)
+
+    def list(self, request, *args, **kwargs):
+        return response_cache.respond(
+            request, self.list_cache_tags(), lambda: super(CachedReadMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return response_cache.respond(
+            request, self.retrieve_cache_tags(), lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+class FacetInvalidationMixin:
+    """
+    Xóa cache facet và cache response khi dữ liệu tham chiếu (danh mục, hãng, thông số) thay đổi,
+    vì các thay đổi này không đi qua publish_product_event
+    """
+    def invalidation_tags(self, instance):
+        # Response sản phẩm có tên danh mục/hãng/thông số nên mọi response sản phẩm đều bị ảnh hưởng
+        return tuple(tag for tag in (self.response_cache_tag, PRODUCT_TAG) if tag)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        facet_cache.invalidate()
+        response_cache.invalidate(*self.invalidation_tags(serializer.instance))
+
+    def perform_update(self, serializer):
+        tags = self.invalidation_tags(serializer.instance)
+        super().perform_update(serializer)
+        facet_cache.invalidate()
+        response_cache.invalidate(*tags, *self.invalidation_tags(serializer.instance))
+
+    def perform_destroy(self, instance):
+        tags = self.invalidation_tags(instance)
+        super().perform_destroy(instance)
+        facet_cache.invalidate()
+        response_cache.invalidate(*tags)
+
+class DanhMucViewSet(FacetInvalidationMixin, CachedReadMixin, viewsets.ModelViewSet):
     queryset = DanhMuc.objects.all()
     serializer_class = DanhMucSerializer
+    response_cache_tag = 'danh-muc'
 
-class HangSanXuatViewSet(viewsets.ModelViewSet):
+class HangSanXuatViewSet(FacetInvalidationMixin, CachedReadMixin, viewsets.ModelViewSet):
     queryset = HangSanXuat.objects.all()
     serializer_class = HangSanXuatSerializer
+    response_cache_tag = 'hang-san-xuat'
 
-class ThongSoViewSet(viewsets.ModelViewSet):
+class ThongSoViewSet(FacetInvalidationMixin, CachedReadMixin, viewsets.ModelViewSet):
     queryset = ThongSo.objects.all()
     serializer_class = ThongSoSerializer
+    response_cache_tag = 'thong-so'
 
-class ChiTietThongSoViewSet(viewsets.ModelViewSet):
-    queryset = ChiTietThongSo.objects.all()
+class ChiTietThongSoViewSet(FacetInvalidationMixin, viewsets.ModelViewSet):
+    queryset = ChiTietThongSo.objects.select_related('ThongSo')
     serializer_class = ChiTietThongSoSerializer
 
-class SanPhamViewSet(viewsets.ModelViewSet):
+    def invalidation_tags(self, instance):
+        # Chỉ sản phẩm chứa chi tiết thông số này thay đổi
+        return (PRODUCT_LIST_TAG, product_tag(instance.SanPham_id))
+
+class SanPhamViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = SanPham.objects.all()
     serializer_class = SanPhamSerializer
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = KeysetPagination
+    
+    def list_cache_tags(self):
+        return (PRODUCT_TAG, PRODUCT_LIST_TAG)
+    
+    def retrieve_cache_tags(self):
+        # Chuẩn hóa mã để /san-pham/05/ và /san-pham/5/ dùng chung tag
+        pk = str(self.kwargs.get(self.lookup_field, ''))
+        return (PRODUCT_TAG, product_tag(int(pk) if pk.isdigit() else pk))
     
     def get_queryset(self):
-        queryset = SanPham.objects.all()
+        # Join danh mục/hãng sản xuất và prefetch thông số trong một lượt
+        return self.filter_products(SanPham.objects.with_related())
+    
+    def get_filters(self):
+        """
+        Tham số lọc đã kiểm tra (facets.parse_filters); giá trị sai trả về 400
+        """
+        try:
+            return parse_filters(self.request.query_params)
+        except ValueError as e:
+            raise ParseError(str(e))
+    
+    def filter_products(self, queryset):
+        filters = self.get_filters()
         
         # Lọc theo danh mục
-        danh_muc_id = self.request.query_params.get('danh_muc')
-        if danh_muc_id:
-            queryset = queryset.filter(DanhMuc_id=danh_muc_id)
+        if filters['danh_muc'] is not None:
+            queryset = queryset.filter(DanhMuc_id=filters['danh_muc'])
         
-        # Lọc theo tên
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(TenSanPham__icontains=search)
+        # Tìm kiếm theo tên, mô tả và thông số qua chỉ mục (không phân biệt dấu)
+        for param in ('search', 'ten'):
+            keyword = filters[param]
+            if keyword:
+                matched_ids = [product_id for product_id, _ in product_search_index.search(keyword)]
+                queryset = queryset.filter(id__in=matched_ids)
         
         # Lọc theo khoảng giá
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        
-        if min_price:
-            queryset = queryset.filter(GiaBan__gte=min_price)
+        if filters['min_price'] is not None:
+            queryset = queryset.filter(GiaBan__gte=filters['min_price'])
         
-        if max_price:
-            queryset = queryset.filter(GiaBan__lte=max_price)
-        
-        # Lọc theo tên
-        ten = self.request.query_params.get('ten')
-        if ten:
-            queryset = queryset.filter(TenSanPham__icontains=ten)
+        if filters['max_price'] is not None:
+            queryset = queryset.filter(GiaBan__lte=filters['max_price'])
         
         # Lọc theo hãng sản xuất
-        hang_san_xuat = self.request.query_params.get('hang_san_xuat')
-        if hang_san_xuat:
-            queryset = queryset.filter(HangSanXuat_id=hang_san_xuat)
+        if filters['hang_san_xuat'] is not None:
+            queryset = queryset.filter(HangSanXuat_id=filters['hang_san_xuat'])
         
         return queryset
     
+    def _get_limit(self, request, default, maximum):
+        try:
+            limit = int(request.query_params.get('limit', default))
+        except (TypeError, ValueError):
+            return default
+        return max(1, min(limit, maximum))
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Số lượng sản phẩm theo danh mục, hãng, khoảng giá và giá trị thông số cho bộ lọc hiện tại
+        """
+        try:
+            boundaries = parse_price_buckets(request.query_params.get('price_buckets'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        filters = self.get_filters()
+        queryset = self.filter_products(SanPham.objects.all())
+        return Response(facet_cache.get(filters, boundaries, queryset))
+    
+    def _parse_ids(self, request):
+        """
+        Đọc danh sách mã sản phẩm từ ?ids=1,2,3 (có thể lặp lại ?ids=), giữ thứ tự và bỏ trùng
+        """
+        ids = []
+        for value in request.query_params.getlist('ids'):
+            for part in value.split(','):
+                part = part.strip()
+                if not part:
+                    continue
+                if not part.isdigit():
+                    raise ValueError(f"Mã sản phẩm không hợp lệ: {part}")
+                ids.append(int(part))
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise ValueError("Cần tham số ids, ví dụ ?ids=1,2,3")
+        max_ids = int(getattr(settings, 'PRODUCT_BATCH_MAX_IDS', 500))
+        if len(ids) > max_ids:
+            raise ValueError(f"Tối đa {max_ids} mã sản phẩm mỗi lần")
+        return ids
+    
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """
+        Lấy nhiều sản phẩm theo mã trong một truy vấn (kèm prefetch):
+        {"products": {"<id>": {...}}, "missing": [...]}. Hỗ trợ ETag/If-None-Match.
+        """
+        try:
+            ids = self._parse_ids(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        products = SanPham.objects.with_related().in_bulk(ids)
+        data = {
+            'products': {
+                str(product_id): SanPhamSerializer(products[product_id], context={'request': request}).data
+                for product_id in ids if product_id in products
+            },
+            'missing': [product_id for product_id in ids if product_id not in products],
+        }
+        return conditional_response(request, data)
+    
+    @action(detail=False, methods=['get'], url_path='search')
+    def search_products(self, request):
+        """
+        Tìm kiếm sản phẩm, sắp xếp theo độ liên quan
+        """
+        query = request.query_params.get('q', '')
+        ranked = product_search_index.search(query, limit=self._get_limit(request, 20, 100))
+        products = SanPham.objects.with_related().in_bulk([product_id for product_id, _ in ranked])
+        
+        results = []
+        for product_id, score in ranked:
+            san_pham = products.get(product_id)
+            if san_pham is None:
+                continue
+            data = SanPhamSerializer(san_pham, context={'request': request}).data
+            data['score'] = round(score, 4)
+            results.append(data)
+        
+        return Response({'query': query, 'count': len(results), 'results': results})
+    
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Gợi ý tên sản phẩm theo tiền tố (typeahead), chỉ đọc từ chỉ mục trong bộ nhớ
+        """
+        query = request.query_params.get('q', '')
+        suggestions = product_search_index.suggest(query, limit=self._get_limit(request, 10, 50))
+        return Response({'query': query, 'results': suggestions})
+    
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        san_pham = serializer.save()
-        
-        # Publish sự kiện tạo sản phẩm
-        san_pham_data = SanPhamSerializer(san_pham, context={'request': request}).data
-        publish_product_event('created', san_pham_data)
+        with transaction.atomic():
+            san_pham = serializer.save()
+            
+            # Ghi sự kiện tạo sản phẩm vào outbox cùng transaction
+            san_pham_data = SanPhamSerializer(san_pham, context={'request': request}).data
+            publish_product_event('created', san_pham_data)
         
         headers = self.get_success_headers(serializer.data)
         return Response(san_pham_data, status=status.HTTP_201_CREATED, headers=headers)
@@ -84,11 +255,16 @@ class SanPhamViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        san_pham = serializer.save()
-        
-        # Publish sự kiện cập nhật sản phẩm
-        san_pham_data = SanPhamSerializer(san_pham, context={'request': request}).data
-        publish_product_event('updated', san_pham_data)
+        with transaction.atomic():
+            san_pham = serializer.save()
+            
+            # Bỏ cache prefetch cũ vì chi tiết thông số có thể vừa được tạo lại
+            if getattr(san_pham, '_prefetched_objects_cache', None):
+                san_pham._prefetched_objects_cache = {}
+            
+            # Ghi sự kiện cập nhật sản phẩm vào outbox cùng transaction
+            san_pham_data = SanPhamSerializer(san_pham, context={'request': request}).data
+            publish_product_event('updated', san_pham_data)
         
         return Response(san_pham_data)
     
@@ -101,9 +277,10 @@ class SanPhamViewSet(viewsets.ModelViewSet):
             if os.path.isfile(instance.HinhAnh.path):
                 os.remove(instance.HinhAnh.path)
         
-        self.perform_destroy(instance)
-        
-        # Publish sự kiện xóa sản phẩm
-        publish_product_event('deleted', san_pham_data)
+        with transaction.atomic():
+            self.perform_destroy(instance)
+            
+            # Ghi sự kiện xóa sản phẩm vào outbox cùng transaction
+            publish_product_event('deleted', san_pham_data)
         
         return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file